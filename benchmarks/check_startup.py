@@ -0,0 +1,114 @@
+"""
+GLM 节点启动耗时检查。
+
+在全新的 Python 进程中导入 glm.py 并调用所有节点的 INPUT_TYPES，测量：
+- 模块导入耗时（ComfyUI 每次启动都会付出）
+- 首次 / 再次调用 INPUT_TYPES 的耗时（刷新节点列表时付出）
+- 导入后是否已加载 zhipuai / PIL / numpy 等重量级依赖（应在首次使用时才加载）
+
+任一指标超出预算时以非零状态码退出。tests/test_startup.py 复用这里的测量逻辑，由 pytest（CI）强制检查同样的预算。
+
+用法：
+    python benchmarks/check_startup.py
+    python benchmarks/check_startup.py --runs 9 --import-budget 0.3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# 启动预算（秒），取多次运行的中位数比较
+IMPORT_BUDGET_SECONDS = 0.25
+INPUT_TYPES_BUDGET_SECONDS = 0.05
+# 导入 glm.py 后不应出现在 sys.modules 中的模块
+DEFERRED_MODULES = ("zhipuai", "PIL", "numpy", "httpx")
+
+_PROBE = r"""
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import glm
+import_seconds = time.perf_counter() - start
+
+start = time.perf_counter()
+for node_class in glm.NODE_CLASS_MAPPINGS.values():
+    node_class.INPUT_TYPES()
+input_types_cold = time.perf_counter() - start
+
+start = time.perf_counter()
+for node_class in glm.NODE_CLASS_MAPPINGS.values():
+    node_class.INPUT_TYPES()
+input_types_warm = time.perf_counter() - start
+
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "input_types_cold_seconds": input_types_cold,
+    "input_types_warm_seconds": input_types_warm,
+    "loaded_modules": [name for name in json.loads(sys.argv[2]) if name in sys.modules],
+}))
+"""
+
+
+def probe_once():
+    """在子进程中测量一次，返回测量结果字典。"""
+    env = dict(os.environ)
+    env.setdefault("GLM_NODES_LOG_LEVEL", "ERROR")
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE, REPO_DIR, json.dumps(DEFERRED_MODULES)],
+        check=True, capture_output=True, text=True, env=env,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_startup(runs=5):
+    """运行 runs 次，返回各项耗时的中位数和最大值，以及导入后已加载的重量级模块。"""
+    samples = [probe_once() for _ in range(max(1, runs))]
+    result = {"runs": len(samples)}
+    for name in ("import_seconds", "input_types_cold_seconds", "input_types_warm_seconds"):
+        values = [sample[name] for sample in samples]
+        result[name] = statistics.median(values)
+        result[name.replace("_seconds", "_max_seconds")] = max(values)
+    result["loaded_modules"] = sorted({name for sample in samples for name in sample["loaded_modules"]})
+    return result
+
+
+def check_budget(result, import_budget=IMPORT_BUDGET_SECONDS, input_types_budget=INPUT_TYPES_BUDGET_SECONDS):
+    """返回违反预算的说明列表，为空表示通过。"""
+    problems = []
+    if result["import_seconds"] > import_budget:
+        problems.append(f"导入耗时 {result['import_seconds'] * 1000:.1f}ms 超出预算 {import_budget * 1000:.0f}ms")
+    if result["input_types_cold_seconds"] > input_types_budget:
+        problems.append(f"首次 INPUT_TYPES 耗时 {result['input_types_cold_seconds'] * 1000:.1f}ms "
+                        f"超出预算 {input_types_budget * 1000:.0f}ms")
+    if result["loaded_modules"]:
+        problems.append(f"导入时加载了应延迟加载的模块: {', '.join(result['loaded_modules'])}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查 GLM 节点的启动耗时预算")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数（取中位数）")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_SECONDS, help="导入耗时预算（秒）")
+    parser.add_argument("--input-types-budget", type=float, default=INPUT_TYPES_BUDGET_SECONDS,
+                        help="首次 INPUT_TYPES 耗时预算（秒）")
+    args = parser.parse_args()
+
+    result = measure_startup(args.runs)
+    print(f"导入耗时            {result['import_seconds'] * 1000:8.1f} ms（最大 {result['import_max_seconds'] * 1000:.1f} ms）")
+    print(f"首次 INPUT_TYPES    {result['input_types_cold_seconds'] * 1000:8.1f} ms")
+    print(f"再次 INPUT_TYPES    {result['input_types_warm_seconds'] * 1000:8.1f} ms")
+    problems = check_budget(result, args.import_budget, args.input_types_budget)
+    for problem in problems:
+        print(f"未通过：{problem}")
+    if not problems:
+        print("启动耗时检查通过。")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
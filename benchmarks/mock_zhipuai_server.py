@@ -0,0 +1,389 @@
+"""
+本地模拟的智谱AI对话补全接口，用于离线基准测试。
+
+实现 POST {base_url}/chat/completions（普通响应和 SSE 流式响应），
+支持配置响应延迟、长尾慢请求、流式分块间隔以及按比例注入 429 / 500 错误。
+另外实现离线批处理用到的文件上传 / 下载（/files）和 Batch API（/batches），
+批处理任务创建 batch_delay 秒后在下一次查询时完成，按 server_error_ratio 注入失败的请求。
+不需要网络和 API Key，节点通过环境变量 ZHIPUAI_BASE_URL 指向该服务即可。
+
+也可以单独运行：
+    python benchmarks/mock_zhipuai_server.py --port 8765 --latency 0.2
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockSettings:
+    """模拟服务的行为参数，运行中可以直接修改。"""
+
+    def __init__(self, latency=0.05, jitter=0.0, stream_chunk_delay=0.005, rate_limit_ratio=0.0,
+                 server_error_ratio=0.0, retry_after=0.05, response_text=None, tail_ratio=0.0, tail_latency=1.0,
+                 batch_delay=0.0):
+        self.latency = latency                        # 每个请求的基础延迟（秒）
+        self.jitter = jitter                          # 额外随机延迟上限（秒）
+        self.tail_ratio = tail_ratio                  # 额外延迟 tail_latency 秒的慢请求比例（模拟长尾）
+        self.tail_latency = tail_latency              # 慢请求的额外延迟（秒）
+        self.stream_chunk_delay = stream_chunk_delay  # 流式响应每个分块之间的间隔（秒）
+        self.rate_limit_ratio = rate_limit_ratio      # 返回 429 的请求比例
+        self.server_error_ratio = server_error_ratio  # 返回 500 的请求比例
+        self.retry_after = retry_after                # 429 响应中的 Retry-After（秒）
+        self.response_text = response_text            # 固定的响应文本，None 时回显用户消息摘要
+        self.batch_delay = batch_delay                # 批处理任务从创建到完成的时间（秒）
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.request_bytes = 0
+        self.batches = 0
+        self.batch_requests = 0
+
+    def add(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        with self._lock:
+            return {"requests": self.requests, "rate_limited": self.rate_limited,
+                    "server_errors": self.server_errors, "request_bytes": self.request_bytes,
+                    "batches": self.batches, "batch_requests": self.batch_requests}
+
+
+def _reply_text(settings, payload):
+    if settings.response_text is not None:
+        return settings.response_text
+    messages = payload.get("messages") or [{}]
+    content = messages[-1].get("content", "")
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    # 批量翻译请求按标签原样回显，保证能被解析
+    if '<s id="' in content:
+        return content
+    # 拼图识图请求按提示词中列出的编号逐格回复
+    frame_ids = re.findall(r'<frame id="(\d+)">', content)
+    if frame_ids:
+        return "\n".join(f'<frame id="{n}">mock caption for tile {n}</frame>' for n in frame_ids)
+    return f"mock response for: {content[:200]}"
+
+
+def _usage(payload, text):
+    prompt_chars = sum(len(json.dumps(m.get("content", ""), ensure_ascii=False)) for m in payload.get("messages", []))
+    prompt_tokens = max(1, prompt_chars // 4)
+    completion_tokens = max(1, len(text) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _completion_body(payload, text):
+    return {
+        "id": uuid.uuid4().hex,
+        "created": int(time.time()),
+        "model": payload.get("model", "mock"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        "usage": _usage(payload, text),
+    }
+
+
+class MockBatchStore:
+    """模拟的文件和批处理任务存储。"""
+
+    def __init__(self, settings, stats, rng):
+        self.settings = settings
+        self.stats = stats
+        self.rng = rng
+        self._lock = threading.Lock()
+        self.files = {}    # file_id -> {"data", "filename", "purpose", "created_at"}
+        self.batches = {}  # batch_id -> 批处理任务对象
+
+    def add_file(self, data, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        with self._lock:
+            self.files[file_id] = {"data": data, "filename": filename, "purpose": purpose, "created_at": created}
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": created,
+                "filename": filename, "purpose": purpose}
+
+    def get_file(self, file_id):
+        with self._lock:
+            entry = self.files.get(file_id)
+        return entry["data"] if entry else None
+
+    def create_batch(self, params):
+        with self._lock:
+            if params.get("input_file_id") not in self.files:
+                return None
+            batch_id = f"batch_{uuid.uuid4().hex[:16]}"
+            now = int(time.time())
+            batch = {
+                "id": batch_id, "object": "batch", "endpoint": params.get("endpoint", ""),
+                "input_file_id": params["input_file_id"], "completion_window": params.get("completion_window") or "24h",
+                "status": "in_progress", "created_at": now, "in_progress_at": now, "metadata": params.get("metadata"),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                "_ready_at": time.monotonic() + self.settings.batch_delay,
+            }
+            self.batches[batch_id] = batch
+        self.stats.add("batches")
+        return self._public(batch)
+
+    def retrieve(self, batch_id):
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            if batch["status"] == "in_progress" and time.monotonic() >= batch["_ready_at"]:
+                self._complete_locked(batch)
+            return self._public(batch)
+
+    def cancel(self, batch_id):
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            if batch["status"] == "in_progress":
+                batch["status"] = "cancelled"
+                batch["cancelled_at"] = int(time.time())
+            return self._public(batch)
+
+    def _complete_locked(self, batch):
+        outputs, errors = [], []
+        lines = self.files[batch["input_file_id"]]["data"].decode("utf-8").splitlines()
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            payload = request.get("body") or {}
+            record = {"custom_id": request.get("custom_id"), "id": f"batch_req_{uuid.uuid4().hex[:16]}"}
+            if self.rng.random() < self.settings.server_error_ratio:
+                record["response"] = {"status_code": 500, "body": {"error": {"code": "500", "message": "mock server error"}}}
+                errors.append(record)
+            else:
+                body = _completion_body(payload, _reply_text(self.settings, payload))
+                body["request_id"] = request.get("custom_id")
+                record["response"] = {"status_code": 200, "body": body}
+                outputs.append(record)
+        self.stats.add("batch_requests", len(outputs) + len(errors))
+        for name, records in (("output_file_id", outputs), ("error_file_id", errors)):
+            if records:
+                data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+                file_id = f"file-{uuid.uuid4().hex[:16]}"
+                self.files[file_id] = {"data": data, "filename": f"{batch['id']}.jsonl", "purpose": "batch",
+                                       "created_at": int(time.time())}
+                batch[name] = file_id
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+
+    @staticmethod
+    def _public(batch):
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已超时断开
+            pass
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"code": "404", "message": "not found"}})
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        batches = self.server.batches
+        match = re.search(r"/batches/([^/]+)$", path)
+        if match:
+            batch = batches.retrieve(match.group(1))
+            return self._send_json(200, batch) if batch else self._not_found()
+        match = re.search(r"/files/([^/]+)/content$", path)
+        if match:
+            data = batches.get_file(match.group(1))
+            if data is None:
+                return self._not_found()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._not_found()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        path = self.path.split("?")[0].rstrip("/")
+        batches = self.server.batches
+        if path.endswith("/chat/completions"):
+            self._chat_completions(raw)
+        elif path.endswith("/files"):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode("latin-1") + raw)
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            if "file" not in fields:
+                self._send_json(400, {"error": {"code": "400", "message": "file is required"}})
+                return
+            purpose = fields["purpose"].get_content().strip() if "purpose" in fields else ""
+            self._send_json(200, batches.add_file(fields["file"].get_payload(decode=True),
+                                                  fields["file"].get_filename() or "upload.jsonl", purpose))
+        elif path.endswith("/batches"):
+            batch = batches.create_batch(json.loads(raw or b"{}"))
+            if batch is None:
+                self._send_json(400, {"error": {"code": "400", "message": "input file not found"}})
+            else:
+                self._send_json(200, batch)
+        elif re.search(r"/batches/[^/]+/cancel$", path):
+            batch = batches.cancel(path.split("/")[-2])
+            return self._send_json(200, batch) if batch else self._not_found()
+        else:
+            self._not_found()
+
+    def _chat_completions(self, raw):
+        settings = self.server.settings
+        stats = self.server.stats
+        stats.add("requests")
+        stats.add("request_bytes", len(raw))
+
+        payload = json.loads(raw or b"{}")
+        rng = self.server.rng
+        roll = rng.random()
+        if roll < settings.rate_limit_ratio:
+            stats.add("rate_limited")
+            self._send_json(429, {"error": {"code": "1302", "message": "mock rate limit"}},
+                            {"Retry-After": str(settings.retry_after)})
+            return
+        if roll < settings.rate_limit_ratio + settings.server_error_ratio:
+            stats.add("server_errors")
+            self._send_json(500, {"error": {"code": "500", "message": "mock server error"}})
+            return
+
+        delay = settings.latency + rng.uniform(0, settings.jitter)
+        if rng.random() < settings.tail_ratio:
+            delay += settings.tail_latency
+        time.sleep(delay)
+        text = _reply_text(settings, payload)
+        if not payload.get("stream"):
+            self._send_json(200, _completion_body(payload, text))
+            return
+
+        completion_id = uuid.uuid4().hex
+        created = int(time.time())
+        model = payload.get("model", "mock")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(data):
+            event = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(event):X}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            pieces = [text[i:i + 8] for i in range(0, len(text), 8)] or [""]
+            for index, piece in enumerate(pieces):
+                chunk = {"id": completion_id, "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece},
+                                      "finish_reason": "stop" if index == len(pieces) - 1 else None}]}
+                if index == len(pieces) - 1:
+                    chunk["usage"] = _usage(payload, text)
+                write_event(json.dumps(chunk, ensure_ascii=False))
+                if settings.stream_chunk_delay:
+                    time.sleep(settings.stream_chunk_delay)
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前结束流式接收（例如 stop_string）
+            pass
+
+
+class MockZhipuAIServer:
+    """在后台线程中运行的模拟服务，可作为上下文管理器使用。"""
+
+    def __init__(self, host="127.0.0.1", port=0, settings=None):
+        self.settings = settings or MockSettings()
+        self.stats = MockStats()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.settings = self.settings
+        self._httpd.stats = self.stats
+        # 独立的随机数生成器：节点会用 seed 重置全局 random，不能影响模拟服务的错误注入和延迟
+        self._httpd.rng = random.Random()
+        self._httpd.batches = MockBatchStore(self.settings, self.stats, random.Random())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/paas/v4"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock_zhipuai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的智谱AI对话补全接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求的基础延迟（秒）")
+    parser.add_argument("--tail-ratio", type=float, default=0.0, help="额外延迟 --tail-latency 秒的慢请求比例")
+    parser.add_argument("--tail-latency", type=float, default=1.0, help="慢请求的额外延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外随机延迟上限（秒）")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="返回 429 的请求比例")
+    parser.add_argument("--server-error-ratio", type=float, default=0.0, help="返回 500 的请求比例")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="批处理任务从创建到完成的时间（秒）")
+    args = parser.parse_args()
+
+    settings = MockSettings(latency=args.latency, jitter=args.jitter, rate_limit_ratio=args.rate_limit_ratio,
+                            server_error_ratio=args.server_error_ratio, tail_ratio=args.tail_ratio,
+                            tail_latency=args.tail_latency, batch_delay=args.batch_delay)
+    server = MockZhipuAIServer(args.host, args.port, settings)
+    print(f"模拟服务已启动：ZHIPUAI_BASE_URL={server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
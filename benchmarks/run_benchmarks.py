@@ -0,0 +1,580 @@
+"""
+GLM 节点离线基准测试。
+
+在本地模拟服务（mock_zhipuai_server.py）上驱动 GLM_Text_Chat、GLM_Vision_ImageToPrompt、
+GLM_Translation_Text 等节点，测量节点自身（预设解析、图片转换编码、消息构建、客户端获取、
+限流重试层）的开销，报告吞吐量、延迟分位数和峰值内存，无需网络和 API Key。
+
+用法：
+    python benchmarks/run_benchmarks.py                  # 运行全部场景
+    python benchmarks/run_benchmarks.py --quick          # 缩小规模，快速检查
+    python benchmarks/run_benchmarks.py --only text_chat_concurrency image_encode
+    python benchmarks/run_benchmarks.py --json bench_output.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+os.environ.setdefault("GLM_NODES_LOG_LEVEL", "ERROR")
+
+from check_startup import check_budget, measure_startup  # noqa: E402
+from mock_zhipuai_server import MockSettings, MockZhipuAIServer  # noqa: E402
+
+BENCH_API_KEY = "bench-api-key"
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def measure(name, operation, iterations, concurrency=1, **extra):
+    """
+    以 concurrency 个线程共执行 operation 共 iterations 次，
+    返回吞吐量、延迟分位数（毫秒）和 Python 峰值内存（MB）。
+    operation 接收操作序号，返回 False 表示该次操作失败。
+    """
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    next_index = [0]
+
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                if index >= iterations:
+                    return
+                next_index[0] += 1
+            start = time.perf_counter()
+            ok = operation(index)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if ok is False:
+                    failures[0] += 1
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    result = {
+        "scenario": name,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "failures": failures[0],
+        "wall_seconds": wall,
+        "throughput_per_second": iterations / wall if wall > 0 else None,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "peak_memory_mb": peak / (1024 * 1024),
+    }
+    result.update(extra)
+    return result
+
+
+def _write_preset_file(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(f"[预设 {i}]\n")
+            f.write("你是一个专业的提示词助手。请根据用户输入生成详细、具体、富有画面感的描述。\n" * 3)
+            f.write("\n")
+
+
+def _make_image_batch(np, batch, size):
+    rng = np.random.default_rng(0)
+    return rng.random((batch, size, size, 3), dtype=np.float32)
+
+
+# --- 场景 ---
+
+def bench_preset_parsing(glm, args, ctx):
+    results = []
+    path = os.path.join(ctx["tmp_dir"], "bench_prompts.txt")
+    _write_preset_file(path, args.presets)
+    results.append(measure("preset_parse_uncached", lambda i: bool(glm.load_prompts_from_txt(path, {})),
+                           args.preset_iterations, presets=args.presets))
+    store = glm.PromptPresetStore([path], revalidate_interval=0)
+    store.get_prompts({})
+    results.append(measure("preset_store_revalidate", lambda i: bool(store.get_prompts({})),
+                           args.preset_iterations * 50, presets=args.presets))
+    store_throttled = glm.PromptPresetStore([path])
+    store_throttled.get_prompts({})
+    results.append(measure("preset_store_cached", lambda i: bool(store_throttled.get_prompts({})),
+                           args.preset_iterations * 500, presets=args.presets))
+    return results
+
+
+def bench_image_encode(glm, args, ctx):
+    import numpy as np
+    images = _make_image_batch(np, args.batch, args.image_size)
+    results = []
+    for image_format in ("JPEG", "WEBP", "PNG"):
+        sizes = []
+
+        def encode(i, image_format=image_format):
+            encoded = glm.encode_image_frame(images, i % args.batch, image_format=image_format)
+            sizes.append(encoded["payload_bytes"])
+
+        result = measure(f"image_encode_{image_format.lower()}", encode, args.batch,
+                         image_size=args.image_size)
+        result["avg_payload_kb"] = sum(sizes) / len(sizes) / 1024
+        results.append(result)
+    return results
+
+
+def bench_image_ingest(glm, args, ctx):
+    import base64
+    import io
+
+    import numpy as np
+    from PIL import Image
+    pixels = (_make_image_batch(np, 1, args.image_size)[0] * 255).astype(np.uint8)
+    results = []
+    for image_format in ("PNG", "JPEG"):
+        buffered = io.BytesIO()
+        Image.fromarray(pixels).save(buffered, format=image_format)
+        encoded = base64.b64encode(buffered.getvalue()).decode("ascii")
+        results.append(measure(f"image_ingest_base64_{image_format.lower()}",
+                               lambda i, encoded=encoded: glm.ingest_image_source(encoded, max_bytes=0)["format"] != "",
+                               args.iterations, payload_kb=len(encoded) * 3 / 4 / 1024))
+    return results
+
+
+def bench_message_build(glm, args, ctx):
+    preset = list(glm.GLM_Text_Chat.get_text_prompts().keys())[0]
+    text_result = measure(
+        "message_build_text",
+        lambda i: glm.GLM_Text_Chat.build_messages(f"一只小狗在草地上玩耍 {i}", "", preset, verbose=False) is not None,
+        args.iterations * 20)
+    translate_result = measure(
+        "message_build_translation",
+        lambda i: bool(glm.GLM_Translation_Text.build_messages(f"你好，世界 {i}", "zh", "en")),
+        args.iterations * 20)
+    return [text_result, translate_result]
+
+
+def bench_client_setup(glm, args, ctx):
+    from zhipuai import ZhipuAI
+    base_url = ctx["server"].base_url
+
+    def fresh(i):
+        client = ZhipuAI(api_key=BENCH_API_KEY, base_url=base_url)
+        client.close()
+
+    def pooled(i):
+        with glm.zhipuai_client(BENCH_API_KEY):
+            pass
+
+    return [
+        measure("client_setup_fresh", fresh, args.iterations),
+        measure("client_setup_pooled", pooled, args.iterations * 20),
+    ]
+
+
+def bench_text_chat(glm, args, ctx):
+    node = glm.GLM_Text_Chat()
+    preset = list(node.get_text_prompts().keys())[0]
+
+    def call(i, stream=False):
+        result = node.glm_chat_function(
+            text_input=f"一只小狗在草地上玩耍 {i}", api_key=BENCH_API_KEY, model_name="mock-glm",
+            temperature=0.9, top_p=0.7, max_tokens=1024, seed=1,
+            system_prompt_override="", text_system_prompt_preset=preset, stream=stream, semantic_cache=False)
+        return result[0].startswith("mock response")
+
+    return [
+        measure("text_chat_concurrency", call, args.iterations, args.concurrency,
+                mock_latency_ms=ctx["settings"].latency * 1000),
+        measure("text_chat_stream", lambda i: call(i, stream=True), max(1, args.iterations // 2), args.concurrency),
+    ]
+
+
+def bench_coalescing(glm, args, ctx):
+    # 所有线程发送同一个请求：同时进行的相同请求应被合并为一次 API 调用
+    node = glm.GLM_Text_Chat()
+    preset = list(node.get_text_prompts().keys())[0]
+    before = ctx["server"].stats.as_dict()["requests"]
+
+    def call(i):
+        result = node.glm_chat_function(
+            text_input="一只小狗在草地上玩耍", api_key=BENCH_API_KEY, model_name="mock-glm",
+            temperature=0.9, top_p=0.7, max_tokens=1024, seed=1,
+            system_prompt_override="", text_system_prompt_preset=preset, semantic_cache=False)
+        return result[0].startswith("mock response")
+
+    result = measure("identical_requests_coalesced", call, args.iterations, args.concurrency)
+    result["server_requests"] = ctx["server"].stats.as_dict()["requests"] - before
+    return [result]
+
+
+def bench_hedging(glm, args, ctx):
+    # 模拟长尾：一部分请求额外慢 10 倍，比较不对冲与对冲时的尾延迟。
+    # 并发较低，避免客户端排队本身抬高延迟；对冲延迟取不对冲时 p50 的 2 倍
+    settings = ctx["settings"]
+    node = glm.GLM_Text_Chat()
+    preset = list(node.get_text_prompts().keys())[0]
+    concurrency = min(4, args.concurrency)
+    saved = (settings.tail_ratio, settings.tail_latency)
+    settings.tail_ratio, settings.tail_latency = args.tail_ratio, args.latency * 10
+
+    def call_with(hedge):
+        def call(i):
+            result = node.glm_chat_function(
+                text_input=f"对冲请求 {hedge} {i}", api_key=BENCH_API_KEY, model_name="mock-glm",
+                temperature=0.9, top_p=0.7, max_tokens=256, seed=1,
+                system_prompt_override="", text_system_prompt_preset=preset,
+                hedge_delay=hedge, fallback_model="mock-glm-fallback" if hedge else "")
+            return result[0].startswith("mock response")
+        return call
+
+    try:
+        baseline = measure("tail_latency_no_hedge", call_with(0.0), args.iterations, concurrency,
+                           tail_ratio=args.tail_ratio)
+        hedge_delay = round(baseline["p50_ms"] * 2 / 1000, 3)
+        before = glm.get_hedge_stats()["hedged"]
+        hedged = measure("tail_latency_hedged", call_with(hedge_delay), args.iterations, concurrency,
+                         tail_ratio=args.tail_ratio, hedge_delay=hedge_delay)
+        hedged["hedged_requests"] = glm.get_hedge_stats()["hedged"] - before
+    finally:
+        settings.tail_ratio, settings.tail_latency = saved
+    return [baseline, hedged]
+
+
+def bench_semantic_cache(glm, args, ctx):
+    # 每个基础输入依次出现大小写、标点和空白不同的变体，首次出现时调用 API，之后应命中近似请求缓存
+    node = glm.GLM_Text_Chat()
+    preset = list(node.get_text_prompts().keys())[0]
+    subjects = ["cat", "dog", "fox", "owl", "bear", "deer", "wolf", "crow", "duck", "frog"]
+    places = ["forest", "beach", "city", "desert", "garden"]
+    bases = [f"a {subject} walking through the {place} at night" for place in places for subject in subjects]
+    variants = (
+        lambda text: text,
+        lambda text: text.upper() + ".",
+        lambda text: "  " + text.replace(" ", ",  ") + "!",
+        lambda text: text.title().replace(" ", "\t"),
+    )
+    # 近似请求缓存需要同时开启 use_cache；响应缓存换成临时目录，避免上一次运行的结果直接命中
+    saved_cache = glm._RESPONSE_CACHE
+    glm._RESPONSE_CACHE = glm.ResponseCache(os.path.join(ctx["tmp_dir"], "semantic_response_cache"))
+    before_requests = ctx["server"].stats.as_dict()["requests"]
+    before_stats = glm.get_semantic_cache_stats()
+
+    def call(i):
+        base = bases[(i // len(variants)) % len(bases)]
+        result = node.glm_chat_function(
+            text_input=variants[i % len(variants)](base), api_key=BENCH_API_KEY, model_name="mock-glm-semantic",
+            temperature=0.9, top_p=0.7, max_tokens=256, seed=1, use_cache=True,
+            system_prompt_override="", text_system_prompt_preset=preset, semantic_cache=True)
+        return result[0].startswith("mock response")
+
+    # 按顺序执行，保证每个基础输入的首次请求先于其变体完成
+    try:
+        result = measure("semantic_cache_variants", call, args.iterations, 1)
+    finally:
+        glm._RESPONSE_CACHE = saved_cache
+    after_stats = glm.get_semantic_cache_stats()
+    result["server_requests"] = ctx["server"].stats.as_dict()["requests"] - before_requests
+    result["semantic_hits"] = after_stats["hits"] - before_stats["hits"]
+    lookups = result["semantic_hits"] + after_stats["misses"] - before_stats["misses"]
+    result["semantic_hit_rate"] = result["semantic_hits"] / lookups if lookups else 0.0
+
+    queries = [variants[i % len(variants)](bases[i % len(bases)]) for i in range(args.iterations)]
+    embed = measure("semantic_embed_lookup",
+                    lambda i: glm._SEMANTIC_CACHE.lookup("bench", glm.embed_text(queries[i]),
+                                                        glm.semantic_signature(queries[i]), 0.99) is None,
+                    args.iterations, 1)
+    return [result, embed]
+
+
+def bench_batch_pipeline(glm, args, ctx):
+    # 离线批处理：构建请求文件 → 上传并创建任务 → 轮询 → 导入结果，然后节点从结果存储读取
+    store = glm.BatchResultStore(os.path.join(ctx["tmp_dir"], "batch_results.jsonl"))
+    manager = glm.BatchJobManager(os.path.join(ctx["tmp_dir"], "batch_jobs"), store)
+    texts = [f"批处理第 {i} 段文本。" for i in range(args.batch_requests)]
+
+    def pipeline(i):
+        requests = glm.build_translation_batch_requests([f"{text} #{i}" for text in texts], model_name="mock-glm")
+        job = manager.create_job(requests, description=f"bench {i}")
+        manager.submit(job["id"], BENCH_API_KEY)
+        job = manager.wait(job["id"], BENCH_API_KEY, poll_interval=0.01)
+        return job["ingested"] == len(texts)
+
+    saved_store, glm._BATCH_RESULTS = glm._BATCH_RESULTS, store
+    node = glm.GLM_Translation_Text()
+    before = ctx["server"].stats.as_dict()["requests"]
+
+    def lookup(i):
+        result = node.glm_translate_function(
+            text_input=f"{texts[i % len(texts)]} #0", from_language="zh", to_language="en", api_key=BENCH_API_KEY,
+            model_name="mock-glm", temperature=0.1, top_p=0.7, max_tokens=1024, seed=1, use_batch_results=True)
+        return result[0].startswith("mock response")
+
+    try:
+        built = measure("batch_job_roundtrip", pipeline, max(1, args.iterations // 40), 1, requests=args.batch_requests)
+        read = measure("batch_result_lookup", lookup, args.iterations, args.concurrency)
+    finally:
+        glm._BATCH_RESULTS = saved_store
+    read["server_requests"] = ctx["server"].stats.as_dict()["requests"] - before
+    return [built, read]
+
+
+def bench_translation(glm, args, ctx):
+    node = glm.GLM_Translation_Text()
+    batch_node = glm.GLM_Translation_Batch()
+
+    def single(i):
+        result = node.glm_translate_function(
+            text_input=f"你好，世界！第 {i} 行。", from_language="zh", to_language="en", api_key=BENCH_API_KEY,
+            model_name="mock-glm", temperature=0.1, top_p=0.7, max_tokens=1024, seed=1)
+        return result[0].startswith("mock response")
+
+    lines = "\n".join(f"第 {i} 行待翻译文本。" for i in range(args.translation_lines))
+
+    def batch(i):
+        result = batch_node.glm_batch_translate_function(
+            text_input=[lines], from_language=["zh"], to_language=["en"], api_key=[BENCH_API_KEY],
+            model_name=["mock-glm"], temperature=[0.1], top_p=[0.7], max_tokens=[4096],
+            max_concurrency=[args.concurrency])
+        return len(result[1]) == args.translation_lines
+
+    return [
+        measure("translation_single", single, args.iterations, args.concurrency),
+        measure("translation_batch", batch, max(1, args.iterations // 20), 1, lines=args.translation_lines),
+    ]
+
+
+def bench_translation_memory(glm, args, ctx):
+    # 长文本每次只修改一句后重新翻译：开启翻译记忆时只发送修改过的句子
+    node = glm.GLM_Translation_Text()
+    sentences = [f"这是第 {i} 句需要翻译的提示词内容。" for i in range(args.translation_lines)]
+    saved_memory = glm._TRANSLATION_MEMORY
+    glm._TRANSLATION_MEMORY = glm.TranslationMemory(os.path.join(ctx["tmp_dir"], "translation_memory.jsonl"))
+
+    def translate(text, memory):
+        result = node.glm_translate_function(
+            text_input=text, from_language="zh", to_language="en", api_key=BENCH_API_KEY,
+            model_name="mock-glm", temperature=0.1, top_p=0.7, max_tokens=4096, seed=1,
+            max_concurrency=args.concurrency, semantic_cache=False, translation_memory=memory)
+        return not result[0].startswith("GLM API 翻译调用失败")
+
+    def call_with(memory):
+        def call(i):
+            edited = list(sentences)
+            edited[i % len(edited)] = f"这是被修改过的第 {i} 句{'（记忆）' if memory else ''}。"
+            return translate("".join(edited), memory)
+        return call
+
+    iterations = max(1, args.iterations // 10)
+    results = []
+    try:
+        translate("".join(sentences), True)  # 预热：原文的各句先进入翻译记忆
+        for name, memory in (("edit_retranslate_full", False), ("edit_retranslate_memory", True)):
+            before = ctx["server"].stats.as_dict()
+            result = measure(name, call_with(memory), iterations, 1, sentences=len(sentences))
+            after = ctx["server"].stats.as_dict()
+            result["server_requests"] = after["requests"] - before["requests"]
+            result["request_bytes"] = after["request_bytes"] - before["request_bytes"]
+            results.append(result)
+        results[-1]["translation_memory"] = glm.get_translation_memory_stats()
+    finally:
+        glm._TRANSLATION_MEMORY = saved_memory
+    return results
+
+
+def bench_vision_batch(glm, args, ctx):
+    import numpy as np
+    node = glm.GLM_Vision_ImageToPrompt()
+    preset = list(node.get_image_prompts().keys())[0]
+    images = _make_image_batch(np, args.batch, args.image_size)
+
+    def call(i, batch_mode, contact_sheet=False):
+        result = node.generate_prompt(
+            api_key=BENCH_API_KEY, prompt_override="", model_name="mock-glm-4v", seed=1,
+            image_prompt_preset=preset, image_input=images, batch_mode=batch_mode, max_concurrency=args.concurrency,
+            contact_sheet=contact_sheet)
+        return not result[0].startswith("GLM-4V API 调用失败")
+
+    def measure_requests(name, operation, iterations, **extra):
+        before = ctx["server"].stats.as_dict()
+        result = measure(name, operation, iterations, 1, **extra)
+        after = ctx["server"].stats.as_dict()
+        result["server_requests"] = after["requests"] - before["requests"]
+        result["request_bytes"] = after["request_bytes"] - before["request_bytes"]
+        return result
+
+    return [
+        measure("vision_single_frame", lambda i: call(i, False), max(1, args.iterations // 10), 1,
+                image_size=args.image_size),
+        measure_requests("vision_batch", lambda i: call(i, True), max(1, args.iterations // 50),
+                         batch=args.batch, image_size=args.image_size),
+        measure_requests("vision_contact_sheet", lambda i: call(i, True, contact_sheet=True),
+                         max(1, args.iterations // 50), batch=args.batch, image_size=args.image_size),
+    ]
+
+
+def bench_error_injection(glm, args, ctx):
+    settings = ctx["settings"]
+    node = glm.GLM_Text_Chat()
+    preset = list(node.get_text_prompts().keys())[0]
+    saved = (settings.rate_limit_ratio, settings.server_error_ratio)
+    settings.rate_limit_ratio, settings.server_error_ratio = args.error_rate * 0.75, args.error_rate * 0.25
+    before = ctx["server"].stats.as_dict()
+
+    def call(i):
+        result = node.glm_chat_function(
+            text_input=f"错误注入 {i}", api_key=BENCH_API_KEY, model_name="mock-glm",
+            temperature=0.9, top_p=0.7, max_tokens=256, seed=1,
+            system_prompt_override="", text_system_prompt_preset=preset)
+        return result[0].startswith("mock response")
+
+    try:
+        result = measure("error_injection", call, args.iterations, args.concurrency, error_rate=args.error_rate)
+    finally:
+        settings.rate_limit_ratio, settings.server_error_ratio = saved
+    after = ctx["server"].stats.as_dict()
+    result["server_requests"] = after["requests"] - before["requests"]
+    result["injected_errors"] = (after["rate_limited"] - before["rate_limited"]
+                                 + after["server_errors"] - before["server_errors"])
+    return [result]
+
+
+def bench_startup(glm, args, ctx):
+    # 在全新的子进程中测量，当前进程已导入 glm，不能代表冷启动
+    startup = measure_startup(args.startup_runs)
+    problems = check_budget(startup)
+    results = []
+    for name in ("import", "input_types_cold", "input_types_warm"):
+        median_ms = startup[f"{name}_seconds"] * 1000
+        max_ms = startup[f"{name}_max_seconds"] * 1000
+        results.append({
+            "scenario": f"startup_{name}", "iterations": startup["runs"], "concurrency": 1,
+            "failures": len(problems) if name == "import" else 0, "wall_seconds": None,
+            "throughput_per_second": None, "p50_ms": median_ms, "p95_ms": max_ms, "p99_ms": max_ms,
+            "peak_memory_mb": None,
+        })
+    results[0]["budget_problems"] = problems
+    results[0]["loaded_modules"] = startup["loaded_modules"]
+    return results
+
+
+SCENARIOS = {
+    "startup": bench_startup,
+    "preset_parsing": bench_preset_parsing,
+    "image_encode": bench_image_encode,
+    "image_ingest": bench_image_ingest,
+    "message_build": bench_message_build,
+    "client_setup": bench_client_setup,
+    "text_chat": bench_text_chat,
+    "coalescing": bench_coalescing,
+    "hedging": bench_hedging,
+    "semantic_cache": bench_semantic_cache,
+    "batch_pipeline": bench_batch_pipeline,
+    "translation": bench_translation,
+    "translation_memory": bench_translation_memory,
+    "vision_batch": bench_vision_batch,
+    "error_injection": bench_error_injection,
+}
+
+
+def _format_row(result):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else format("-", spec.split(".")[0])
+    return (f"{result['scenario']:<28}{result['iterations']:>7}{result['concurrency']:>5}"
+            f"{fmt(result['throughput_per_second'], '>12.1f')}{fmt(result['p50_ms'], '>10.2f')}"
+            f"{fmt(result['p95_ms'], '>10.2f')}{fmt(result['p99_ms'], '>10.2f')}"
+            f"{fmt(result['peak_memory_mb'], '>10.1f')}{result['failures']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GLM 节点离线基准测试（本地模拟接口）")
+    parser.add_argument("--only", nargs="*", choices=sorted(SCENARIOS), help="只运行指定场景")
+    parser.add_argument("--quick", action="store_true", help="缩小规模，快速检查")
+    parser.add_argument("--iterations", type=int, default=200, help="每个场景的基础操作次数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发线程数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟接口的响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="模拟接口的额外随机延迟上限（秒）")
+    parser.add_argument("--tail-ratio", type=float, default=0.05, help="hedging 场景中慢请求（延迟 10 倍）的比例")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="error_injection 场景注入的错误比例")
+    parser.add_argument("--presets", type=int, default=5000, help="大型预设文件中的预设数量")
+    parser.add_argument("--preset-iterations", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=16, help="IMAGE 批次大小")
+    parser.add_argument("--image-size", type=int, default=1024, help="IMAGE 边长（像素）")
+    parser.add_argument("--translation-lines", type=int, default=200, help="批量翻译场景的行数")
+    parser.add_argument("--batch-requests", type=int, default=500, help="batch_pipeline 场景每个批处理任务的请求数")
+    parser.add_argument("--startup-runs", type=int, default=5, help="startup 场景的子进程测量次数")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.iterations = min(args.iterations, 40)
+        args.presets = min(args.presets, 500)
+        args.preset_iterations = min(args.preset_iterations, 5)
+        args.batch = min(args.batch, 4)
+        args.image_size = min(args.image_size, 256)
+        args.translation_lines = min(args.translation_lines, 40)
+        args.batch_requests = min(args.batch_requests, 50)
+        args.startup_runs = min(args.startup_runs, 3)
+
+    settings = MockSettings(latency=args.latency, jitter=args.jitter)
+    with MockZhipuAIServer(settings=settings) as server, tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["ZHIPUAI_BASE_URL"] = server.base_url
+        import glm
+        # 基准测试关注节点自身的开销：不限流，并发上限与测试并发一致，重试退避缩短
+        glm.configure_api_governor(rate=0, max_in_flight=max(1, args.concurrency), base_delay=0.01, max_delay=0.2,
+                                   failure_threshold=10 ** 6)
+        # 预热：SDK 在首次使用时才导入，不应计入第一个场景的延迟
+        with glm.zhipuai_client(BENCH_API_KEY):
+            pass
+        ctx = {"server": server, "settings": settings, "tmp_dir": tmp_dir}
+
+        print(f"{'scenario':<28}{'iters':>7}{'conc':>5}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}"
+              f"{'p99 ms':>10}{'peak MB':>10}{'fail':>6}")
+        all_results = []
+        for name in (args.only or SCENARIOS):
+            for result in SCENARIOS[name](glm, args, ctx):
+                all_results.append(result)
+                print(_format_row(result), flush=True)
+
+        report = {
+            "results": all_results,
+            "mock_server": server.stats.as_dict(),
+            "client_pool": glm.get_client_pool_stats(),
+            "api_governor": glm.get_api_governor_stats(),
+            "single_flight": glm.get_single_flight_stats(),
+            "hedging": glm.get_hedge_stats(),
+            "semantic_cache": glm.get_semantic_cache_stats(),
+            "batch_results": glm.get_batch_result_stats(),
+            "image_encode": glm.get_image_encode_stats(),
+        }
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json_path}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
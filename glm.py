@@ -1,11 +1,72 @@
 import os
 import json
-import base64
+import functools
 import random
-from zhipuai import ZhipuAI
-from PIL import Image
-import numpy as np
-import io
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+# zhipuai、PIL、numpy 在首次使用时才导入：ComfyUI 启动和刷新节点列表时只需要节点定义，
+# 不应为从未运行 GLM 节点的进程付出这些依赖的导入开销
+
+# 作为 ComfyUI 自定义节点包加载时使用相对导入；glm_cli.py、基准和测试把本目录加入 sys.path 后直接 import glm
+if __package__:
+    from .glm_batch import BatchJobManager, BatchResultStore, make_batch_request_line
+    from .glm_cache import (
+        SEMANTIC_CACHE_DEFAULT_THRESHOLD, SEMANTIC_CACHE_ENABLED, ResponseCache, SemanticCache, TranslationMemory,
+        _semantic_cache_key, embed_text, make_request_fingerprint, semantic_signature,
+    )
+    from .glm_client import (
+        _chat_request_params, _complete_with_hedge, create_chat_completion, get_client_pool_stats, zhipuai_client,
+    )
+    from .glm_image import (
+        IMAGE_ENCODE_FORMAT, IMAGE_ENCODE_MAX_EDGE, IMAGE_ENCODE_QUALITY, VISION_CONTACT_SHEET_MAX_EDGE,
+        VISION_DEDUP_DEFAULT_THRESHOLD, _IMAGE_MIME_TYPES, build_contact_sheet, build_contact_sheet_prompt, cluster_similar_frames,
+        compute_frame_hashes, encode_image_frame, encode_image_frames, get_image_encode_stats, ingest_image_source,
+        is_local_image_path, parse_contact_sheet_response,
+    )
+    from .glm_governor import (
+        GLMCircuitOpenError, GLMDeadlineExceeded, _SINGLE_FLIGHT, _api_key_hash, _deadline_remaining,
+        _request_timeout_params, call_policy, call_with_governor, configure_api_governor, get_api_governor_stats,
+        get_hedge_stats, get_single_flight_stats, hedged_call,
+    )
+    from .glm_telemetry import (
+        _estimate_request_bytes, _log_error, _log_info, _log_warning, _map_in_context, _record_metric, _record_usage,
+        dump_prometheus_metrics, get_prometheus_metrics, get_telemetry_summary, telemetry_call,
+    )
+    from .glm_tokens import (
+        AUTO_MAX_TOKENS_LIMIT, BATCH_TRANSLATION_EXPANSION, CHAT_MESSAGE_OVERHEAD_TOKENS, _estimate_message_tokens,
+        estimate_tokens, get_model_context_window, plan_max_tokens, plan_text_chunks, split_sentences,
+    )
+else:
+    from glm_batch import BatchJobManager, BatchResultStore, make_batch_request_line
+    from glm_cache import (
+        SEMANTIC_CACHE_DEFAULT_THRESHOLD, SEMANTIC_CACHE_ENABLED, ResponseCache, SemanticCache, TranslationMemory,
+        _semantic_cache_key, embed_text, make_request_fingerprint, semantic_signature,
+    )
+    from glm_client import (
+        _chat_request_params, _complete_with_hedge, create_chat_completion, get_client_pool_stats, zhipuai_client,
+    )
+    from glm_image import (
+        IMAGE_ENCODE_FORMAT, IMAGE_ENCODE_MAX_EDGE, IMAGE_ENCODE_QUALITY, VISION_CONTACT_SHEET_MAX_EDGE,
+        VISION_DEDUP_DEFAULT_THRESHOLD, _IMAGE_MIME_TYPES, build_contact_sheet, build_contact_sheet_prompt, cluster_similar_frames,
+        compute_frame_hashes, encode_image_frame, encode_image_frames, get_image_encode_stats, ingest_image_source,
+        is_local_image_path, parse_contact_sheet_response,
+    )
+    from glm_governor import (
+        GLMCircuitOpenError, GLMDeadlineExceeded, _SINGLE_FLIGHT, _api_key_hash, _deadline_remaining,
+        _request_timeout_params, call_policy, call_with_governor, configure_api_governor, get_api_governor_stats,
+        get_hedge_stats, get_single_flight_stats, hedged_call,
+    )
+    from glm_telemetry import (
+        _estimate_request_bytes, _log_error, _log_info, _log_warning, _map_in_context, _record_metric, _record_usage,
+        dump_prometheus_metrics, get_prometheus_metrics, get_telemetry_summary, telemetry_call,
+    )
+    from glm_tokens import (
+        AUTO_MAX_TOKENS_LIMIT, BATCH_TRANSLATION_EXPANSION, CHAT_MESSAGE_OVERHEAD_TOKENS, _estimate_message_tokens,
+        estimate_tokens, get_model_context_window, plan_max_tokens, plan_text_chunks, split_sentences,
+    )
 
 # --- 全局常量和配置 ---
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,6 +75,11 @@ CONFIG_FILE_NAME = 'config.json'
 # 提示词文件名称（现在是TXT文件，但内部有特定格式）
 TEXT_PROMPTS_FILE_NAME = 'text_prompts.txt'
 IMAGE_PROMPTS_FILE_NAME = 'image_prompts.txt'
+# 额外的提示词目录：目录下的所有 .txt 文件（同样格式）会合并到对应的预设列表中
+TEXT_PROMPTS_DIR_NAME = 'text_prompts'
+IMAGE_PROMPTS_DIR_NAME = 'image_prompts'
+# 两次检查提示词文件是否变化的最小间隔（秒）
+PRESET_REVALIDATE_INTERVAL = 1.0
 
 # 支持的语言代码列表，用于翻译节点
 # 智谱AI的翻译能力通常是通用语言对，这里列出一些常见语言作为示例
@@ -23,19 +89,80 @@ SUPPORTED_TRANSLATION_LANGS = [
     # 更多语言可以根据智谱AI实际支持情况添加
 ]
 
-# --- 辅助函数 ---
+# 识图节点批量模式配置
+VISION_BATCH_DEFAULT_CONCURRENCY = 4  # 默认并发调用数
+BATCH_JOIN_SEPARATOR = "\n"          # 批量结果拼接为单个字符串时使用的分隔符
+VISION_CONTACT_SHEET_FRAMES = 4      # 拼图模式下每张网格图默认包含的帧数
+
+# 流式输出配置
+STREAM_PROGRESS_INTERVAL = 0.25  # 向 ComfyUI 推送部分文本的最小间隔（秒）
+STREAM_STATS_HISTORY = 256       # 保留最近多少次流式调用的统计
 
-def _log_info(message):
-    """统一的日志输出函数"""
-    print(f"[GLM_Nodes] 信息：{message}")
+# 批量翻译节点配置
+BATCH_TRANSLATION_MAX_SEGMENTS = 50    # 单个请求最多打包的段数
+BATCH_TRANSLATION_BUDGET_RATIO = 0.8   # 每个请求只使用 max_tokens 的该比例，为估算误差留余量
+BATCH_TRANSLATION_TAG_TOKENS = 8       # 每段 <s id="n">…</s> 标签的 token 开销
 
-def _log_warning(message):
-    """统一的警告输出函数"""
-    print(f"[GLM_Nodes] 警告：{message}")
+# 多轮对话会话节点配置
+CHAT_SESSION_MAX_SESSIONS = 64         # 内存中最多保存的会话数，超出时淘汰最久未使用的会话
+CHAT_SESSION_MAX_TURNS = 100           # 每个会话最多保存的轮数
+CHAT_SESSION_DEFAULT_BUDGET = 4096     # 默认的提示词 token 预算
+CHAT_SESSION_SUMMARY_MAX_TOKENS = 512  # 生成历史摘要时的 max_tokens
 
-def _log_error(message):
-    """统一的错误输出函数"""
-    print(f"[GLM_Nodes] 错误：{message}")
+# 合并同时进行的相同请求（模型、消息、采样参数、API Key 完全相同）：只发送一次，结果共享
+SINGLE_FLIGHT_ENABLED = True
+
+# --- 辅助函数 ---
+
+class _ConfigCache:
+    """
+    config.json 的读取缓存。节点的 INPUT_TYPES 和每次执行都会读取配置，
+    这里按 (mtime_ns, size) 判断文件是否变化，未变化时直接返回上次的解析结果（包括解析错误），
+    且两次检查之间至少间隔 revalidate_interval 秒。
+    """
+
+    def __init__(self, path, revalidate_interval=PRESET_REVALIDATE_INTERVAL):
+        self.path = path
+        self.revalidate_interval = revalidate_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._config = None
+        self._error = None
+        self._last_check = None
+
+    def load(self):
+        """返回配置字典；文件不存在时返回 None；文件解析失败时抛出解析异常。返回值请勿修改。"""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_check is None or now - self._last_check >= self.revalidate_interval:
+                self._last_check = now
+                try:
+                    st = os.stat(self.path)
+                    signature = (st.st_mtime_ns, st.st_size)
+                except FileNotFoundError:
+                    signature = None
+                if signature != self._signature:
+                    self._signature = signature
+                    self._config, self._error = None, None
+                    if signature is not None:
+                        try:
+                            with open(self.path, 'r', encoding='utf-8') as f:
+                                self._config = json.load(f)
+                        except Exception as e:
+                            self._error = e
+            config, error = self._config, self._error
+        if error is not None:
+            raise error
+        return config
+
+    def invalidate(self):
+        with self._lock:
+            self._last_check = None
+            self._signature = None
+            self._config, self._error = None, None
+
+
+_CONFIG_CACHE = _ConfigCache(os.path.join(CURRENT_DIR, CONFIG_FILE_NAME))
 
 def get_zhipuai_api_key():
     """
@@ -48,11 +175,9 @@ def get_zhipuai_api_key():
         _log_info("使用环境变量 API Key。")
         return env_api_key
 
-    config_path = os.path.join(CURRENT_DIR, CONFIG_FILE_NAME)
     try:
-        if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+        config = _CONFIG_CACHE.load()
+        if config is not None:
             api_key = config.get("ZHIPUAI_API_KEY")
             if api_key:
                 _log_info(f"从 {CONFIG_FILE_NAME} 读取 API Key。")
@@ -70,53 +195,523 @@ def get_zhipuai_api_key():
         _log_error(f"读取配置文件时发生错误: {e}")
         return ""
 
-def load_prompts_from_txt(file_path, default_built_in_prompts):
+def _parse_prompts_file(file_path):
     """
-    从特定格式的TXT文件加载多个提示词。
+    解析单个特定格式的提示词TXT文件，返回 {名称: 内容} 字典（可能为空）。
     格式要求：每个提示词以 `[提示词名称]` 开头，内容在其后，直到下一个 `[` 开头或文件结束。
-    空行和行首行尾的空格会被去除。
+    空行和行首行尾的空格会被去除。解析失败时抛出异常。
     """
     prompts = {}
     current_prompt_name = None
     current_prompt_content = []
 
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip() # 移除行首行尾空白
+            if not line: # 跳过空行
+                continue
+
+            if line.startswith('[') and line.endswith(']'):
+                # 新的提示词名称
+                if current_prompt_name and current_prompt_content:
+                    prompts[current_prompt_name] = "\n".join(current_prompt_content).strip()
+
+                current_prompt_name = line[1:-1].strip() # 提取名称
+                current_prompt_content = [] # 重置内容
+            elif current_prompt_name is not None:
+                # 添加内容到当前提示词
+                current_prompt_content.append(line)
+            # else: 忽略文件开头在第一个 [ ] 之前的行
+
+        # 处理文件末尾的最后一个提示词
+        if current_prompt_name and current_prompt_content:
+            prompts[current_prompt_name] = "\n".join(current_prompt_content).strip()
+
+    return prompts
+
+def load_prompts_from_txt(file_path, default_built_in_prompts):
+    """
+    从特定格式的TXT文件加载多个提示词（每次调用都会重新解析文件）。
+    文件不存在、为空或解析失败时返回内置默认提示词。
+    节点内部请使用带缓存的 PromptPresetStore。
+    """
     if not os.path.exists(file_path):
         _log_warning(f"提示词文件 '{os.path.basename(file_path)}' 不存在，使用内置默认提示词。")
         return default_built_in_prompts
 
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip() # 移除行首行尾空白
-                if not line: # 跳过空行
-                    continue
-
-                if line.startswith('[') and line.endswith(']'):
-                    # 新的提示词名称
-                    if current_prompt_name and current_prompt_content:
-                        prompts[current_prompt_name] = "\n".join(current_prompt_content).strip()
-                
-                    current_prompt_name = line[1:-1].strip() # 提取名称
-                    current_prompt_content = [] # 重置内容
-                elif current_prompt_name is not None:
-                    # 添加内容到当前提示词
-                    current_prompt_content.append(line)
-                # else: 忽略文件开头在第一个 [ ] 之前的行
-
-            # 处理文件末尾的最后一个提示词
-            if current_prompt_name and current_prompt_content:
-                prompts[current_prompt_name] = "\n".join(current_prompt_content).strip()
-
-        if not prompts:
-            _log_warning(f"提示词文件 '{os.path.basename(file_path)}' 内容为空或格式不正确，使用内置默认提示词。")
-            return default_built_in_prompts
-
-        #_log_info(f"从 '{os.path.basename(file_path)}' 加载提示词成功。")
-        return prompts
-
+        prompts = _parse_prompts_file(file_path)
     except Exception as e:
         _log_error(f"解析提示词文件 '{os.path.basename(file_path)}' 失败: {e}。使用内置默认提示词。")
-        return default_built_in_prompts # 修正这里，应该是 default_built_in_prompts
+        return default_built_in_prompts
+
+    if not prompts:
+        _log_warning(f"提示词文件 '{os.path.basename(file_path)}' 内容为空或格式不正确，使用内置默认提示词。")
+        return default_built_in_prompts
+
+    return prompts
+
+# --- 提示词预设缓存 ---
+
+class PromptPresetStore:
+    """
+    带缓存的提示词预设库。
+    数据源可以是多个TXT文件或目录（目录下所有 .txt 文件按文件名排序加载）。
+    每个文件只解析一次，之后通过 (mtime, size) 廉价校验；文件变化时只重新解析变化的文件，
+    再合并为一个字典。同名预设以后加载的文件为准。
+    """
+
+    def __init__(self, sources, revalidate_interval=PRESET_REVALIDATE_INTERVAL):
+        self.sources = list(sources)
+        self.revalidate_interval = revalidate_interval
+        self._lock = threading.Lock()
+        self._file_cache = {}      # 文件路径 -> ((mtime_ns, size), 解析结果)
+        self._signature = None     # 上次合并时所有文件的签名
+        self._merged = {}
+        self._last_check = None
+        self._stats = {"parsed_files": 0, "rebuilds": 0, "hits": 0}
+
+    def _list_files(self):
+        """展开数据源，返回 [(路径, stat结果)]，不存在的数据源被忽略。"""
+        files = []
+        for source in self.sources:
+            try:
+                if os.path.isdir(source):
+                    entries = sorted(
+                        (entry for entry in os.scandir(source)
+                         if entry.is_file() and entry.name.lower().endswith('.txt')),
+                        key=lambda entry: entry.name,
+                    )
+                    files.extend((entry.path, entry.stat()) for entry in entries)
+                else:
+                    files.append((source, os.stat(source)))
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                _log_warning(f"读取提示词数据源 '{source}' 失败: {e}")
+        return files
+
+    def _rebuild_locked(self, files):
+        merged = {}
+        file_cache = {}
+        for path, st in files:
+            file_sig = (st.st_mtime_ns, st.st_size)
+            cached = self._file_cache.get(path)
+            if cached is not None and cached[0] == file_sig:
+                prompts = cached[1]
+            else:
+                try:
+                    prompts = _parse_prompts_file(path)
+                except Exception as e:
+                    _log_error(f"解析提示词文件 '{os.path.basename(path)}' 失败: {e}。")
+                    prompts = {}
+                self._stats["parsed_files"] += 1
+                if not prompts:
+                    _log_warning(f"提示词文件 '{os.path.basename(path)}' 内容为空或格式不正确。")
+            file_cache[path] = (file_sig, prompts)
+            merged.update(prompts)
+        self._file_cache = file_cache
+        self._merged = merged
+        self._stats["rebuilds"] += 1
+
+    def get_prompts(self, default_built_in_prompts):
+        """返回合并后的提示词字典；没有任何可用预设时返回内置默认提示词。返回值请勿修改。"""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_check is not None and now - self._last_check < self.revalidate_interval:
+                self._stats["hits"] += 1
+            else:
+                self._last_check = now
+                files = self._list_files()
+                signature = tuple((path, st.st_mtime_ns, st.st_size) for path, st in files)
+                if signature != self._signature:
+                    self._rebuild_locked(files)
+                    self._signature = signature
+                else:
+                    self._stats["hits"] += 1
+            merged = self._merged
+        return merged if merged else default_built_in_prompts
+
+    def invalidate(self):
+        """强制下次访问时重新校验所有文件。"""
+        with self._lock:
+            self._last_check = None
+            self._signature = None
+            self._file_cache = {}
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["files"] = len(self._file_cache)
+            stats["prompts"] = len(self._merged)
+        return stats
+
+
+_TEXT_PROMPT_STORE = PromptPresetStore([
+    os.path.join(CURRENT_DIR, TEXT_PROMPTS_FILE_NAME),
+    os.path.join(CURRENT_DIR, TEXT_PROMPTS_DIR_NAME),
+])
+_IMAGE_PROMPT_STORE = PromptPresetStore([
+    os.path.join(CURRENT_DIR, IMAGE_PROMPTS_FILE_NAME),
+    os.path.join(CURRENT_DIR, IMAGE_PROMPTS_DIR_NAME),
+])
+
+# --- 响应缓存 ---
+
+_RESPONSE_CACHE = ResponseCache()
+
+def get_response_cache_stats():
+    """返回响应缓存的统计信息。"""
+    return _RESPONSE_CACHE.get_stats()
+
+# --- 近似请求缓存 ---
+
+_SEMANTIC_CACHE = SemanticCache()
+
+def get_semantic_cache_stats():
+    """返回近似请求缓存的统计信息。"""
+    return _SEMANTIC_CACHE.get_stats()
+
+# --- 离线批处理（Batch API） ---
+
+_BATCH_RESULTS = BatchResultStore()
+
+def build_chat_batch_requests(text_inputs, model_name="GLM-4.5-Flash", temperature=0.9, top_p=0.7, max_tokens=1024,
+                              system_prompt_override="", text_system_prompt_preset=""):
+    """按 GLM_Text_Chat 的方式为每段输入构建请求参数（系统提示词为空时返回空列表）。"""
+    requests = []
+    for text_input in text_inputs:
+        request = GLM_Text_Chat.build_request(text_input, model_name, temperature, top_p, max_tokens,
+                                              system_prompt_override, text_system_prompt_preset, verbose=False)
+        if request is None:
+            return []
+        requests.append(request)
+    return requests
+
+def build_translation_batch_requests(text_inputs, from_language="zh", to_language="en", model_name="GLM-4.5-Flash",
+                                     temperature=0.1, top_p=0.7, max_tokens=1024):
+    """按 GLM_Translation_Text 的方式为每段输入构建请求参数，长文本与节点一样按句子切分为多个请求。"""
+    requests = []
+    for text_input in text_inputs:
+        requests.extend(GLM_Translation_Text.build_requests(text_input, from_language, to_language, model_name,
+                                                            temperature, top_p, max_tokens))
+    return requests
+
+def build_vision_batch_requests(images, model_name="glm-4v-flash", prompt_override="", image_prompt_preset="",
+                                image_format=IMAGE_ENCODE_FORMAT, image_quality=IMAGE_ENCODE_QUALITY,
+                                max_image_edge=IMAGE_ENCODE_MAX_EDGE):
+    """
+    按 GLM_Vision_ImageToPrompt 的方式构建识图请求参数。images 为 IMAGE 批次（每帧一个请求），
+    或图片来源字符串的列表（URL、data URI、本地路径或 Base64，与节点的 image_url / image_base64 相同）。
+    编码参数需与节点上的设置一致，节点才能按指纹读到结果。无法读取的图片抛出 ValueError。
+    """
+    prompt_text = GLM_Vision_ImageToPrompt.resolve_image_prompt(prompt_override, image_prompt_preset, verbose=False)
+    encode_options = {"image_format": image_format, "quality": image_quality, "max_edge": max_image_edge}
+    if hasattr(images, "shape"):
+        image_data_list = [r["data_url"] for r in encode_image_frames(images, **encode_options)]
+    else:
+        image_data_list = []
+        for source in images:
+            source = source.strip()
+            if source.startswith(("http://", "https://")):
+                image_data, error = GLM_Vision_ImageToPrompt.prepare_image_data(image_url=source)
+            else:
+                image_data, error = GLM_Vision_ImageToPrompt.prepare_image_data(image_base64=source,
+                                                                                encode_options=encode_options)
+            if error:
+                raise ValueError(error)
+            image_data_list.append(image_data)
+    return [GLM_Vision_ImageToPrompt.build_request(model_name, prompt_text, image_data) for image_data in image_data_list]
+
+_BATCH_JOBS = BatchJobManager(result_store=_BATCH_RESULTS)
+
+def get_batch_jobs():
+    """返回本地批处理任务管理器（创建、提交、查询和导入任务）。"""
+    return _BATCH_JOBS
+
+def get_batch_result_stats():
+    """返回离线批处理结果存储的统计信息。"""
+    return _BATCH_RESULTS.get_stats()
+
+# --- ComfyUI 进度与中断 ---
+
+class _ComfyProgress:
+    """
+    向 ComfyUI 推送流式输出的部分文本，并查询用户是否中断了执行。
+    不在 ComfyUI 环境中运行（例如命令行调用）时所有操作都是空操作。
+    """
+
+    def __init__(self, node_id=None, min_interval=STREAM_PROGRESS_INTERVAL):
+        self.node_id = node_id
+        self.min_interval = min_interval
+        self._last_push = 0.0
+        try:
+            import comfy.model_management as model_management
+            self._model_management = model_management
+        except ImportError:
+            self._model_management = None
+        try:
+            from server import PromptServer
+            self._server = PromptServer.instance
+        except (ImportError, AttributeError):
+            self._server = None
+
+    def push_text(self, text, force=False):
+        """推送当前已生成的文本（按 min_interval 节流）。"""
+        if self._server is None or self.node_id is None or not hasattr(self._server, "send_progress_text"):
+            return
+        now = time.monotonic()
+        if not force and now - self._last_push < self.min_interval:
+            return
+        self._last_push = now
+        try:
+            self._server.send_progress_text(text, self.node_id)
+        except Exception as e:
+            _log_warning(f"推送流式进度失败: {e}")
+
+    def interrupted(self):
+        """用户是否在 ComfyUI 中点击了取消。"""
+        if self._model_management is None:
+            return False
+        return self._model_management.processing_interrupted()
+
+    def raise_if_interrupted(self):
+        """如果用户已中断，抛出 ComfyUI 的中断异常，让队列按正常方式终止。"""
+        if self._model_management is not None:
+            self._model_management.throw_exception_if_processing_interrupted()
+
+class _PrefixedProgress:
+    """分块流式翻译时，把当前块的部分译文接在已完成的前缀之后推送；中断查询转交给原进度对象。"""
+
+    def __init__(self, progress, prefix_fn):
+        self._progress = progress
+        self._prefix_fn = prefix_fn
+
+    def push_text(self, text, force=False):
+        self._progress.push_text(self._prefix_fn() + text, force)
+
+    def interrupted(self):
+        return self._progress.interrupted()
+
+# --- 对话请求 ---
+
+_STREAM_CALL_STATS = deque(maxlen=STREAM_STATS_HISTORY)
+_STREAM_CALL_STATS_LOCK = threading.Lock()
+
+def stream_chat_completion(api_key, progress=None, stop_string="", **request_params):
+    """
+    以 stream=True 调用对话补全，逐块拼接文本并推送到 ComfyUI 进度通道。
+    出现 stop_string 或用户中断时提前结束并关闭连接。
+    返回 (文本, 统计信息)，统计信息包含首字延迟 ttft、tokens/s 以及是否提前结束。
+    """
+    start = time.perf_counter()
+    state = {}
+
+    def attempt():
+        # 每次重试都从头接收
+        state.update(first_token_at=None, text="", chunk_count=0, completion_tokens=None, usage=None, stopped=None)
+        with zhipuai_client(api_key) as client:
+            stream = client.chat.completions.create(stream=True, **request_params, **_request_timeout_params())
+            try:
+                for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        state["usage"] = chunk.usage
+                        state["completion_tokens"] = chunk.usage.completion_tokens
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if state["first_token_at"] is None:
+                        state["first_token_at"] = time.perf_counter()
+                    state["chunk_count"] += 1
+                    text = state["text"] = state["text"] + delta
+
+                    if stop_string:
+                        # 只在新增内容附近查找，避免每个分块都扫描全文
+                        stop_at = text.find(stop_string, max(0, len(text) - len(delta) - len(stop_string)))
+                        if stop_at != -1:
+                            state["text"] = text[:stop_at]
+                            state["stopped"] = "stop_string"
+                            break
+                    if progress is not None:
+                        if progress.interrupted():
+                            state["stopped"] = "interrupted"
+                            break
+                        progress.push_text(text)
+                    remaining = _deadline_remaining()
+                    if remaining is not None and remaining <= 0:
+                        state["stopped"] = "deadline"
+                        break
+            finally:
+                if state["stopped"] is not None:
+                    try:
+                        stream.response.close()
+                    except Exception:
+                        pass
+
+    _record_metric("request_bytes", _estimate_request_bytes(request_params))
+    # 已经输出过部分文本后不再重试，避免重复内容
+    call_with_governor(api_key, attempt, can_retry=lambda: state.get("first_token_at") is None)
+    _record_usage(state["usage"])
+    first_token_at = state["first_token_at"]
+    text = state["text"]
+    chunk_count = state["chunk_count"]
+    completion_tokens = state["completion_tokens"]
+    stopped = state["stopped"]
+
+    end = time.perf_counter()
+    if progress is not None:
+        progress.push_text(text, force=True)
+
+    tokens = completion_tokens if completion_tokens is not None else chunk_count
+    generation_seconds = end - first_token_at if first_token_at is not None else 0.0
+    stats = {
+        "model": request_params.get("model"),
+        "ttft": (first_token_at - start) if first_token_at is not None else None,
+        "total_seconds": end - start,
+        "completion_tokens": tokens,
+        "tokens_per_second": tokens / generation_seconds if generation_seconds > 0 else None,
+        "stopped": stopped,
+    }
+    with _STREAM_CALL_STATS_LOCK:
+        _STREAM_CALL_STATS.append(stats)
+    ttft_text = f"{stats['ttft'] * 1000:.0f} ms" if stats["ttft"] is not None else "无输出"
+    tps_text = f"{stats['tokens_per_second']:.1f}" if stats["tokens_per_second"] is not None else "-"
+    _log_info(f"流式响应完成：首字延迟 {ttft_text}，{tokens} tokens，{tps_text} tokens/s"
+              + (f"，提前结束（{stopped}）" if stopped else "") + "。")
+    return text, stats
+
+def get_stream_stats():
+    """返回最近流式调用的汇总：次数、平均首字延迟和平均 tokens/s，以及最近一次调用的明细。"""
+    with _STREAM_CALL_STATS_LOCK:
+        history = list(_STREAM_CALL_STATS)
+    ttfts = [s["ttft"] for s in history if s["ttft"] is not None]
+    rates = [s["tokens_per_second"] for s in history if s["tokens_per_second"] is not None]
+    return {
+        "calls": len(history),
+        "avg_ttft": sum(ttfts) / len(ttfts) if ttfts else None,
+        "avg_tokens_per_second": sum(rates) / len(rates) if rates else None,
+        "last": history[-1] if history else None,
+    }
+
+def complete_chat(api_key, model_name, messages, temperature=None, top_p=None, max_tokens=None,
+                  use_cache=False, stream=False, stop_string="", progress=None, use_batch_results=False,
+                  semantic_threshold=0.0):
+    """
+    节点共用的对话请求流程：可选的离线批处理结果、响应缓存和近似请求缓存查询 → 普通或流式调用 → 写回缓存。
+    use_cache 开启且 semantic_threshold 大于 0 时启用近似请求缓存（最后一条用户消息与已缓存输入的余弦相似度达到该值即命中）。
+    值为 None 的采样参数不会发送。返回响应文本，API 调用失败时抛出异常。
+    流式调用被 stop_string 截断或被用户中断时结果不写入缓存；对冲请求由备用模型（fallback_model）胜出时也不写入。
+    """
+    context_window = get_model_context_window(model_name)
+    prompt_tokens = _estimate_message_tokens(messages)
+    if prompt_tokens + (max_tokens or 0) > context_window:
+        _log_warning(f"请求估算约 {prompt_tokens} 提示词 tokens + {max_tokens or 0} 输出 tokens，"
+                     f"可能超出模型 {model_name} 的上下文长度 {context_window}。")
+
+    if use_batch_results:
+        batch_text = _BATCH_RESULTS.get(make_request_fingerprint(model_name, messages, temperature, top_p, max_tokens))
+        if batch_text is not None:
+            _log_info("使用离线批处理结果，跳过 API 调用。")
+            _record_metric("batch_result_hits")
+            return batch_text
+
+    cache_key = None
+    if use_cache:
+        cache_key = make_request_fingerprint(model_name, messages, temperature, top_p, max_tokens)
+        cached_text = _RESPONSE_CACHE.get(cache_key)
+        if cached_text is not None:
+            _log_info("命中响应缓存，跳过 API 调用。")
+            _record_metric("cache_hits")
+            return cached_text
+
+    semantic_key = None
+    if use_cache and semantic_threshold and SEMANTIC_CACHE_ENABLED:
+        semantic_key = _semantic_cache_key(model_name, messages, temperature, top_p)
+        if semantic_key is not None:
+            hit = _SEMANTIC_CACHE.lookup(*semantic_key, semantic_threshold)
+            if hit is not None:
+                _log_info(f"命中近似请求缓存（相似度 {hit[1]:.3f}），跳过 API 调用。")
+                _record_metric("semantic_cache_hits")
+                return hit[0]
+
+    request_params = _chat_request_params(model_name, messages, temperature, top_p, max_tokens)
+
+    def call():
+        answered_model = model_name
+        try:
+            if stream:
+                response_text, stream_stats = stream_chat_completion(api_key, progress=progress, stop_string=stop_string, **request_params)
+            else:
+                response_text, answered_model = _complete_with_hedge(api_key, request_params)
+        except Exception:
+            _record_metric("api_errors")
+            raise
+        _record_metric("api_calls")
+        stopped = stream_stats["stopped"] if stream else None
+        if answered_model != model_name:
+            # 备用模型的回答不能以主模型的请求指纹缓存，否则之后的相同请求会一直拿到备用模型的结果
+            _log_info(f"结果来自备用模型 {answered_model}，不写入缓存。")
+        elif stopped is None:
+            if cache_key is not None:
+                _RESPONSE_CACHE.put(cache_key, response_text, model_name)
+            if semantic_key is not None:
+                _SEMANTIC_CACHE.put(*semantic_key, response_text)
+        return response_text, stopped
+
+    if not SINGLE_FLIGHT_ENABLED:
+        return call()[0]
+    # 合并键包含 API Key（不同账号的配额互不影响）以及流式参数（stop_string 会改变结果）
+    request_fingerprint = cache_key or make_request_fingerprint(model_name, messages, temperature, top_p, max_tokens)
+    flight_key = (request_fingerprint, _api_key_hash(api_key), bool(stream), stop_string or "")
+    # 执行者被中断或超过截止时间而截断的流式结果不共享给等待者（stop_string 截断对同一键的请求都相同，可以共享）
+    (response_text, _), coalesced = _SINGLE_FLIGHT.do(
+        flight_key, call, is_shareable=lambda result: result[1] not in ("interrupted", "deadline"))
+    if coalesced:
+        _record_metric("coalesced_calls")
+        _log_info("与进行中的相同请求合并，共享其结果。")
+    return response_text
+
+# 各节点共用的可选输入：超时、截止时间和对冲请求（由 _instrument_node 取出，不传给节点函数）
+_LATENCY_CONTROL_INPUTS = {
+    "timeout_seconds": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 600.0, "step": 1.0, "tooltip": "单次 API 请求的超时时间（秒），0 使用 SDK 默认值"}),
+    "deadline_seconds": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0, "tooltip": "整个节点执行（含重试和对冲）的截止时间（秒），到时立即返回错误而不是继续等待，0 表示不限制"}),
+    "hedge_delay": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 120.0, "step": 0.5, "tooltip": "请求超过该秒数仍未返回时再并行发送一次（失败时立即发送），取先成功的结果；0 表示不启用，流式模式下不生效"}),
+    "fallback_model": ("STRING", {"default": "", "multiline": False, "placeholder": "可选：对冲请求使用的备用模型，如 GLM-4-Flash（留空则使用同一模型）"}),
+}
+
+# 对话、识图和翻译节点共用的可选输入：优先读取离线批处理结果
+_USE_BATCH_RESULTS_INPUT = ("BOOLEAN", {"default": False, "tooltip": "开启后，已通过离线批处理（Batch API）得到结果的相同请求直接使用该结果，不再调用API"})
+
+# 对话和翻译节点共用的可选输入：近似请求缓存（默认关闭，需同时开启 use_cache）
+_SEMANTIC_CACHE_INPUTS = {
+    "semantic_cache": ("BOOLEAN", {"default": False, "tooltip": "开启后（需同时开启 use_cache），与之前的输入只在空白、标点、大小写或虚词上有差异（实词完全相同且相似度达到阈值）的请求直接返回之前的响应，不再调用API；同一系统提示词、模型和采样参数之间才会匹配"}),
+    "semantic_threshold": ("FLOAT", {"default": SEMANTIC_CACHE_DEFAULT_THRESHOLD, "min": 0.5, "max": 1.0, "step": 0.01, "tooltip": "近似请求缓存的余弦相似度阈值，越高越严格"}),
+}
+
+# --- 节点执行包装 ---
+
+def _instrument_node(func):
+    """
+    节点执行函数的装饰器：整个调用计入遥测，模型名取自 model_name 参数；
+    节点上的超时、截止时间和对冲参数（见 _LATENCY_CONTROL_INPUTS）在这里取出并设置为本次调用的请求策略。
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        model = kwargs.get("model_name", "")
+        if isinstance(model, list): # INPUT_IS_LIST 的节点
+            model = model[0] if model else ""
+        policy_args = {}
+        for name in ("timeout_seconds", "deadline_seconds", "hedge_delay", "fallback_model"):
+            if name in kwargs:
+                value = kwargs.pop(name)
+                if isinstance(value, list):
+                    value = value[0] if value else None
+                policy_args[name] = value
+        with telemetry_call(type(self).__name__, model), call_policy(**policy_args):
+            return func(self, *args, **kwargs)
+    return wrapper
 
 # --- GLM文本对话节点 ---
 
@@ -157,11 +752,70 @@ class GLM_Text_Chat:
     @classmethod
     def get_text_prompts(cls):
         """加载外部或内置的文本提示词字典。"""
-        # 尝试从外部TXT文件加载，如果失败则回退到内置默认
-        return load_prompts_from_txt(
-            os.path.join(CURRENT_DIR, TEXT_PROMPTS_FILE_NAME),
-            cls._BUILT_IN_TEXT_PROMPTS
-        )
+        # 从缓存的外部TXT预设加载，没有可用预设时回退到内置默认
+        return _TEXT_PROMPT_STORE.get_prompts(cls._BUILT_IN_TEXT_PROMPTS)
+
+    @classmethod
+    def resolve_system_prompt(cls, system_prompt_override, text_system_prompt_preset, verbose=True):
+        """
+        按优先级确定系统提示词：system_prompt_override > 预设 > 第一个可用预设 > 内置备用。
+        verbose 为 False 时不输出日志（用于 IS_CHANGED 等频繁调用的场景）。
+        """
+        final_system_prompt = ""
+        available_prompts = cls.get_text_prompts()
+
+        if system_prompt_override and system_prompt_override.strip():
+            final_system_prompt = system_prompt_override.strip()
+            if verbose:
+                _log_info("使用 'system_prompt_override'。")
+        elif text_system_prompt_preset in available_prompts:
+            final_system_prompt = available_prompts[text_system_prompt_preset]
+            if verbose:
+                _log_info(f"使用预设提示词: '{text_system_prompt_preset}'。")
+        else:
+            if available_prompts:
+                final_system_prompt = list(available_prompts.values())[0]
+                if verbose:
+                    _log_warning(f"预设 '{text_system_prompt_preset}' 未找到，使用第一个可用预设。")
+            else:
+                final_system_prompt = list(cls._BUILT_IN_TEXT_PROMPTS.values())[0]
+                if verbose:
+                    _log_warning("无可用预设提示词，使用内置备用。")
+
+        # 确保 final_system_prompt 确实是字符串
+        if final_system_prompt and not isinstance(final_system_prompt, str):
+            if verbose:
+                _log_warning(f"系统提示词类型异常: {type(final_system_prompt)}。尝试转换为字符串。")
+            final_system_prompt = str(final_system_prompt)
+        return final_system_prompt
+
+    @classmethod
+    def build_messages(cls, text_input, system_prompt_override, text_system_prompt_preset, verbose=True):
+        """构建发送给模型的消息列表；系统提示词为空时返回 None。"""
+        final_system_prompt = cls.resolve_system_prompt(system_prompt_override, text_system_prompt_preset, verbose)
+        if not final_system_prompt:
+            return None
+        return [
+            {"role": "system", "content": final_system_prompt},
+            {"role": "user", "content": text_input}
+        ]
+
+    @classmethod
+    def build_request(cls, text_input, model_name, temperature, top_p, max_tokens, system_prompt_override,
+                      text_system_prompt_preset, verbose=True):
+        """
+        构建传给 complete_chat 的请求参数，max_tokens 为 0 时按输入自动估算；系统提示词为空时返回 None。
+        离线批处理也用它生成请求，保证与节点实际发送的请求（及其指纹）一致。
+        """
+        messages = cls.build_messages(text_input, system_prompt_override, text_system_prompt_preset, verbose)
+        if messages is None:
+            return None
+        if not max_tokens:
+            max_tokens = plan_max_tokens("chat", estimate_tokens(text_input), model_name, _estimate_message_tokens(messages))
+            if verbose:
+                _log_info(f"自动设置 max_tokens = {max_tokens}。")
+        return {"model_name": model_name, "messages": messages, "temperature": temperature, "top_p": top_p,
+                "max_tokens": max_tokens}
 
     @classmethod
     def INPUT_TYPES(s):
@@ -177,13 +831,36 @@ class GLM_Text_Chat:
                 "model_name": ("STRING", {"default": "GLM-4.5-Flash", "placeholder": "请输入模型名称，如 GLM-4.5-Flash"}),
                 "temperature": ("FLOAT", {"default": 0.9, "min": 0.0, "max": 1.0, "step": 0.01}),
                 "top_p": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 1.0, "step": 0.01}),
-                "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 4096}),
+                "max_tokens": ("INT", {"default": 1024, "min": 0, "max": 4096, "tooltip": "输出 token 上限；设置为0时根据输入长度和任务类型自动估算"}),
                 "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff, "tooltip": "设置为0时，每次运行生成随机种子；设置为其他值时，使用固定种子。注意：此种子仅影响ComfyUI节点内部的随机数生成，不直接影响智谱AI模型的输出结果。"}),
                 "text_input": ("STRING", {"multiline": True, "default": "请扩写关于一只小狗在草地上玩耍的视频提示词。", "placeholder": "请输入需要扩写的视频提示词内容"}),
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": False, "tooltip": "开启后，模型、最终消息和采样参数完全相同的请求直接返回缓存的响应（内存+磁盘），不再调用API"}),
+                "stream": ("BOOLEAN", {"default": False, "tooltip": "开启后以流式方式接收响应，生成过程中实时显示部分文本，并记录首字延迟和生成速度"}),
+                "stop_string": ("STRING", {"default": "", "multiline": False, "placeholder": "可选：流式模式下出现该字符串时提前结束生成"}),
+                "use_batch_results": _USE_BATCH_RESULTS_INPUT,
+                **_SEMANTIC_CACHE_INPUTS,
+                **_LATENCY_CONTROL_INPUTS,
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
             }
         }
 
-    def glm_chat_function(self, text_input, api_key, model_name, temperature, top_p, max_tokens, seed, system_prompt_override, text_system_prompt_preset):
+    @classmethod
+    def IS_CHANGED(cls, text_input="", model_name="", temperature=None, top_p=None, max_tokens=None,
+                   system_prompt_override="", text_system_prompt_preset="", **kwargs):
+        """
+        返回最终请求的指纹：预设文件内容变化时节点会重新执行；seed 不影响模型输出，不参与计算。
+        """
+        messages = cls.build_messages(text_input, system_prompt_override, text_system_prompt_preset, verbose=False)
+        return make_request_fingerprint(model_name, messages, temperature, top_p, max_tokens)
+
+    @_instrument_node
+    def glm_chat_function(self, text_input, api_key, model_name, temperature, top_p, max_tokens, seed, system_prompt_override, text_system_prompt_preset, use_cache=False,
+                          stream=False, stop_string="", use_batch_results=False, semantic_cache=False,
+                          semantic_threshold=SEMANTIC_CACHE_DEFAULT_THRESHOLD, unique_id=None):
         """
         执行智谱AI GLM-4 文本聊天功能。
         """
@@ -192,47 +869,12 @@ class GLM_Text_Chat:
             _log_error("API Key 未提供。")
             return ("API Key 未提供。",)
 
-        _log_info("初始化智谱AI客户端。")
-
-        try:
-            client = ZhipuAI(api_key=final_api_key)
-        except Exception as e:
-            _log_error(f"客户端初始化失败: {e}")
-            return (f"客户端初始化失败: {e}",)
-
-        # --- 系统提示词确定优先级 ---
-        final_system_prompt = ""
-        available_prompts = self.get_text_prompts()
-
-        if system_prompt_override and system_prompt_override.strip():
-            final_system_prompt = system_prompt_override.strip()
-            _log_info("使用 'system_prompt_override'。")
-        elif text_system_prompt_preset in available_prompts:
-            final_system_prompt = available_prompts[text_system_prompt_preset]
-            _log_info(f"使用预设提示词: '{text_system_prompt_preset}'。")
-        else:
-            if available_prompts:
-                final_system_prompt = list(available_prompts.values())[0]
-                _log_warning(f"预设 '{text_system_prompt_preset}' 未找到，使用第一个可用预设。")
-            else:
-                final_system_prompt = list(self._BUILT_IN_TEXT_PROMPTS.values())[0]
-                _log_warning("无可用预设提示词，使用内置备用。")
-
-
-        if not final_system_prompt:
+        request = self.build_request(text_input, model_name, temperature, top_p, max_tokens,
+                                     system_prompt_override, text_system_prompt_preset)
+        if request is None:
             _log_error("系统提示词不能为空。")
             return ("系统提示词不能为空。",)
 
-        # 确保 final_system_prompt 确实是字符串
-        if not isinstance(final_system_prompt, str):
-            _log_warning(f"系统提示词类型异常: {type(final_system_prompt)}。尝试转换为字符串。")
-            final_system_prompt = str(final_system_prompt)
-
-        messages = [
-            {"role": "system", "content": final_system_prompt},
-            {"role": "user", "content": text_input}
-        ]
-
         # --- 种子逻辑 ---
         effective_seed = seed if seed != 0 else random.randint(0, 0xffffffffffffffff)
         _log_info(f"内部种子: {effective_seed}。")
@@ -240,20 +882,19 @@ class GLM_Text_Chat:
 
         _log_info(f"调用 GLM-4 ({model_name})...")
 
+        progress = _ComfyProgress(unique_id)
         try:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                max_tokens=max_tokens,
+            response_text = complete_chat(
+                final_api_key, **request,
+                use_cache=use_cache, stream=stream, stop_string=stop_string, progress=progress,
+                use_batch_results=use_batch_results, semantic_threshold=semantic_threshold if semantic_cache else 0.0,
             )
-            response_text = response.choices[0].message.content
             _log_info("GLM-4 响应成功。")
-            return (response_text,)
         except Exception as e:
             error_message = f"GLM-4 API 调用失败: {e}"
             return (error_message,)
+        progress.raise_if_interrupted()
+        return (response_text,)
 
 # --- GLM识图生成提示词节点 ---
 
@@ -264,8 +905,9 @@ class GLM_Vision_ImageToPrompt:
     支持多个预设识图提示词（从特定格式的TXT文件加载），并有优先级管理。
     """
     CATEGORY = "GLM"
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("GETPrompt",)
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("GETPrompt", "prompt_list")
+    OUTPUT_IS_LIST = (False, True)
     FUNCTION = "generate_prompt"
 
     # 内置的默认识图提示词 (当TXT文件不存在或解析失败时作为备用)
@@ -276,10 +918,95 @@ class GLM_Vision_ImageToPrompt:
     @classmethod
     def get_image_prompts(cls):
         """加载外部或内置的图像提示词字典。"""
-        return load_prompts_from_txt(
-            os.path.join(CURRENT_DIR, IMAGE_PROMPTS_FILE_NAME),
-            cls._BUILT_IN_IMAGE_PROMPTS
-        )
+        return _IMAGE_PROMPT_STORE.get_prompts(cls._BUILT_IN_IMAGE_PROMPTS)
+
+    @classmethod
+    def resolve_image_prompt(cls, prompt_override, image_prompt_preset, verbose=True):
+        """按优先级确定识图提示词：prompt_override > 预设 > 第一个可用预设 > 内置备用。"""
+        final_prompt_text = ""
+        available_prompts = cls.get_image_prompts()
+
+        if prompt_override and prompt_override.strip():
+            final_prompt_text = prompt_override.strip()
+            if verbose:
+                _log_info("使用 'prompt_override'。")
+        elif image_prompt_preset in available_prompts:
+            final_prompt_text = available_prompts[image_prompt_preset]
+            if verbose:
+                _log_info(f"使用预设识图提示词: '{image_prompt_preset}'。")
+        else:
+            if available_prompts:
+                final_prompt_text = list(available_prompts.values())[0]
+                if verbose:
+                    _log_warning(f"预设 '{image_prompt_preset}' 未找到，使用第一个可用预设。")
+            else:
+                final_prompt_text = list(cls._BUILT_IN_IMAGE_PROMPTS.values())[0]
+                if verbose:
+                    _log_warning("无可用预设识图提示词，使用内置备用。")
+
+        # 确保 final_prompt_text 确实是字符串
+        if final_prompt_text and not isinstance(final_prompt_text, str):
+            if verbose:
+                _log_warning(f"识图提示词类型异常: {type(final_prompt_text)}。尝试转换为字符串。")
+            final_prompt_text = str(final_prompt_text)
+        return final_prompt_text
+
+    @classmethod
+    def prepare_image_data(cls, image_url="", image_base64="", image_input=None, encode_options=None):
+        """
+        按 IMAGE > Base64 > URL 的优先级把图片输入转换为可直接发送的 URL 或 data URI。
+        Base64 输入以及 data URI / 本地文件路径形式的 URL 经 ingest_image_source 识别真实格式，超限时才重新编码。
+        encode_options 为传给 encode_image_frame 的编码参数（格式、质量、长边上限）。
+        返回 (图片数据, 错误信息)，成功时错误信息为 None。
+        """
+        image_url_provided = bool(image_url and image_url.strip())
+        image_base64_provided = bool(image_base64 and image_base64.strip())
+
+        if image_input is not None:
+            _log_info("检测到 IMAGE 对象输入，正在转换为 Base64。")
+            try:
+                # 只编码第一个batch的图片
+                image_data = encode_image_frames(image_input, [0], **(encode_options or {}))[0]["data_url"]
+                _log_info("IMAGE 对象成功转换为 Base64。")
+                return image_data, None
+            except Exception as e:
+                _log_error(f"将 IMAGE 对象转换为 Base64 失败: {e}")
+                return None, f"将 IMAGE 对象转换为 Base64 失败: {e}"
+        elif image_base64_provided:
+            _log_info("检测到 Base64 字符串输入。")
+            return cls._ingest(image_base64, "提供的Base64图片数据无效", encode_options)
+        elif image_url_provided:
+            image_url = image_url.strip()
+            if image_url.startswith("data:") or is_local_image_path(image_url):
+                _log_info("检测到 data URI 或本地图片路径输入。")
+                return cls._ingest(image_url, "提供的图片数据无效", encode_options)
+            _log_info(f"检测到图片URL输入: {image_url}")
+            return image_url, None
+        return None, None
+
+    @staticmethod
+    def _ingest(source, error_prefix, encode_options):
+        """调用 ingest_image_source，返回 (data URI, 错误信息)。"""
+        try:
+            ingested = ingest_image_source(source, **(encode_options or {}))
+        except (OSError, ValueError) as e:
+            _log_error(f"{error_prefix}: {e}")
+            return None, f"{error_prefix}: {e}"
+        _log_info(f"图片输入：{ingested['format']}，{ingested['payload_bytes'] / 1024:.1f} KB，"
+                  f"{'已重新编码' if ingested['reencoded'] else '原样发送'}。")
+        return ingested["data_url"], None
+
+    @staticmethod
+    def build_messages(prompt_text, image_data):
+        """构建识图请求的消息列表（单条用户消息，包含文本和图片两部分）。"""
+        content_parts = [{"type": "text", "text": prompt_text}]
+        content_parts.append({"type": "image_url", "image_url": {"url": image_data}})
+        return [{"role": "user", "content": content_parts}]
+
+    @classmethod
+    def build_request(cls, model_name, prompt_text, image_data):
+        """构建传给 complete_chat 的识图请求参数（识图请求不设置采样参数），离线批处理也使用它。"""
+        return {"model_name": model_name, "messages": cls.build_messages(prompt_text, image_data)}
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -316,33 +1043,144 @@ class GLM_Vision_ImageToPrompt:
             "optional": {
                 "image_url": ("STRING", {
                     "default": "",
-                    "placeholder": "请输入图片URL (与Base64/IMAGE三选一)"
+                    "placeholder": "请输入图片URL、data URI 或本地图片路径 (与Base64/IMAGE三选一)"
                 }),
                 "image_base64": ("STRING", {
                     "multiline": True,
                     "default": "",
-                    "placeholder": "请输入Base64编码的图片数据 (与URL/IMAGE三选一)"
+                    "placeholder": "请输入Base64编码的图片数据、data URI 或本地图片路径 (与URL/IMAGE三选一)"
                 }),
                 "image_input": ("IMAGE", {"optional": True, "tooltip": "直接输入ComfyUI IMAGE对象 (与URL/Base64三选一)"}), # 新增IMAGE输入
+                "use_cache": ("BOOLEAN", {"default": False, "tooltip": "开启后，模型、最终消息和采样参数完全相同的请求直接返回缓存的响应（内存+磁盘），不再调用API"}),
+                "batch_mode": ("BOOLEAN", {"default": False, "tooltip": "开启后为 IMAGE 批次中的每一帧分别生成描述（并发调用），prompt_list 按顺序输出每帧结果，GETPrompt 输出按行拼接的结果"}),
+                "max_concurrency": ("INT", {"default": VISION_BATCH_DEFAULT_CONCURRENCY, "min": 1, "max": 32, "tooltip": "批量模式下同时进行的 API 调用数"}),
+                "dedup_frames": ("BOOLEAN", {"default": False, "tooltip": "批量模式下先按感知哈希合并近似重复的帧，每组只调用一次 API，结果分发给组内每一帧"}),
+                "dedup_threshold": ("INT", {"default": VISION_DEDUP_DEFAULT_THRESHOLD, "min": 0, "max": 32, "tooltip": "帧去重的汉明距离阈值（64 位哈希），越大合并越激进，0 只合并哈希完全相同的帧"}),
+                "image_format": (list(_IMAGE_MIME_TYPES.keys()), {"default": IMAGE_ENCODE_FORMAT, "tooltip": "IMAGE 输入上传前的编码格式：JPEG/WEBP 体积小，PNG 无损"}),
+                "image_quality": ("INT", {"default": IMAGE_ENCODE_QUALITY, "min": 1, "max": 100, "tooltip": "JPEG/WEBP 编码质量"}),
+                "max_image_edge": ("INT", {"default": IMAGE_ENCODE_MAX_EDGE, "min": 0, "max": 8192, "step": 64, "tooltip": "IMAGE 输入长边超过该值时等比缩小后再上传，0 表示不缩放"}),
+                "contact_sheet": ("BOOLEAN", {"default": False, "tooltip": "批量模式下把多帧拼成一张带编号的网格图，一次请求描述多帧，再按编号拆回每帧的描述；解析失败的帧逐帧重新描述"}),
+                "contact_sheet_frames": ("INT", {"default": VISION_CONTACT_SHEET_FRAMES, "min": 2, "max": 16, "tooltip": "拼图模式下每张网格图包含的帧数"}),
+                "contact_sheet_max_edge": ("INT", {"default": VISION_CONTACT_SHEET_MAX_EDGE, "min": 256, "max": 8192, "step": 64, "tooltip": "网格图长边上限（像素），格子按比例缩小以满足该限制"}),
+                "use_batch_results": _USE_BATCH_RESULTS_INPUT,
+                **_LATENCY_CONTROL_INPUTS,
             }
         }
 
-    def generate_prompt(self, api_key, prompt_override, model_name, seed, image_url="", image_base64="", image_prompt_preset="", image_input=None):
+    @classmethod
+    def IS_CHANGED(cls, prompt_override="", model_name="", image_url="", image_base64="", image_prompt_preset="", **kwargs):
+        """
+        返回请求指纹：识图提示词、模型和图片 URL / Base64 / 本地文件不变时视为未变化。
+        ComfyUI 只把控件上的常量值传给 IS_CHANGED，连线输入（如 IMAGE）不会传入；
+        IMAGE 内容变化时上游节点本身会触发重新执行，响应缓存则按 generate_prompt 中编码后的图片数据计算指纹。
+        """
+        prompt_text = cls.resolve_image_prompt(prompt_override, image_prompt_preset, verbose=False)
+        image_identity = (image_base64 or "").strip() or (image_url or "").strip()
+        if is_local_image_path(image_identity):
+            # 本地文件路径不变但内容可能变化，把文件的修改时间和大小计入指纹
+            try:
+                st = os.stat(os.path.expanduser(image_identity))
+            except OSError:
+                # 检查之后文件被删除或改名：视为已变化，不能让提示词校验失败
+                return float("nan")
+            image_identity = f"{image_identity}|{st.st_mtime_ns}|{st.st_size}"
+        return make_request_fingerprint(model_name, cls.build_messages(prompt_text, image_identity))
+
+    def _caption(self, final_api_key, model_name, prompt_text, image_data, use_cache, use_batch_results=False):
+        """
+        发起一次识图请求并返回描述文本（可选读取离线批处理结果、读写响应缓存）。调用失败时抛出异常。
+        """
+        request = self.build_request(model_name, prompt_text, image_data)
+        return str(complete_chat(final_api_key, **request, use_cache=use_cache, use_batch_results=use_batch_results))
+
+    def _caption_batch(self, final_api_key, model_name, prompt_text, image_data_list, use_cache, max_concurrency,
+                       use_batch_results=False):
+        """
+        在有界线程池中并发为每一帧生成描述，按输入顺序返回结果列表。
+        单帧失败时该帧的结果为错误信息，不影响其他帧。
+        """
+        def caption_frame(index):
+            try:
+                return self._caption(final_api_key, model_name, prompt_text, image_data_list[index], use_cache,
+                                     use_batch_results)
+            except Exception as e:
+                error_message = f"GLM-4V API 调用失败 (第 {index} 帧): {e}"
+                _log_error(error_message)
+                return error_message
+
+        max_workers = max(1, min(max_concurrency, len(image_data_list)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="glm_vision") as executor:
+            return _map_in_context(executor, caption_frame, range(len(image_data_list)))
+
+    def _caption_contact_sheets(self, final_api_key, model_name, prompt_text, image_input, frame_indices,
+                                frames_per_sheet, sheet_max_edge, encode_options, use_cache, max_concurrency,
+                                use_batch_results=False):
+        """
+        拼图模式：每 frames_per_sheet 帧拼成一张带编号的网格图，一次请求描述一组帧，再按编号拆回每帧的描述。
+        某组请求失败或部分格子无法解析时，这些帧逐帧回退为单独请求（失败时该帧结果为错误信息）。
+        按 frame_indices 的顺序返回描述列表，并记录相比逐帧描述节省的请求数。
+        """
+        groups = [frame_indices[i:i + frames_per_sheet] for i in range(0, len(frame_indices), frames_per_sheet)]
+
+        def caption_group(group):
+            parsed = {}
+            requests = 0
+            if len(group) > 1:
+                try:
+                    sheet = build_contact_sheet(image_input, group, sheet_max_edge, encode_options["image_format"],
+                                                encode_options["quality"])
+                    sheet_prompt = build_contact_sheet_prompt(prompt_text, len(group), sheet["columns"], sheet["rows"])
+                    requests += 1
+                    parsed = parse_contact_sheet_response(
+                        self._caption(final_api_key, model_name, sheet_prompt, sheet["data_url"], use_cache,
+                                      use_batch_results), len(group))
+                except Exception as e:
+                    _log_error(f"GLM-4V 拼图请求失败: {e}，改为逐帧描述。")
+            missing = [position for position in range(len(group)) if position not in parsed]
+            if missing and parsed:
+                _log_warning(f"{len(missing)} 帧未能从拼图响应中解析，逐帧重新描述。")
+            for position in missing:
+                requests += 1
+                try:
+                    image_data = encode_image_frame(image_input, group[position], **encode_options)["data_url"]
+                    parsed[position] = self._caption(final_api_key, model_name, prompt_text, image_data, use_cache,
+                                                     use_batch_results)
+                except Exception as e:
+                    error_message = f"GLM-4V API 调用失败 (第 {group[position]} 帧): {e}"
+                    _log_error(error_message)
+                    parsed[position] = error_message
+            return [parsed[position] for position in range(len(group))], requests, len(missing) if len(group) > 1 else 0
+
+        max_workers = max(1, min(max_concurrency, len(groups)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="glm_vision") as executor:
+            group_results = _map_in_context(executor, caption_group, groups)
+
+        results = [text for texts, _, _ in group_results for text in texts]
+        requests = sum(count for _, count, _ in group_results)
+        fallbacks = sum(count for _, _, count in group_results)
+        saved_calls = len(frame_indices) - requests
+        _record_metric("contact_sheet_saved_calls", saved_calls)
+        _log_info(f"拼图模式：{len(frame_indices)} 帧拼成 {len(groups)} 张网格图，共 {requests} 次请求"
+                  f"（其中逐帧回退 {fallbacks} 次），比逐帧描述节省 {saved_calls} 次。")
+        return results
+
+    @_instrument_node
+    def generate_prompt(self, api_key, prompt_override, model_name, seed, image_url="", image_base64="", image_prompt_preset="", image_input=None, use_cache=False,
+                        batch_mode=False, max_concurrency=VISION_BATCH_DEFAULT_CONCURRENCY,
+                        image_format=IMAGE_ENCODE_FORMAT, image_quality=IMAGE_ENCODE_QUALITY, max_image_edge=IMAGE_ENCODE_MAX_EDGE,
+                        dedup_frames=False, dedup_threshold=VISION_DEDUP_DEFAULT_THRESHOLD, use_batch_results=False,
+                        contact_sheet=False, contact_sheet_frames=VISION_CONTACT_SHEET_FRAMES,
+                        contact_sheet_max_edge=VISION_CONTACT_SHEET_MAX_EDGE):
         """
         执行智谱AI GLM-4V 识图生成提示词功能。
+        batch_mode 开启且输入为 IMAGE 批次时，为每一帧分别生成描述；
+        dedup_frames 开启时近似重复的帧只描述一次，结果分发给组内每一帧；
+        contact_sheet 开启时多帧拼成一张网格图一次描述。
         """
         final_api_key = api_key.strip() or get_zhipuai_api_key()
         if not final_api_key:
             _log_error("API Key 未提供。")
-            return ("API Key 未提供。",)
-        _log_info("初始化智谱AI客户端。")
-
-        try:
-            client = ZhipuAI(api_key=final_api_key)
-        except Exception as e:
-            _log_error(f"客户端初始化失败: {e}")
-            return (f"客户端初始化失败: {e}",)
-
+            return ("API Key 未提供。", ["API Key 未提供。"])
         # --- 输入校验：图片URL、Base64图片或IMAGE对象至少提供一个 ---
         image_url_provided = bool(image_url and image_url.strip())
         image_base64_provided = bool(image_base64 and image_base64.strip())
@@ -350,98 +1188,94 @@ class GLM_Vision_ImageToPrompt:
 
         if not (image_url_provided or image_base64_provided or image_input_provided):
             _log_error("必须提供图片URL、Base64数据或IMAGE对象。")
-            return ("必须提供图片URL、Base64数据或IMAGE对象。",)
+            return ("必须提供图片URL、Base64数据或IMAGE对象。", ["必须提供图片URL、Base64数据或IMAGE对象。"])
 
         # --- 处理图片输入优先级：IMAGE > Base64 > URL ---
-        final_image_data = None
-        if image_input_provided:
-            _log_info("检测到 IMAGE 对象输入，正在转换为 Base64。")
-            try:
-                # ComfyUI的IMAGE是PyTorch张量，范围[0,1]，形状[B, H, W, C]
-                # 转换为PIL Image，范围[0,255]，形状[H, W, C]
-                i = 255. * image_input.cpu().numpy()
-                img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8)[0]) # 取第一个batch的图片
-                
-                buffered = io.BytesIO()
-                img.save(buffered, format="PNG") # 通常PNG是无损且支持透明度
-                final_image_data = "data:image/png;base64," + base64.b64encode(buffered.getvalue()).decode('utf-8')
-                _log_info("IMAGE 对象成功转换为 Base64。")
-            except Exception as e:
-                _log_error(f"将 IMAGE 对象转换为 Base64 失败: {e}")
-                return (f"将 IMAGE 对象转换为 Base64 失败: {e}",)
-        elif image_base64_provided:
-            _log_info("检测到 Base64 字符串输入。")
-            if image_base64.startswith("data:image/"):
-                final_image_data = image_base64
+        encode_options = {"image_format": image_format, "quality": image_quality, "max_edge": max_image_edge}
+        frame_assignment = None
+        sheet_frames = None  # 拼图模式下需要描述的帧索引
+        image_data_list = []
+        if batch_mode and image_input_provided:
+            frame_indices = None
+            if dedup_frames and image_input.shape[0] > 1:
+                try:
+                    frame_indices, frame_assignment = cluster_similar_frames(image_input, dedup_threshold)
+                    saved_calls = len(frame_assignment) - len(frame_indices)
+                    _record_metric("dedup_saved_calls", saved_calls)
+                    _log_info(f"帧去重：{len(frame_assignment)} 帧合并为 {len(frame_indices)} 组，节省 {saved_calls} 次 API 调用。")
+                except Exception as e:
+                    _log_warning(f"帧去重失败，将为每一帧分别生成描述: {e}")
+                    frame_indices, frame_assignment = None, None
+            if frame_indices is None:
+                frame_indices = list(range(image_input.shape[0]))
+            if contact_sheet and len(frame_indices) > 1:
+                sheet_frames = frame_indices
             else:
-                _log_warning("Base64字符串缺少前缀，尝试添加默认JPEG前缀。")
+                _log_info("批量模式：正在将 IMAGE 批次的每一帧转换为 Base64。")
                 try:
-                    # 尝试解码验证有效性，并添加常见前缀
-                    base64.b64decode(image_base64.split(',')[-1])
-                    final_image_data = f"data:image/jpeg;base64,{image_base64}"
-                except Exception as decode_e:
-                    _log_error(f"Base64解码失败: {decode_e}")
-                    return ("提供的Base64图片数据无效。",)
-        elif image_url_provided:
-            _log_info(f"检测到图片URL输入: {image_url}")
-            final_image_data = image_url
+                    encoded = encode_image_frames(image_input, frame_indices, max_workers=max_concurrency, **encode_options)
+                    image_data_list = [r["data_url"] for r in encoded]
+                except Exception as e:
+                    _log_error(f"将 IMAGE 对象转换为 Base64 失败: {e}")
+                    return (f"将 IMAGE 对象转换为 Base64 失败: {e}", [f"将 IMAGE 对象转换为 Base64 失败: {e}"])
+        else:
+            final_image_data, image_error = self.prepare_image_data(image_url, image_base64, image_input, encode_options)
+            if image_error:
+                return (image_error, [image_error])
+            image_data_list = [final_image_data] if final_image_data else []
 
-        if not final_image_data:
+        if sheet_frames is None and not image_data_list:
             _log_error("未能获取有效的图片数据。")
-            return ("未能获取有效的图片数据。",)
+            return ("未能获取有效的图片数据。", ["未能获取有效的图片数据。"])
 
         # --- 识图提示词确定优先级 ---
-        final_prompt_text = ""
-        available_prompts = self.get_image_prompts()
-
-        if prompt_override and prompt_override.strip():
-            final_prompt_text = prompt_override.strip()
-            _log_info("使用 'prompt_override'。")
-        elif image_prompt_preset in available_prompts:
-            final_prompt_text = available_prompts[image_prompt_preset]
-            _log_info(f"使用预设识图提示词: '{image_prompt_preset}'。")
-        else:
-            if available_prompts:
-                final_prompt_text = list(available_prompts.values())[0]
-                _log_warning(f"预设 '{image_prompt_preset}' 未找到，使用第一个可用预设。")
-            else:
-                final_prompt_text = list(self._BUILT_IN_IMAGE_PROMPTS.values())[0]
-                _log_warning("无可用预设识图提示词，使用内置备用。")
-
-
+        final_prompt_text = self.resolve_image_prompt(prompt_override, image_prompt_preset)
         if not final_prompt_text:
             _log_error("识图提示词不能为空。")
-            return ("识图提示词不能为空。",)
-
-        # 确保 final_prompt_text 确实是字符串
-        if not isinstance(final_prompt_text, str):
-            _log_warning(f"识图提示词类型异常: {type(final_prompt_text)}。尝试转换为字符串。")
-            final_prompt_text = str(final_prompt_text)
-
-        # --- 构建消息内容 ---
-        content_parts = [{"type": "text", "text": final_prompt_text}]
-        content_parts.append({"type": "image_url", "image_url": {"url": final_image_data}})
-
+            return ("识图提示词不能为空。", ["识图提示词不能为空。"])
 
         # --- 种子逻辑 (智谱AI GLM-4V API通常不支持直接的seed参数，此参数仅用于ComfyUI节点内部) ---
         effective_seed = seed if seed != 0 else random.randint(0, 0xffffffffffffffff)
         _log_info(f"内部种子: {effective_seed}。")
         random.seed(effective_seed) # 仅影响节点内部的随机性
 
-        _log_info(f"调用 GLM-4V ({model_name})...")
-    
-        try:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "user", "content": content_parts}]
-            )
-            response_content = str(response.choices[0].message.content)
-            _log_info("GLM-4V 响应成功。")
-            return (response_content,)
-        except Exception as e:
-            error_message = f"GLM-4V API 调用失败: {e}"
-            _log_error(error_message)
-            return (error_message,)
+        if sheet_frames is not None:
+            _log_info(f"调用 GLM-4V ({model_name}) 以拼图模式为 {len(sheet_frames)} 帧生成描述，"
+                      f"每张 {contact_sheet_frames} 帧，并发数 {max_concurrency}...")
+            results = self._caption_contact_sheets(final_api_key, model_name, final_prompt_text, image_input,
+                                                   sheet_frames, contact_sheet_frames, contact_sheet_max_edge,
+                                                   encode_options, use_cache, max_concurrency, use_batch_results)
+            _log_info("GLM-4V 批量描述完成。")
+        elif len(image_data_list) > 1:
+            _log_info(f"调用 GLM-4V ({model_name}) 为 {len(image_data_list)} 帧生成描述，并发数 {max_concurrency}...")
+            results = self._caption_batch(final_api_key, model_name, final_prompt_text, image_data_list, use_cache,
+                                          max_concurrency, use_batch_results)
+            _log_info("GLM-4V 批量描述完成。")
+        else:
+            _log_info(f"调用 GLM-4V ({model_name})...")
+
+            try:
+                response_content = self._caption(final_api_key, model_name, final_prompt_text, image_data_list[0],
+                                                 use_cache, use_batch_results)
+                _log_info("GLM-4V 响应成功。")
+                results = [response_content]
+            except Exception as e:
+                error_message = f"GLM-4V API 调用失败: {e}"
+                _log_error(error_message)
+                results = [error_message]
+
+        if frame_assignment is not None:
+            # 把每组代表帧的描述分发回组内的每一帧
+            results = [results[cluster] for cluster in frame_assignment]
+        return (BATCH_JOIN_SEPARATOR.join(results), results)
+
+# --- 翻译记忆 ---
+
+_TRANSLATION_MEMORY = TranslationMemory()
+
+def get_translation_memory_stats():
+    """返回翻译记忆的统计信息。"""
+    return _TRANSLATION_MEMORY.get_stats()
 
 # --- GLM文本翻译节点 ---
 
@@ -454,16 +1288,57 @@ class GLM_Translation_Text:
     RETURN_NAMES = ("translated_text",)
     FUNCTION = "glm_translate_function"
 
+    @staticmethod
+    def build_messages(text_input, from_language, to_language):
+        """构建翻译请求的消息列表。"""
+        # 构建翻译系统提示词和用户输入
+        # 智谱AI本身可能没有专门的翻译API，通常通过指令LLM来完成
+        system_prompt = f"你是一个专业的翻译助手。请将用户提供的文本从{from_language}翻译成{to_language}。只输出翻译结果，不要包含任何解释性文字。"
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text_input}
+        ]
+
     @classmethod
-    def INPUT_TYPES(s):
-        # 尝试从config.json加载默认翻译语言
-        config_path = os.path.join(CURRENT_DIR, CONFIG_FILE_NAME)
+    def build_request(cls, text_input, from_language, to_language, model_name, temperature, top_p, max_tokens):
+        """构建传给 complete_chat 的翻译请求参数，max_tokens 为 0 时按原文长度自动估算。"""
+        messages = cls.build_messages(text_input, from_language, to_language)
+        if not max_tokens:
+            max_tokens = plan_max_tokens("translation", estimate_tokens(text_input), model_name,
+                                         _estimate_message_tokens(messages))
+        return {"model_name": model_name, "messages": messages, "temperature": temperature, "top_p": top_p,
+                "max_tokens": max_tokens}
+
+    @staticmethod
+    def plan_chunks(text_input, max_tokens):
+        """
+        译文按原文的 BATCH_TRANSLATION_EXPANSION 倍估算，超出输出预算的安全比例时按句子切分，
+        返回块列表；不需要切分时返回 None。
+        """
+        output_budget = max_tokens or AUTO_MAX_TOKENS_LIMIT
+        chunk_tokens = max(1, int(output_budget * BATCH_TRANSLATION_BUDGET_RATIO / BATCH_TRANSLATION_EXPANSION))
+        if estimate_tokens(text_input) <= chunk_tokens:
+            return None
+        return plan_text_chunks(text_input, chunk_tokens)
+
+    @classmethod
+    def build_requests(cls, text_input, from_language, to_language, model_name, temperature, top_p, max_tokens):
+        """返回节点翻译 text_input 时会发送的全部请求参数（长文本每块一个，空白块不发送），供离线批处理使用。"""
+        if not text_input or not text_input.strip():
+            return []
+        chunks = cls.plan_chunks(text_input, max_tokens) or [text_input]
+        return [cls.build_request(chunk, from_language, to_language, model_name, temperature, top_p, max_tokens)
+                for chunk in chunks if chunk.strip()]
+
+    @staticmethod
+    def get_default_languages():
+        """从config.json读取默认的源语言和目标语言，返回 (from, to)。"""
+        # 尝试从config.json加载默认翻译语言（读取结果有缓存，刷新节点列表时不会重复解析）
         default_from_lang = "zh"
         default_to_lang = "en"
         try:
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
+            config = _CONFIG_CACHE.load()
+            if config is not None:
                 default_from_lang = config.get("from_translate", default_from_lang)
                 default_to_lang = config.get("to_translate", default_to_lang)
         except Exception as e:
@@ -474,6 +1349,11 @@ class GLM_Translation_Text:
             default_from_lang = "zh"
         if default_to_lang not in SUPPORTED_TRANSLATION_LANGS:
             default_to_lang = "en"
+        return default_from_lang, default_to_lang
+
+    @classmethod
+    def INPUT_TYPES(s):
+        default_from_lang, default_to_lang = s.get_default_languages()
 
         return {
             "required": {
@@ -484,70 +1364,659 @@ class GLM_Translation_Text:
                 "model_name": ("STRING", {"default": "GLM-4.5-Flash", "placeholder": "请输入模型名称，如 GLM-4.5-Flash"}),
                 "temperature": ("FLOAT", {"default": 0.1, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "翻译任务建议较低的温度值以保持准确性"}),
                 "top_p": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 1.0, "step": 0.01}),
-                "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 4096}),
+                "max_tokens": ("INT", {"default": 1024, "min": 0, "max": 4096, "tooltip": "输出 token 上限；设置为0时根据输入长度和任务类型自动估算"}),
                 "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff, "tooltip": "设置为0时，每次运行生成随机种子；设置为其他值时，使用固定种子。注意：此种子仅影响ComfyUI节点内部的随机数生成，不直接影响智谱AI模型的输出结果。"}),
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": False, "tooltip": "开启后，模型、最终消息和采样参数完全相同的请求直接返回缓存的响应（内存+磁盘），不再调用API"}),
+                "stream": ("BOOLEAN", {"default": False, "tooltip": "开启后以流式方式接收响应，生成过程中实时显示部分文本，并记录首字延迟和生成速度"}),
+                "stop_string": ("STRING", {"default": "", "multiline": False, "placeholder": "可选：流式模式下出现该字符串时提前结束生成"}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 32, "tooltip": "长文本按句子切分为多块翻译时同时进行的请求数，1 表示按顺序逐块翻译"}),
+                "translation_memory": ("BOOLEAN", {"default": False, "tooltip": "开启后按句子翻译并把译文保存到翻译记忆（磁盘）；修改文本后再次翻译时只发送新增或修改的句子，其余句子复用之前的译文。该模式下不使用流式输出"}),
+                "use_batch_results": _USE_BATCH_RESULTS_INPUT,
+                **_SEMANTIC_CACHE_INPUTS,
+                **_LATENCY_CONTROL_INPUTS,
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
             }
         }
 
-    def glm_translate_function(self, text_input, from_language, to_language, api_key, model_name, temperature, top_p, max_tokens, seed):
+    @classmethod
+    def IS_CHANGED(cls, text_input="", from_language="", to_language="", model_name="", temperature=None, top_p=None, max_tokens=None, **kwargs):
+        """返回最终翻译请求的指纹，seed 不参与计算。"""
+        messages = cls.build_messages(text_input, from_language, to_language)
+        return make_request_fingerprint(model_name, messages, temperature, top_p, max_tokens)
+
+    def _translate_chunks(self, final_api_key, chunks, from_language, to_language, model_name, temperature, top_p,
+                          max_tokens, use_cache, max_concurrency, use_batch_results=False, raise_errors=False,
+                          semantic_threshold=0.0, stream=False, progress=None):
+        """
+        分块翻译长文本，按原顺序拼接：每块末尾的空白（如换行）原样保留，
+        某块失败时该位置为错误信息（raise_errors 为 True 时改为抛出异常）。
+        每块开始前检查用户是否中断（中断后剩余的块不再发送），每块完成后把已完成的连续前缀推送到进度；
+        stream 开启时按顺序逐块流式翻译，进度中显示已完成的块加上当前块的部分译文。
+        """
+        if stream:
+            max_concurrency = 1
+        _log_info(f"输入较长，按句子切分为 {len(chunks)} 块翻译，并发数 {max_concurrency}...")
+        joiner = "" if to_language in ("zh", "ja") else " "
+        translated_parts = [None] * len(chunks)
+        parts_lock = threading.Lock()
+
+        def completed_prefix():
+            prefix = []
+            for part in translated_parts:
+                if part is None:
+                    break
+                prefix.append(part)
+            return "".join(prefix)
+
+        def translate(index):
+            chunk = chunks[index]
+            if progress is not None and progress.interrupted():
+                return
+            if chunk.strip():
+                request = self.build_request(chunk, from_language, to_language, model_name, temperature, top_p, max_tokens)
+                chunk_progress = _PrefixedProgress(progress, completed_prefix) if stream and progress is not None else None
+                try:
+                    translated = complete_chat(final_api_key, **request, use_cache=use_cache, stream=stream,
+                                               progress=chunk_progress, use_batch_results=use_batch_results,
+                                               semantic_threshold=semantic_threshold)
+                except Exception as e:
+                    if raise_errors:
+                        raise
+                    translated = f"GLM API 翻译调用失败: {e}"
+                    _log_error(translated)
+                trailing = chunk[len(chunk.rstrip()):]
+                chunk = translated.strip() + (trailing or joiner)
+            with parts_lock:
+                translated_parts[index] = chunk
+                prefix = completed_prefix()
+            if progress is not None:
+                progress.push_text(prefix.rstrip(), force=True)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks))), thread_name_prefix="glm_translate") as executor:
+            _map_in_context(executor, translate, range(len(chunks)))
+        _log_info("GLM 分块翻译完成。")
+        return "".join(part for part in translated_parts if part is not None).rstrip()
+
+    def _translate_with_memory(self, final_api_key, text_input, from_language, to_language, model_name, temperature,
+                               top_p, max_tokens, use_cache, max_concurrency, progress=None):
+        """
+        使用翻译记忆按句子翻译：记忆中已有的句子直接复用，新增或修改的句子去重后按 GLM_Translation_Batch 的方式
+        打包成尽量少的请求，每个请求完成后立即写入记忆；最后按原顺序拼接，每句末尾的空白（如换行）原样保留。
+        每个请求开始前检查用户是否中断，完成后把已能拼出的连续前缀推送到进度。
+        任一请求失败时抛出异常（已完成的请求结果仍会保存，重试时不再发送）。
+        """
+        pieces = split_sentences(text_input)
+        sentences = [piece.strip() for piece in pieces if piece.strip()]  # 命中率只按非空句计算
+        found = _TRANSLATION_MEMORY.get_many(from_language, to_language, model_name, sentences)
+        hits = sum(1 for sentence in sentences if sentence in found)
+        saved_tokens = sum(TranslationMemory.estimate_saved_tokens(sentence, found[sentence])
+                           for sentence in sentences if sentence in found)
+        _record_metric("translation_memory_hits", hits)
+        _record_metric("translation_memory_misses", len(sentences) - hits)
+        _record_metric("translation_memory_saved_tokens", saved_tokens)
+        missing = list(dict.fromkeys(sentence for sentence in sentences if sentence not in found))
+        hit_ratio = hits / len(sentences) if sentences else 0.0
+        _log_info(f"翻译记忆命中 {hits}/{len(sentences)} 句（{hit_ratio:.0%}），估算节省约 {saved_tokens} tokens，"
+                  f"需要翻译 {len(missing)} 句。")
+
+        joiner = "" if to_language in ("zh", "ja") else " "
+        found_lock = threading.Lock()
+
+        def assemble(partial=False):
+            """按原顺序拼接译文；partial 为 True 时只拼到第一句还没有译文的句子为止。"""
+            parts = []
+            for piece in pieces:
+                if not piece.strip():
+                    parts.append(piece)
+                    continue
+                translation = found.get(piece.strip())
+                if translation is None:
+                    if partial:
+                        break
+                    raise KeyError(piece.strip())
+                trailing = piece[len(piece.rstrip()):]
+                parts.append(translation + (trailing or joiner))
+            return "".join(parts).strip()
+
+        if missing:
+            batch_node = GLM_Translation_Batch()
+            chunk_max_tokens = max_tokens or AUTO_MAX_TOKENS_LIMIT
+            chunks = GLM_Translation_Batch.plan_chunks(missing, chunk_max_tokens)
+
+            def translate(indices):
+                if progress is not None and progress.interrupted():
+                    return
+                results = batch_node._translate_chunk(final_api_key, missing, indices, from_language, to_language,
+                                                      model_name, temperature, top_p, chunk_max_tokens, use_cache,
+                                                      raise_errors=True)
+                pairs = [(missing[index], results[index].strip()) for index in indices]
+                _TRANSLATION_MEMORY.put_many(from_language, to_language, model_name, pairs)
+                with found_lock:
+                    found.update(pairs)
+                    prefix = assemble(partial=True)
+                if progress is not None:
+                    progress.push_text(prefix, force=True)
+
+            _log_info(f"调用 GLM ({model_name}) 翻译 {len(missing)} 句，打包为 {len(chunks)} 个请求...")
+            with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks))), thread_name_prefix="glm_translate") as executor:
+                _map_in_context(executor, translate, chunks)
+        return assemble(partial=progress is not None and progress.interrupted())
+
+    def translate(self, final_api_key, text_input, from_language, to_language, model_name, temperature, top_p,
+                  max_tokens, use_cache=False, max_concurrency=1, use_batch_results=False, semantic_threshold=0.0,
+                  translation_memory=False):
+        """
+        非流式翻译一段文本（长文本与节点一样自动分块），任一请求失败时抛出异常。
+        供命令行等脱离节点图的调用方使用。
+        """
+        if translation_memory:
+            return self._translate_with_memory(final_api_key, text_input, from_language, to_language, model_name,
+                                               temperature, top_p, max_tokens, use_cache, max_concurrency)
+        chunks = self.plan_chunks(text_input, max_tokens)
+        if chunks is not None:
+            return self._translate_chunks(final_api_key, chunks, from_language, to_language, model_name, temperature,
+                                          top_p, max_tokens, use_cache, max_concurrency, use_batch_results,
+                                          raise_errors=True, semantic_threshold=semantic_threshold)
+        request = self.build_request(text_input, from_language, to_language, model_name, temperature, top_p, max_tokens)
+        return complete_chat(final_api_key, **request, use_cache=use_cache, use_batch_results=use_batch_results,
+                             semantic_threshold=semantic_threshold)
+
+    @_instrument_node
+    def glm_translate_function(self, text_input, from_language, to_language, api_key, model_name, temperature, top_p, max_tokens, seed, use_cache=False,
+                               stream=False, stop_string="", max_concurrency=4, use_batch_results=False,
+                               semantic_cache=False, semantic_threshold=SEMANTIC_CACHE_DEFAULT_THRESHOLD,
+                               translation_memory=False, unique_id=None):
         """
         执行智谱AI GLM文本翻译功能。
+        译文可能超出输出上限的长文本按句子切分为多块分别翻译，再按原顺序拼接。
         """
+        semantic_threshold = semantic_threshold if semantic_cache else 0.0
         final_api_key = api_key.strip() or get_zhipuai_api_key()
         if not final_api_key:
             _log_error("API Key 未提供。")
             return ("API Key 未提供。",)
 
-        _log_info("初始化智谱AI客户端。")
-        try:
-            client = ZhipuAI(api_key=final_api_key)
-        except Exception as e:
-            _log_error(f"客户端初始化失败: {e}")
-            return (f"客户端初始化失败: {e}",)
 
         if not text_input or not text_input.strip():
             _log_warning("输入文本为空，不进行翻译。")
             return ("",)
 
-        # 构建翻译系统提示词和用户输入
-        # 智谱AI本身可能没有专门的翻译API，通常通过指令LLM来完成
-        system_prompt = f"你是一个专业的翻译助手。请将用户提供的文本从{from_language}翻译成{to_language}。只输出翻译结果，不要包含任何解释性文字。"
-        user_message = text_input
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ]
-
         # --- 种子逻辑 ---
         effective_seed = seed if seed != 0 else random.randint(0, 0xffffffffffffffff)
         _log_info(f"内部种子: {effective_seed}。")
         random.seed(effective_seed) # 仅影响节点内部的随机性
 
+        progress = _ComfyProgress(unique_id)
+        if translation_memory:
+            if stream:
+                _log_info("翻译记忆模式下按句子打包翻译，不使用流式输出，完成一组句子后推送一次进度。")
+            try:
+                translated_text = self._translate_with_memory(final_api_key, text_input, from_language, to_language,
+                                                              model_name, temperature, top_p, max_tokens, use_cache,
+                                                              max_concurrency, progress=progress)
+            except Exception as e:
+                error_message = f"GLM API 翻译调用失败: {e}"
+                _log_error(error_message)
+                return (error_message,)
+            progress.raise_if_interrupted()
+            _log_info("GLM 翻译完成。")
+            return (translated_text,)
+
+        chunks = self.plan_chunks(text_input, max_tokens)
+        if chunks is not None:
+            if stop_string:
+                _log_warning("长文本分块翻译时不使用 stop_string。")
+            translated_text = self._translate_chunks(final_api_key, chunks, from_language, to_language, model_name,
+                                                     temperature, top_p, max_tokens, use_cache, max_concurrency,
+                                                     use_batch_results, semantic_threshold=semantic_threshold,
+                                                     stream=stream, progress=progress)
+            progress.raise_if_interrupted()
+            return (translated_text,)
+        request = self.build_request(text_input, from_language, to_language, model_name, temperature, top_p, max_tokens)
+        if not max_tokens:
+            _log_info(f"自动设置 max_tokens = {request['max_tokens']}。")
+
         _log_info(f"调用 GLM ({model_name}) 进行翻译...")
         _log_info(f"  从 '{from_language}' 翻译到 '{to_language}'。")
 
         try:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                max_tokens=max_tokens,
+            translated_text = complete_chat(
+                final_api_key, **request,
+                use_cache=use_cache, stream=stream, stop_string=stop_string, progress=progress,
+                use_batch_results=use_batch_results, semantic_threshold=semantic_threshold,
             )
-            translated_text = response.choices[0].message.content
             _log_info("GLM 翻译响应成功。")
-            return (translated_text,)
         except Exception as e:
             error_message = f"GLM API 翻译调用失败: {e}"
             _log_error(error_message)
             return (error_message,)
+        progress.raise_if_interrupted()
+        return (translated_text,)
+
+# --- GLM批量翻译节点 ---
+
+class GLM_Translation_Batch:
+    """
+    一个把多段文本打包进尽量少的请求进行翻译的节点。
+    输入为字符串列表（每项一段）或多行文本（每行一段）。各段以带编号的标签打包，
+    按 max_tokens 估算每个请求能容纳的段数，多个请求并发执行；
+    某段在响应中解析失败时单独重新翻译该段。
+    """
+    CATEGORY = "GLM"
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("translated_text", "translated_list")
+    OUTPUT_IS_LIST = (False, True)
+    INPUT_IS_LIST = True
+    FUNCTION = "glm_batch_translate_function"
+
+    _SEGMENT_PATTERN = re.compile(r'<s id="(\d+)">(.*?)</s>', re.DOTALL)
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        default_from_lang, default_to_lang = GLM_Translation_Text.get_default_languages()
+        return {
+            "required": {
+                "text_input": ("STRING", {"multiline": True, "default": "你好，世界！\n一只小狗在草地上玩耍。", "placeholder": "每行一段待翻译文本；也可以连接字符串列表，每项作为一段"}),
+                "from_language": (SUPPORTED_TRANSLATION_LANGS, {"default": default_from_lang, "tooltip": "源语言"}),
+                "to_language": (SUPPORTED_TRANSLATION_LANGS, {"default": default_to_lang, "tooltip": "目标语言"}),
+                "api_key": ("STRING", {"default": "", "multiline": False, "placeholder": "可选：智谱AI API Key (留空则尝试从环境变量或config.json读取)"}),
+                "model_name": ("STRING", {"default": "GLM-4.5-Flash", "placeholder": "请输入模型名称，如 GLM-4.5-Flash"}),
+                "temperature": ("FLOAT", {"default": 0.1, "min": 0.0, "max": 1.0, "step": 0.01, "tooltip": "翻译任务建议较低的温度值以保持准确性"}),
+                "top_p": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "max_tokens": ("INT", {"default": 4096, "min": 0, "max": 4096, "tooltip": "单个请求的输出上限，决定每个请求能打包多少段；设置为0时使用自动上限"}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 32, "tooltip": "同时进行的请求数"}),
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": False, "tooltip": "开启后，完全相同的打包请求直接返回缓存的响应"}),
+                **_LATENCY_CONTROL_INPUTS,
+            }
+        }
+
+    @staticmethod
+    def split_segments(text_inputs):
+        """字符串列表中每项为一段；只有一项时按行拆分。"""
+        if len(text_inputs) == 1:
+            return text_inputs[0].split("\n")
+        return list(text_inputs)
+
+    @staticmethod
+    def plan_chunks(segments, max_tokens, max_segments=BATCH_TRANSLATION_MAX_SEGMENTS):
+        """
+        贪心地把非空段打包成若干组，每组估算的输出 token 不超过 max_tokens 的安全比例。
+        返回 [[段索引, ...], ...]。
+        """
+        budget = max_tokens * BATCH_TRANSLATION_BUDGET_RATIO
+        chunks = []
+        current = []
+        current_tokens = 0
+        for index, segment in enumerate(segments):
+            if not segment.strip():
+                continue
+            # 译文长度按原文的 BATCH_TRANSLATION_EXPANSION 倍估算，再加上标签开销
+            cost = estimate_tokens(segment) * BATCH_TRANSLATION_EXPANSION + BATCH_TRANSLATION_TAG_TOKENS
+            if current and (current_tokens + cost > budget or len(current) >= max_segments):
+                chunks.append(current)
+                current = []
+                current_tokens = 0
+            current.append(index)
+            current_tokens += cost
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def build_messages(segments, indices, from_language, to_language):
+        """构建一组打包翻译请求的消息列表，每段以 <s id="序号">…</s> 标记。"""
+        system_prompt = (
+            f"你是一个专业的翻译助手。请将用户提供的每一段文本从{from_language}翻译成{to_language}。"
+            f"每段文本都包裹在 <s id=\"序号\">…</s> 标签中。请逐段翻译，并用相同序号的标签包裹对应的译文，"
+            f"保持段的数量和顺序不变，不要合并或拆分段落。只输出带标签的译文，不要包含任何解释性文字。"
+        )
+        user_message = "\n".join(f'<s id="{index}">{segments[index]}</s>' for index in indices)
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+
+    @classmethod
+    def parse_response(cls, response_text, indices):
+        """从响应中按序号取出各段译文，返回 {段索引: 译文}，只包含本组中成功解析的段。"""
+        expected = set(indices)
+        parsed = {}
+        for match in cls._SEGMENT_PATTERN.finditer(response_text or ""):
+            index = int(match.group(1))
+            if index in expected and index not in parsed:
+                parsed[index] = match.group(2).strip()
+        return parsed
+
+    def _translate_chunk(self, final_api_key, segments, indices, from_language, to_language, model_name, temperature, top_p, max_tokens, use_cache,
+                         raise_errors=False):
+        """
+        翻译一组段；解析失败的段逐段回退为单独翻译。返回 {段索引: 译文}。
+        单独翻译也失败时该段为错误信息（raise_errors 为 True 时改为抛出异常）。
+        """
+        messages = self.build_messages(segments, indices, from_language, to_language)
+        try:
+            response_text = complete_chat(final_api_key, model_name, messages, temperature=temperature, top_p=top_p,
+                                          max_tokens=max_tokens, use_cache=use_cache)
+            results = self.parse_response(response_text, indices)
+        except Exception as e:
+            _log_error(f"GLM API 批量翻译调用失败: {e}，改为逐段翻译。")
+            results = {}
+
+        missing = [index for index in indices if index not in results]
+        if missing and len(indices) > 1:
+            _log_warning(f"{len(missing)} 段未能从批量响应中解析，逐段重新翻译。")
+        for index in missing:
+            single_messages = GLM_Translation_Text.build_messages(segments[index], from_language, to_language)
+            try:
+                results[index] = complete_chat(final_api_key, model_name, single_messages, temperature=temperature,
+                                               top_p=top_p, max_tokens=max_tokens, use_cache=use_cache)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                error_message = f"GLM API 翻译调用失败: {e}"
+                _log_error(error_message)
+                results[index] = error_message
+        return results
+
+    @_instrument_node
+    def glm_batch_translate_function(self, text_input, from_language, to_language, api_key, model_name, temperature, top_p, max_tokens,
+                                     max_concurrency, use_cache=None):
+        """
+        执行智谱AI GLM批量翻译功能。由于 INPUT_IS_LIST，除 text_input 外的参数都取列表第一项。
+        """
+        from_language, to_language, api_key, model_name = from_language[0], to_language[0], api_key[0], model_name[0]
+        temperature, top_p, max_tokens, max_concurrency = temperature[0], top_p[0], max_tokens[0], max_concurrency[0]
+        use_cache = bool(use_cache[0]) if use_cache else False
+
+        final_api_key = api_key.strip() or get_zhipuai_api_key()
+        if not final_api_key:
+            _log_error("API Key 未提供。")
+            return ("API Key 未提供。", ["API Key 未提供。"])
+
+        max_tokens = max_tokens or AUTO_MAX_TOKENS_LIMIT
+        segments = self.split_segments(text_input)
+        chunks = self.plan_chunks(segments, max_tokens)
+        if not chunks:
+            _log_warning("输入文本为空，不进行翻译。")
+            return ("\n".join(segments), segments)
+
+        translated_count = sum(len(chunk) for chunk in chunks)
+        _log_info(f"调用 GLM ({model_name}) 批量翻译 {translated_count} 段，打包为 {len(chunks)} 个请求，并发数 {max_concurrency}...")
+
+        def translate(chunk):
+            return self._translate_chunk(final_api_key, segments, chunk, from_language, to_language, model_name,
+                                         temperature, top_p, max_tokens, use_cache)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks))), thread_name_prefix="glm_translate") as executor:
+            for chunk_results in _map_in_context(executor, translate, chunks):
+                results.update(chunk_results)
+
+        # 空行原样保留在对应位置
+        translated = [results.get(index, segment) for index, segment in enumerate(segments)]
+        _log_info("GLM 批量翻译完成。")
+        return ("\n".join(translated), translated)
+
+# --- GLM多轮对话节点 ---
+
+class ChatSessionStore:
+    """
+    进程内的多轮对话历史：按会话 ID 保存 (用户消息, 模型回复) 轮次，以及被压缩掉的旧轮次的摘要。
+    会话数和每个会话的轮数都有上限，超出时分别淘汰最久未使用的会话和最早的轮次。
+    """
+
+    def __init__(self, max_sessions=CHAT_SESSION_MAX_SESSIONS, max_turns=CHAT_SESSION_MAX_TURNS):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # 会话 ID -> {"summary": str, "turns": [(user, assistant)]}
+        self._stats = {"evicted_sessions": 0, "dropped_turns": 0, "summarized_turns": 0}
+
+    def _entry_locked(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = self._sessions[session_id] = {"summary": "", "turns": []}
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted_sessions"] += 1
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def snapshot(self, session_id):
+        """返回 (摘要, 轮次列表副本)。"""
+        with self._lock:
+            entry = self._entry_locked(session_id)
+            return entry["summary"], list(entry["turns"])
+
+    def append_turn(self, session_id, user_text, assistant_text):
+        with self._lock:
+            turns = self._entry_locked(session_id)["turns"]
+            turns.append((user_text, assistant_text))
+            if len(turns) > self.max_turns:
+                self._stats["dropped_turns"] += len(turns) - self.max_turns
+                del turns[:len(turns) - self.max_turns]
+
+    def compact(self, session_id, summary, summarized_count):
+        """用新摘要替换会话最早的 summarized_count 轮。"""
+        with self._lock:
+            entry = self._entry_locked(session_id)
+            del entry["turns"][:summarized_count]
+            entry["summary"] = summary
+            self._stats["summarized_turns"] += summarized_count
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions"] = len(self._sessions)
+            stats["turns"] = sum(len(entry["turns"]) for entry in self._sessions.values())
+        return stats
+
+
+_CHAT_SESSION_STORE = ChatSessionStore()
+
+def get_chat_session_stats():
+    """返回多轮对话会话存储的统计信息。"""
+    return _CHAT_SESSION_STORE.get_stats()
+
+
+class GLM_Chat_Session:
+    """
+    多轮对话节点：按 session_id 在内存中保存对话历史，每次调用带上历史一起发送。
+    历史超过提示词 token 预算时，trim 模式丢弃最早的轮次，summarize 模式先把最早的轮次压缩为摘要，
+    使每次调用的提示词长度（以及费用和延迟）不随对话变长而增长。
+    """
+    CATEGORY = "GLM"
+    RETURN_TYPES = ("STRING", "STRING", "INT")
+    RETURN_NAMES = ("response_text", "history", "prompt_tokens")
+    FUNCTION = "glm_session_chat_function"
+
+    _SUMMARY_SYSTEM_PROMPT = (
+        "你是对话摘要助手。请把用户提供的已有摘要和对话记录合并压缩为一段简洁的摘要，"
+        "保留用户的要求、偏好、已确定的结论和尚未解决的问题，省略寒暄和重复内容。只输出摘要本身。"
+    )
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        available_prompts = GLM_Text_Chat.get_text_prompts()
+        prompt_keys = list(available_prompts.keys())
+        default_selection = prompt_keys[0] if prompt_keys else "无可用提示词"
+
+        return {
+            "required": {
+                "session_id": ("STRING", {"default": "default", "multiline": False, "placeholder": "会话ID，相同ID的调用共享对话历史"}),
+                "text_system_prompt_preset": (prompt_keys, {"default": default_selection}),
+                "system_prompt_override": ("STRING", {"multiline": True, "default": "", "placeholder": "系统提示词 (最高优先级，留空则从预设加载)"}),
+                "api_key": ("STRING", {"default": "", "multiline": False, "placeholder": "可选：智谱AI API Key (留空则尝试从环境变量或config.json读取)"}),
+                "model_name": ("STRING", {"default": "GLM-4.5-Flash", "placeholder": "请输入模型名称，如 GLM-4.5-Flash"}),
+                "temperature": ("FLOAT", {"default": 0.9, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "top_p": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 1.0, "step": 0.01}),
+                "max_tokens": ("INT", {"default": 1024, "min": 0, "max": 4096, "tooltip": "输出 token 上限；设置为0时根据输入长度和任务类型自动估算"}),
+                "context_budget": ("INT", {"default": CHAT_SESSION_DEFAULT_BUDGET, "min": 256, "max": 128000, "step": 256, "tooltip": "每次调用发送的提示词（系统提示词+摘要+历史+本轮输入）的估算 token 上限"}),
+                "overflow_mode": (["trim", "summarize"], {"default": "trim", "tooltip": "历史超出预算时的处理方式：trim 丢弃最早的轮次；summarize 额外调用一次 API 把最早的轮次压缩为摘要"}),
+                "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff, "tooltip": "设置为0时，每次运行生成随机种子；设置为其他值时，使用固定种子。注意：此种子仅影响ComfyUI节点内部的随机数生成，不直接影响智谱AI模型的输出结果。"}),
+                "text_input": ("STRING", {"multiline": True, "default": "", "placeholder": "本轮对话内容"}),
+            },
+            "optional": {
+                "reset_session": ("BOOLEAN", {"default": False, "tooltip": "开启后先清空该会话的历史，再开始本轮对话"}),
+                "stream": ("BOOLEAN", {"default": False, "tooltip": "开启后以流式方式接收响应，生成过程中实时显示部分文本"}),
+                "stop_string": ("STRING", {"default": "", "multiline": False, "placeholder": "可选：流式模式下出现该字符串时提前结束生成"}),
+                **_LATENCY_CONTROL_INPUTS,
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            }
+        }
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # 会话历史保存在节点外部，相同输入的两次调用结果也不同，每次都需要执行
+        return float("nan")
+
+    @staticmethod
+    def plan_context(system_prompt, summary, turns, text_input, context_budget):
+        """
+        在 token 预算内构建消息列表：系统提示词（含摘要）和本轮输入总是保留，
+        历史轮次从最新往最早依次加入，直到放不下为止。
+        返回 (消息列表, 第一个被保留的轮次序号, 估算的提示词 token 数)。
+        """
+        system_content = system_prompt
+        if summary:
+            system_content = f"{system_prompt}\n\n【之前对话的摘要】\n{summary}"
+        head = [{"role": "system", "content": system_content}]
+        tail = [{"role": "user", "content": text_input}]
+        used = _estimate_message_tokens(head) + _estimate_message_tokens(tail)
+
+        first_kept = len(turns)
+        for index in range(len(turns) - 1, -1, -1):
+            user_text, assistant_text = turns[index]
+            cost = (estimate_tokens(user_text) + estimate_tokens(assistant_text)
+                    + 2 * CHAT_MESSAGE_OVERHEAD_TOKENS)
+            if used + cost > context_budget:
+                break
+            used += cost
+            first_kept = index
+
+        history = []
+        for user_text, assistant_text in turns[first_kept:]:
+            history.append({"role": "user", "content": user_text})
+            history.append({"role": "assistant", "content": assistant_text})
+        return head + history + tail, first_kept, used
+
+    @staticmethod
+    def format_history(summary, turns):
+        """把会话历史格式化为便于查看的文本。"""
+        lines = []
+        if summary:
+            lines.append(f"[摘要] {summary}")
+        for user_text, assistant_text in turns:
+            lines.append(f"用户: {user_text}")
+            lines.append(f"助手: {assistant_text}")
+        return "\n".join(lines)
+
+    def _summarize(self, final_api_key, model_name, summary, turns, max_tokens):
+        """调用 API 把已有摘要和若干旧轮次合并为新摘要；失败时返回 None。"""
+        transcript = self.format_history(summary, turns)
+        messages = [
+            {"role": "system", "content": self._SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": transcript},
+        ]
+        try:
+            new_summary = complete_chat(final_api_key, model_name, messages, temperature=0.3, max_tokens=max_tokens)
+        except Exception as e:
+            _log_warning(f"压缩对话历史失败，改为丢弃最早的轮次: {e}")
+            return None
+        return str(new_summary).strip() or None
+
+    @_instrument_node
+    def glm_session_chat_function(self, session_id, text_input, api_key, model_name, temperature, top_p, max_tokens,
+                                  context_budget, overflow_mode, seed, system_prompt_override, text_system_prompt_preset,
+                                  reset_session=False, stream=False, stop_string="", unique_id=None):
+        """
+        执行一轮多轮对话：按预算带上会话历史调用模型，成功后把本轮写入历史。
+        """
+        session_id = (session_id or "").strip() or "default"
+        final_api_key = api_key.strip() or get_zhipuai_api_key()
+        if not final_api_key:
+            _log_error("API Key 未提供。")
+            return ("API Key 未提供。", "", 0)
+        if not (text_input and text_input.strip()):
+            _log_error("对话内容不能为空。")
+            return ("对话内容不能为空。", "", 0)
+
+        system_prompt = GLM_Text_Chat.resolve_system_prompt(system_prompt_override, text_system_prompt_preset)
+        if not system_prompt:
+            _log_error("系统提示词不能为空。")
+            return ("系统提示词不能为空。", "", 0)
+
+        if reset_session:
+            _CHAT_SESSION_STORE.reset(session_id)
+            _log_info(f"会话 '{session_id}' 的历史已清空。")
+
+        # --- 种子逻辑 ---
+        effective_seed = seed if seed != 0 else random.randint(0, 0xffffffffffffffff)
+        _log_info(f"内部种子: {effective_seed}。")
+        random.seed(effective_seed) # 仅影响节点内部的随机性
+
+        summary, turns = _CHAT_SESSION_STORE.snapshot(session_id)
+        messages, first_kept, prompt_tokens = self.plan_context(system_prompt, summary, turns, text_input, context_budget)
+        if first_kept > 0 and overflow_mode == "summarize":
+            # 压缩到只剩一半预算能容纳的最近轮次，留出余量，避免之后每一轮都要再压缩一次
+            summarize_count = max(first_kept, self.plan_context(
+                system_prompt, summary, turns, text_input, context_budget // 2)[1])
+            _log_info(f"会话 '{session_id}' 超出预算，正在把最早的 {summarize_count} 轮压缩为摘要...")
+            new_summary = self._summarize(final_api_key, model_name, summary, turns[:summarize_count],
+                                          max(64, min(CHAT_SESSION_SUMMARY_MAX_TOKENS, context_budget // 4)))
+            if new_summary:
+                _CHAT_SESSION_STORE.compact(session_id, new_summary, summarize_count)
+                summary, turns = new_summary, turns[summarize_count:]
+                messages, first_kept, prompt_tokens = self.plan_context(
+                    system_prompt, summary, turns, text_input, context_budget)
+        if first_kept > 0:
+            _log_info(f"会话 '{session_id}'：预算 {context_budget} tokens 内保留最近 {len(turns) - first_kept} 轮，"
+                      f"省略更早的 {first_kept} 轮。")
+        if prompt_tokens > context_budget:
+            _log_warning(f"系统提示词和本轮输入（约 {prompt_tokens} tokens）已超过预算 {context_budget}。")
+
+        if not max_tokens:
+            max_tokens = plan_max_tokens("chat", estimate_tokens(text_input), model_name, prompt_tokens)
+            _log_info(f"自动设置 max_tokens = {max_tokens}。")
+
+        _log_info(f"调用 GLM-4 ({model_name})，会话 '{session_id}'，约 {prompt_tokens} 提示词 tokens...")
+
+        progress = _ComfyProgress(unique_id)
+        try:
+            response_text = complete_chat(
+                final_api_key, model_name, messages,
+                temperature=temperature, top_p=top_p, max_tokens=max_tokens,
+                stream=stream, stop_string=stop_string, progress=progress,
+            )
+            _log_info("GLM-4 响应成功。")
+        except Exception as e:
+            error_message = f"GLM-4 API 调用失败: {e}"
+            return (error_message, self.format_history(summary, turns), prompt_tokens)
+        progress.raise_if_interrupted()
+
+        _CHAT_SESSION_STORE.append_turn(session_id, text_input, response_text)
+        turns.append((text_input, response_text))
+        return (response_text, self.format_history(summary, turns), prompt_tokens)
 
 # --- ComfyUI 节点映射 ---
 NODE_CLASS_MAPPINGS = {
     "GLM_Text_Chat": GLM_Text_Chat,
     "GLM_Vision_ImageToPrompt": GLM_Vision_ImageToPrompt,
     "GLM_Translation_Text": GLM_Translation_Text, # 新增翻译节点
+    "GLM_Translation_Batch": GLM_Translation_Batch,
+    "GLM_Chat_Session": GLM_Chat_Session,
 }
 
 # ComfyUI 节点显示名称映射
@@ -555,4 +2024,6 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "GLM_Text_Chat": "GLM文本对话",
     "GLM_Vision_ImageToPrompt": "GLM识图生成提示词",
     "GLM_Translation_Text": "GLM文本翻译", # 新增翻译节点显示名称
+    "GLM_Translation_Batch": "GLM批量翻译",
+    "GLM_Chat_Session": "GLM多轮对话",
 }
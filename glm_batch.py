@@ -0,0 +1,309 @@
+"""
+离线批处理（智谱 Batch API）：把节点的请求写成 JSONL 批处理文件并在本地跟踪任务，
+任务完成后按请求指纹把结果导入结果存储，节点开启 use_batch_results 时直接读取。
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+if __package__:
+    from .glm_cache import make_request_fingerprint
+    from .glm_client import _chat_request_params, zhipuai_client
+    from .glm_governor import call_with_governor
+    from .glm_telemetry import _log_info, _log_warning
+else:
+    from glm_cache import make_request_fingerprint
+    from glm_client import _chat_request_params, zhipuai_client
+    from glm_governor import call_with_governor
+    from glm_telemetry import _log_info, _log_warning
+
+# --- 全局常量和配置 ---
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 离线批处理（智谱 Batch API）配置
+BATCH_JOBS_DIR = os.path.join(CURRENT_DIR, 'batch_jobs')            # 本地任务目录，每个任务一个子目录
+BATCH_RESULTS_FILE = os.path.join(BATCH_JOBS_DIR, 'results.jsonl')  # 按请求指纹保存的批处理结果
+BATCH_API_ENDPOINT = "/v4/chat/completions"                         # 批处理请求对应的接口
+BATCH_POLL_INTERVAL = 30.0                                          # 等待任务完成时查询状态的间隔（秒）
+
+# --- 离线批处理（Batch API） ---
+
+_BATCH_TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+class BatchResultStore:
+    """
+    离线批处理结果的持久化存储：以请求指纹（make_request_fingerprint，即批处理请求的 custom_id）为键保存响应文本。
+    结果追加写入一个 JSONL 文件，首次查询时整体加载到内存；同一指纹以最后写入的结果为准。
+    """
+
+    def __init__(self, path=BATCH_RESULTS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._results = None  # key -> response_text，首次使用时加载
+        self._stats = {"hits": 0, "misses": 0, "ingested": 0}
+
+    def _load_locked(self):
+        if self._results is not None:
+            return
+        results = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                        results[record["key"]] = record["response"]
+                    except (ValueError, KeyError, TypeError):
+                        _log_warning("批处理结果文件中有无法解析的行，已跳过。")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _log_warning(f"读取批处理结果失败: {e}")
+        self._results = results
+
+    def get(self, key):
+        """按请求指纹查找结果，没有时返回 None。"""
+        with self._lock:
+            self._load_locked()
+            response_text = self._results.get(key)
+            self._stats["hits" if response_text is not None else "misses"] += 1
+        return response_text
+
+    def put_many(self, records, job_id=""):
+        """写入一批结果，records 为 [(请求指纹, 响应文本, 模型名)]。返回写入的条数。"""
+        created = time.time()
+        lines = [json.dumps({"key": key, "response": response_text, "model": model_name, "job_id": job_id,
+                             "created": created}, ensure_ascii=False) + "\n"
+                 for key, response_text, model_name in records]
+        if not lines:
+            return 0
+        with self._lock:
+            self._load_locked()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+            for key, response_text, _ in records:
+                self._results[key] = response_text
+            self._stats["ingested"] += len(lines)
+        return len(lines)
+
+    def invalidate(self):
+        """丢弃内存中的结果，下次查询时重新读取文件。"""
+        with self._lock:
+            self._results = None
+
+    def get_stats(self):
+        with self._lock:
+            self._load_locked()
+            stats = dict(self._stats)
+            stats["results"] = len(self._results)
+        return stats
+
+def make_batch_request_line(request):
+    """
+    把传给 complete_chat 的请求参数（model_name、messages 和采样参数）转换为批处理文件中的一行。
+    custom_id 为请求指纹，与节点实际调用时的响应缓存键一致，结果写回后节点可以直接按指纹读取。
+    """
+    temperature, top_p, max_tokens = request.get("temperature"), request.get("top_p"), request.get("max_tokens")
+    return {
+        "custom_id": make_request_fingerprint(request["model_name"], request["messages"], temperature, top_p, max_tokens),
+        "method": "POST",
+        "url": BATCH_API_ENDPOINT,
+        "body": _chat_request_params(request["model_name"], request["messages"], temperature, top_p, max_tokens),
+    }
+
+class BatchJobManager:
+    """
+    在本地跟踪离线批处理任务，每个任务一个目录（jobs_dir/<job_id>/）：
+    requests.jsonl 为上传的请求文件，job.json 保存任务状态，output.jsonl / errors.jsonl 为下载的结果。
+    任务状态：prepared（已生成请求文件）→ 远端状态（validating / in_progress / finalizing /
+    completed / failed / expired / cancelled）→ ingested（结果已写入结果存储）。
+    """
+
+    def __init__(self, jobs_dir=BATCH_JOBS_DIR, result_store=None):
+        self.jobs_dir = jobs_dir
+        self.result_store = result_store or BatchResultStore()
+        self._lock = threading.Lock()
+
+    def _job_path(self, job_id, name="job.json"):
+        return os.path.join(self.jobs_dir, job_id, name)
+
+    def _save(self, job):
+        job["updated_at"] = time.time()
+        path = self._job_path(job["id"])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return job
+
+    def get_job(self, job_id):
+        """读取任务状态，任务不存在时抛出 KeyError。"""
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"批处理任务不存在: {job_id}") from None
+
+    def list_jobs(self):
+        """按创建时间返回所有本地任务的状态。"""
+        jobs = []
+        if os.path.isdir(self.jobs_dir):
+            for entry in os.scandir(self.jobs_dir):
+                if entry.is_dir() and os.path.exists(self._job_path(entry.name)):
+                    jobs.append(self.get_job(entry.name))
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+    def create_job(self, requests, description=""):
+        """
+        把请求参数列表（build_*_batch_requests 的结果）写成批处理请求文件并创建本地任务。
+        完全相同的请求（指纹相同）只写入一次。返回任务状态。
+        """
+        lines = {}
+        for request in requests:
+            line = make_batch_request_line(request)
+            lines.setdefault(line["custom_id"], line)
+        if not lines:
+            raise ValueError("没有可提交的请求。")
+        created = time.time()
+        job_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(created)) + f"-{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.join(self.jobs_dir, job_id), exist_ok=True)
+        with open(self._job_path(job_id, "requests.jsonl"), 'w', encoding='utf-8') as f:
+            for line in lines.values():
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        job = {
+            "id": job_id, "description": description, "status": "prepared", "created_at": created,
+            "request_count": len(lines), "duplicates": len(requests) - len(lines),
+            "models": sorted({line["body"]["model"] for line in lines.values()}),
+            "batch_id": None, "input_file_id": None, "output_file_id": None, "error_file_id": None,
+            "request_counts": None, "ingested": 0, "failed": 0,
+        }
+        _log_info(f"批处理任务 {job_id}：{len(lines)} 个请求（合并 {job['duplicates']} 个重复请求）。")
+        return self._save(job)
+
+    def submit(self, job_id, api_key):
+        """上传请求文件并创建远端批处理任务。"""
+        job = self.get_job(job_id)
+        if job["status"] != "prepared":
+            raise ValueError(f"批处理任务 {job_id} 已提交（状态 {job['status']}）。")
+
+        def upload():
+            with zhipuai_client(api_key) as client, open(self._job_path(job_id, "requests.jsonl"), 'rb') as f:
+                return client.files.create(file=(f"{job_id}.jsonl", f.read(), "application/jsonl"), purpose="batch")
+
+        uploaded = call_with_governor(api_key, upload)
+        job["input_file_id"] = uploaded.id
+        self._save(job)
+
+        def create():
+            with zhipuai_client(api_key) as client:
+                return client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_API_ENDPOINT,
+                                             metadata={"job_id": job_id, "description": job["description"][:500]})
+
+        batch = call_with_governor(api_key, create)
+        _log_info(f"批处理任务 {job_id} 已提交：{batch.id}。")
+        return self._save(self._apply_remote(job, batch))
+
+    @staticmethod
+    def _apply_remote(job, batch):
+        job["batch_id"] = batch.id
+        job["status"] = batch.status
+        job["output_file_id"] = batch.output_file_id
+        job["error_file_id"] = batch.error_file_id
+        counts = batch.request_counts
+        if counts is not None:
+            job["request_counts"] = {"total": counts.total, "completed": counts.completed, "failed": counts.failed}
+        return job
+
+    def refresh(self, job_id, api_key):
+        """查询远端任务状态并更新本地记录。未提交或结果已导入的任务原样返回。"""
+        job = self.get_job(job_id)
+        if job["batch_id"] is None or job["status"] == "ingested":
+            return job
+
+        def retrieve():
+            with zhipuai_client(api_key) as client:
+                return client.batches.retrieve(job["batch_id"])
+
+        return self._save(self._apply_remote(job, call_with_governor(api_key, retrieve)))
+
+    def cancel(self, job_id, api_key):
+        """取消远端任务。"""
+        job = self.get_job(job_id)
+        if job["batch_id"] is None:
+            raise ValueError(f"批处理任务 {job_id} 尚未提交。")
+
+        def cancel():
+            with zhipuai_client(api_key) as client:
+                return client.batches.cancel(job["batch_id"])
+
+        return self._save(self._apply_remote(job, call_with_governor(api_key, cancel)))
+
+    def _download(self, api_key, file_id, name, job_id):
+        def fetch():
+            with zhipuai_client(api_key) as client:
+                return client.files.content(file_id).content
+
+        data = call_with_governor(api_key, fetch)
+        with open(self._job_path(job_id, name), 'wb') as f:
+            f.write(data)
+        return data.decode('utf-8').splitlines()
+
+    @staticmethod
+    def parse_result_line(line):
+        """解析结果文件的一行，返回 (custom_id, 响应文本, 模型名, 错误信息)；成功时错误信息为 None。"""
+        record = json.loads(line)
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if response.get("status_code") == 200 and body.get("choices"):
+            return custom_id, body["choices"][0]["message"]["content"], body.get("model", ""), None
+        error = record.get("error") or body.get("error") or f"status {response.get('status_code')}"
+        return custom_id, None, body.get("model", ""), error
+
+    def ingest(self, job_id, api_key):
+        """
+        下载已完成任务的结果文件，把成功的结果按请求指纹写入结果存储，失败的请求计入 failed。
+        任务尚未完成时抛出 ValueError。
+        """
+        job = self.refresh(job_id, api_key)
+        if job["status"] == "ingested":
+            return job
+        if job["status"] not in _BATCH_TERMINAL_STATES:
+            raise ValueError(f"批处理任务 {job_id} 尚未完成（状态 {job['status']}）。")
+
+        records, failed = [], 0
+        if job["output_file_id"]:
+            for line in self._download(api_key, job["output_file_id"], "output.jsonl", job_id):
+                if not line.strip():
+                    continue
+                custom_id, response_text, model_name, error = self.parse_result_line(line)
+                if error is None and custom_id:
+                    records.append((custom_id, response_text, model_name))
+                else:
+                    failed += 1
+        if job["error_file_id"]:
+            failed += sum(1 for line in self._download(api_key, job["error_file_id"], "errors.jsonl", job_id)
+                          if line.strip())
+        job["ingested"] = self.result_store.put_many(records, job_id)
+        job["failed"] = failed
+        job["remote_status"] = job["status"]
+        job["status"] = "ingested"
+        _log_info(f"批处理任务 {job_id}：导入 {job['ingested']} 条结果，失败 {failed} 条。")
+        return self._save(job)
+
+    def wait(self, job_id, api_key, poll_interval=BATCH_POLL_INTERVAL, timeout=None):
+        """轮询直到远端任务结束，然后导入结果。超过 timeout 秒仍未结束时抛出 TimeoutError。"""
+        if self.get_job(job_id)["batch_id"] is None:
+            raise ValueError(f"批处理任务 {job_id} 尚未提交。")
+        start = time.monotonic()
+        while True:
+            job = self.refresh(job_id, api_key)
+            if job["status"] in _BATCH_TERMINAL_STATES or job["status"] == "ingested":
+                return self.ingest(job_id, api_key)
+            if timeout is not None and time.monotonic() - start + poll_interval > timeout:
+                raise TimeoutError(f"批处理任务 {job_id} 在 {timeout} 秒内未完成（状态 {job['status']}）。")
+            time.sleep(poll_interval)
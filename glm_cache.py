@@ -0,0 +1,548 @@
+"""
+GLM 节点的本地缓存：按请求指纹保存响应的两级缓存（内存 LRU + 磁盘），
+按本地哈希 n-gram 向量匹配近似输入的内存缓存，以及按句子保存译文的翻译记忆。
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+if __package__:
+    from .glm_telemetry import _log_warning
+    from .glm_tokens import _TOKEN_PATTERN, estimate_tokens
+else:
+    from glm_telemetry import _log_warning
+    from glm_tokens import _TOKEN_PATTERN, estimate_tokens
+
+# --- 全局常量和配置 ---
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 响应缓存配置（节点上 use_cache 开启时生效）
+RESPONSE_CACHE_DIR = os.path.join(CURRENT_DIR, 'cache', 'responses')
+RESPONSE_CACHE_MEMORY_ITEMS = 256                 # 内存 LRU 层最多保存的条目数
+RESPONSE_CACHE_DISK_MAX_BYTES = 200 * 1024 * 1024 # 磁盘层总大小上限
+RESPONSE_CACHE_TTL = 7 * 24 * 3600                # 缓存条目有效期（秒）
+
+# 近似请求缓存配置（对话、翻译节点上 semantic_cache 开启时生效，仅保存在内存中）
+SEMANTIC_CACHE_ENABLED = True          # 全局开关，关闭后所有节点都不查询、不写入
+SEMANTIC_CACHE_DEFAULT_THRESHOLD = 0.99  # 输入向量的余弦相似度达到该值（且实词完全相同）时直接返回缓存的响应
+SEMANTIC_CACHE_DIM = 512               # 哈希 n-gram 向量的维度
+SEMANTIC_CACHE_DIGIT_WEIGHT = 3        # 数字特征的权重（其他特征为 1）
+SEMANTIC_CACHE_MAX_ENTRIES = 256       # 每个索引（系统提示词/预设 + 模型 + 采样参数）最多保存的条目数
+SEMANTIC_CACHE_MAX_INDEXES = 32        # 最多保存的索引数，超出时淘汰最久未使用的索引
+
+# 翻译记忆配置（翻译节点上 translation_memory 开启时生效）
+TRANSLATION_MEMORY_FILE = os.path.join(CURRENT_DIR, 'cache', 'translation_memory.jsonl')  # 句子译文的持久化文件
+TRANSLATION_MEMORY_MAX_ENTRIES = 20000  # 最多保存的句子数，超出时淘汰最久未使用的句子
+
+# --- 响应缓存 ---
+
+def make_request_fingerprint(model_name, messages, temperature=None, top_p=None, max_tokens=None):
+    """
+    计算请求指纹：对模型名、最终消息（含图片数据）以及采样参数做 SHA-256。
+    seed 不影响模型输出，因此不参与计算。
+    """
+    payload = {
+        "model": model_name,
+        "messages": messages,
+        "temperature": temperature,
+        "top_p": top_p,
+        "max_tokens": max_tokens,
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    两级响应缓存：内存 LRU 层 + 磁盘持久层。
+    磁盘层每个条目一个 JSON 文件（按指纹前两位分目录），按 TTL 过期，
+    总大小超出上限时按最近访问时间淘汰最旧的条目。
+    """
+
+    def __init__(self, cache_dir=RESPONSE_CACHE_DIR, memory_items=RESPONSE_CACHE_MEMORY_ITEMS,
+                 disk_max_bytes=RESPONSE_CACHE_DISK_MAX_BYTES, ttl=RESPONSE_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (created, response_text)
+        self._disk_bytes = None       # 磁盘层当前总大小，首次写入时统计
+        self._evicting = False
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _remember_locked(self, key, created, response_text):
+        self._memory[key] = (created, response_text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """查找缓存，未命中或已过期时返回 None。"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            created = record["created"]
+            response_text = record["response"]
+        except FileNotFoundError:
+            created = None
+        except Exception as e:
+            _log_warning(f"读取响应缓存失败，忽略该条目: {e}")
+            created = None
+
+        with self._lock:
+            if created is None:
+                self._stats["misses"] += 1
+                return None
+            expired = now - created > self.ttl
+            if expired:
+                self._stats["misses"] += 1
+            else:
+                self._stats["disk_hits"] += 1
+                self._remember_locked(key, created, response_text)
+        if expired:
+            self._remove_file(path)
+            return None
+        try:
+            os.utime(path, None) # 更新访问时间，用于磁盘层 LRU 淘汰
+        except OSError:
+            pass
+        return response_text
+
+    def put(self, key, response_text, model_name=""):
+        """
+        写入缓存（内存层 + 磁盘层）。磁盘读写（首次统计大小、写文件、淘汰）都在锁外进行，
+        锁内只更新内存层、总大小和淘汰标记，并发的 get / put 不会排在磁盘 I/O 后面。
+        """
+        created = time.time()
+        record = json.dumps({"created": created, "model": model_name, "response": response_text}, ensure_ascii=False)
+        data = record.encode('utf-8')
+        path = self._entry_path(key)
+        with self._lock:
+            self._remember_locked(key, created, response_text)
+            self._stats["writes"] += 1
+            needs_scan = self._disk_bytes is None
+        if needs_scan:
+            scanned_bytes = sum(size for _, size, _ in self._scan_disk())
+            with self._lock:
+                if self._disk_bytes is None:
+                    self._disk_bytes = scanned_bytes
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                old_size = os.path.getsize(path)
+            except FileNotFoundError:
+                old_size = 0
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            _log_warning(f"写入响应缓存失败: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(data) - old_size
+            evict = self._disk_bytes > self.disk_max_bytes and not self._evicting
+            if evict:
+                self._evicting = True  # 同一时间只有一个线程执行淘汰
+        if evict:
+            try:
+                self._evict_disk()
+            finally:
+                with self._lock:
+                    self._evicting = False
+
+    def _scan_disk(self):
+        """返回磁盘层所有条目 [(路径, 大小, 修改时间)]。"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for bucket in os.scandir(self.cache_dir):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                try:
+                    if entry.is_file() and entry.name.endswith('.json'):
+                        st = entry.stat()
+                        entries.append((entry.path, st.st_size, st.st_mtime))
+                except OSError:
+                    continue  # 扫描期间被其他线程删除
+        return entries
+
+    def _remove_file(self, path):
+        """在锁外删除一个磁盘条目，再在锁内更新淘汰计数和总大小。"""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._stats["evictions"] += 1
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+
+    def _evict_disk(self):
+        """删除过期条目；仍超出上限时按修改时间从旧到新删除，直到降到上限的 90%。"""
+        now = time.time()
+        entries = sorted(self._scan_disk(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        with self._lock:
+            self._disk_bytes = total
+        target = self.disk_max_bytes * 0.9
+        for path, size, mtime in entries:
+            if now - mtime > self.ttl or total > target:
+                self._remove_file(path)
+                total -= size
+
+    def clear(self):
+        """清空内存层和磁盘层。"""
+        with self._lock:
+            self._memory.clear()
+        for path, _, _ in self._scan_disk():
+            self._remove_file(path)
+        with self._lock:
+            self._disk_bytes = 0
+
+    def get_stats(self):
+        """返回命中/未命中/写入/淘汰计数以及命中率。"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+# --- 近似请求缓存（本地哈希 n-gram 向量） ---
+
+# 中日韩字符之间的标点和空白，去掉后前后两段连成一段（不产生额外的二字组）
+_SEMANTIC_CJK_GAP = re.compile(
+    r"(?<=[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff])[\W_]+"
+    r"(?=[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff])"
+)
+
+# 计算实词签名时忽略的虚词；否定词（not、no、never、不、没 等）和反义词都不在其中
+_SEMANTIC_STOPWORDS = frozenset((
+    "a", "an", "the", "this", "that", "these", "those", "is", "are", "was", "were", "be", "been", "am",
+    "to", "of", "in", "on", "at", "for", "with", "by", "from", "as", "and", "or", "it", "its",
+    "please", "kindly", "just", "very", "really", "some",
+    "的", "了", "吗", "呢", "吧", "啊", "呀", "嘛", "哦", "请",
+))
+
+def _semantic_normalize(text):
+    return _SEMANTIC_CJK_GAP.sub("", unicodedata.normalize("NFKC", text).casefold())
+
+def semantic_signature(text):
+    """
+    输入的实词签名：去掉虚词后的单词、数字串和中日韩单字组成的有序元组（与词序无关）。
+    近似请求缓存只在签名完全相同时才按相似度命中，否定、反义词或数字不同的输入
+    （如 "is machine washable" 与 "is not machine washable"）即使向量相似度很高也不会命中。
+    """
+    tokens = []
+    for cjk, word, digits, _ in _TOKEN_PATTERN.findall(_semantic_normalize(text)):
+        if cjk:
+            tokens.extend(char for char in cjk if char not in _SEMANTIC_STOPWORDS)
+        elif (word and word not in _SEMANTIC_STOPWORDS) or digits:
+            tokens.append(word or digits)
+    return tuple(sorted(tokens))
+
+def _semantic_features(text):
+    """
+    把文本规范化（NFKC、忽略大小写、去掉标点和空白）后拆成特征：
+    中日韩字符取单字和相邻二字组，拉丁字母单词取整词和首尾补位后的三字组，
+    数字取整串并按 SEMANTIC_CACHE_DIGIT_WEIGHT 加权（只有数字不同的输入不应视为重复）。
+    另外为相邻的两个词（或字串、数字串）加上有序的词对特征，用词相同但词序不同的输入不会被视为相同。
+    """
+    normalized = _semantic_normalize(text)
+    features = []
+    previous = None
+    for cjk, word, digits, _ in _TOKEN_PATTERN.findall(normalized):
+        token = cjk or word or digits
+        if not token:
+            continue
+        if previous is not None:
+            features.append(f"p:{previous}>{token}")
+        previous = token
+        if cjk:
+            features.extend(f"c:{char}" for char in cjk)
+            features.extend(f"b:{cjk[i:i + 2]}" for i in range(len(cjk) - 1))
+        elif word:
+            features.append(f"w:{word}")
+            padded = f"#{word}#"
+            features.extend(f"t:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        elif digits:
+            features.extend((f"d:{digits}",) * SEMANTIC_CACHE_DIGIT_WEIGHT)
+    return features
+
+def embed_text(text, dim=SEMANTIC_CACHE_DIM):
+    """
+    不依赖模型的本地文本向量：特征经 CRC32 哈希映射到 dim 维（高位决定符号，减少碰撞偏差），
+    返回 L2 归一化的 float32 向量；没有任何特征（空文本或只有标点）时返回 None。
+    """
+    import numpy as np
+    features = _semantic_features(text)
+    if not features:
+        return None
+    hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features), dtype=np.uint64,
+                         count=len(features))
+    signs = np.where(hashes >> np.uint64(31) & np.uint64(1), -1.0, 1.0)
+    vector = np.bincount((hashes % np.uint64(dim)).astype(np.intp), weights=signs, minlength=dim).astype(np.float32)
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        return None
+    return vector / norm
+
+class _SemanticIndex:
+    """单个索引：固定容量的向量矩阵，写满后替换最久未命中的条目。"""
+
+    def __init__(self, capacity, dim):
+        import numpy as np
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.responses = [None] * capacity
+        self.signatures = [None] * capacity
+        self.size = 0
+
+class SemanticCache:
+    """
+    近似请求缓存：按索引键（系统提示词、模型和采样参数的指纹）分别保存用户输入的向量、实词签名和响应，
+    查询时与同一索引中实词签名相同的条目计算余弦相似度，最高值达到阈值即命中。
+    索引数和每个索引的条目数都有上限，均按最近使用淘汰。
+    """
+
+    def __init__(self, dim=SEMANTIC_CACHE_DIM, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 max_indexes=SEMANTIC_CACHE_MAX_INDEXES):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.max_indexes = max_indexes
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()  # 索引键 -> _SemanticIndex
+        self._tick = 0
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def lookup(self, index_key, vector, signature, threshold):
+        """返回 (响应文本, 相似度)；没有实词签名相同的条目或最高相似度低于 threshold 时返回 None。"""
+        import numpy as np
+        with self._lock:
+            index = self._indexes.get(index_key)
+            if index is not None and index.size:
+                self._indexes.move_to_end(index_key)
+                same_words = np.fromiter((candidate == signature for candidate in index.signatures[:index.size]),
+                                         dtype=bool, count=index.size)
+                similarities = np.where(same_words, index.vectors[:index.size] @ vector, -1.0)
+                best = int(np.argmax(similarities))
+                similarity = float(similarities[best])
+                if similarity >= threshold - 1e-6:  # 相同输入的相似度因浮点误差可能略小于 1
+                    self._tick += 1
+                    index.last_used[best] = self._tick
+                    self._stats["hits"] += 1
+                    return index.responses[best], similarity
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, index_key, vector, signature, response_text):
+        """写入一条记录，索引已满时替换最久未使用的条目。"""
+        with self._lock:
+            index = self._indexes.get(index_key)
+            if index is None:
+                index = self._indexes[index_key] = _SemanticIndex(self.max_entries, self.dim)
+                while len(self._indexes) > self.max_indexes:
+                    _, evicted = self._indexes.popitem(last=False)
+                    self._stats["evictions"] += evicted.size
+            self._indexes.move_to_end(index_key)
+            if index.size < self.max_entries:
+                slot = index.size
+                index.size += 1
+            else:
+                slot = int(index.last_used.argmin())
+                self._stats["evictions"] += 1
+            self._tick += 1
+            index.vectors[slot] = vector
+            index.last_used[slot] = self._tick
+            index.responses[slot] = response_text
+            index.signatures[slot] = signature
+            self._stats["writes"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def get_stats(self):
+        """返回命中/未命中/写入/淘汰计数、命中率以及当前的索引数和条目数。"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["indexes"] = len(self._indexes)
+            stats["entries"] = sum(index.size for index in self._indexes.values())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+def _semantic_cache_key(model_name, messages, temperature=None, top_p=None):
+    """
+    返回 (索引键, 输入向量, 实词签名)：索引键是除最后一条用户消息以外的请求指纹（max_tokens 不参与，
+    自动估算的 max_tokens 随输入长度变化），向量和签名由最后一条用户消息计算。
+    最后一条消息不是纯文本（如识图请求）或没有可用特征时返回 None。
+    """
+    if not messages or messages[-1].get("role") != "user" or not isinstance(messages[-1].get("content"), str):
+        return None
+    text = messages[-1]["content"]
+    vector = embed_text(text)
+    if vector is None:
+        return None
+    return make_request_fingerprint(model_name, messages[:-1], temperature, top_p), vector, semantic_signature(text)
+
+# --- 翻译记忆 ---
+
+class TranslationMemory:
+    """
+    句子级翻译记忆：以 (源语言, 目标语言, 模型, 规范化后的句子) 的哈希为键保存译文。
+    条目追加写入 JSONL 文件，命中的条目也重新追加一行以记录最近使用；加载时后出现的行决定 LRU 顺序。
+    条目数超出上限时淘汰最久未使用的句子，文件行数超过上限的 2 倍时整体重写压缩。
+    """
+
+    def __init__(self, path=TRANSLATION_MEMORY_FILE, max_entries=TRANSLATION_MEMORY_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = None  # key -> 译文（按最近使用排序），首次使用时加载
+        self._file_lines = 0
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "saved_tokens": 0}
+
+    @staticmethod
+    def make_key(from_language, to_language, model_name, text):
+        """规范化（NFKC、合并空白、去掉首尾空白）后计算键，只有空白不同的句子共用同一条目。"""
+        normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+        encoded = json.dumps([from_language, to_language, model_name, normalized], ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def estimate_saved_tokens(source_text, translation):
+        """命中一句时估算节省的 token 数：原文（提示词）+ 译文（输出）。"""
+        return estimate_tokens(source_text) + estimate_tokens(translation)
+
+    def _load_locked(self):
+        if self._entries is not None:
+            return
+        entries = OrderedDict()
+        lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                        key = record["key"]
+                        entries[key] = record["translation"]
+                    except (ValueError, KeyError, TypeError):
+                        _log_warning("翻译记忆文件中有无法解析的行，已跳过。")
+                        continue
+                    entries.move_to_end(key)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            _log_warning(f"读取翻译记忆失败: {e}")
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self._entries = entries
+        self._file_lines = lines
+
+    def _append_locked(self, items):
+        """把 [(key, 译文)] 标记为最近使用并追加写入文件，必要时淘汰和压缩。"""
+        for key, translation in items:
+            self._entries[key] = translation
+            self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self._file_lines + len(items) > self.max_entries * 2:
+                self._compact_locked()
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps({"key": key, "translation": translation}, ensure_ascii=False) + "\n"
+                             for key, translation in items)
+            self._file_lines += len(items)
+        except OSError as e:
+            _log_warning(f"写入翻译记忆失败: {e}")
+
+    def _compact_locked(self):
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps({"key": key, "translation": translation}, ensure_ascii=False) + "\n"
+                         for key, translation in self._entries.items())
+        os.replace(tmp_path, self.path)
+        self._file_lines = len(self._entries)
+
+    def get_many(self, from_language, to_language, model_name, texts):
+        """查找多句原文，返回 {原文: 译文}（只包含命中的句子）。"""
+        found = {}
+        with self._lock:
+            self._load_locked()
+            touched = []
+            for text in dict.fromkeys(texts):
+                key = self.make_key(from_language, to_language, model_name, text)
+                translation = self._entries.get(key)
+                if translation is None:
+                    self._stats["misses"] += 1
+                    continue
+                found[text] = translation
+                touched.append((key, translation))
+                self._stats["hits"] += 1
+                self._stats["saved_tokens"] += self.estimate_saved_tokens(text, translation)
+            if touched:
+                self._append_locked(touched)
+        return found
+
+    def put_many(self, from_language, to_language, model_name, pairs):
+        """写入 [(原文, 译文)]。"""
+        items = [(self.make_key(from_language, to_language, model_name, text), translation)
+                 for text, translation in pairs]
+        if not items:
+            return
+        with self._lock:
+            self._load_locked()
+            self._append_locked(items)
+            self._stats["writes"] += len(items)
+
+    def clear(self):
+        """清空内存中的条目并删除文件。"""
+        with self._lock:
+            self._entries = OrderedDict()
+            self._file_lines = 0
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def get_stats(self):
+        """返回句子命中/未命中数、命中率、估算节省的 token 数以及条目数。"""
+        with self._lock:
+            self._load_locked()
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
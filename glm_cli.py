@@ -0,0 +1,373 @@
+"""
+GLM 节点命令行批量处理：不打开 ComfyUI，直接复用节点的提示词预设、消息构建、图片编码和调用治理，
+批量为图片生成描述，或批量扩写 / 翻译文本。
+
+输入可以是目录（caption 读取其中的图片，chat / translate 读取其中的 .txt 文件，每个文件一项）、
+JSONL 文件（每行一项）、文本文件（每个非空行一项）或标准输入（-，每个非空行一项），边读取边处理，不会一次性载入全部输入。
+结果逐条追加写入输出 JSONL；输出文件同时是检查点：运行被中断后用相同的命令重新运行，
+已成功的条目会被跳过，失败的条目会重试。运行过程中在标准错误输出处理速度（条/秒）和预计剩余时间。
+
+用法：
+    python glm_cli.py caption ./frames --output captions.jsonl --workers 8
+    python glm_cli.py chat prompts.jsonl --output expanded.jsonl --preset "默认视频扩写提示 (内置)"
+    python glm_cli.py translate lines.txt --output en.jsonl --from zh --to en
+
+JSONL 输入每行为一个对象：可选的 "id"；caption 使用 "image"（本地路径、URL、data URI 或 Base64，
+相对路径相对于 JSONL 文件所在目录）；chat / translate 使用 "text"。
+"""
+import argparse
+import json
+import logging
+import os
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("GLM_NODES_LOG_LEVEL", "WARNING")
+
+import glm  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+TEXT_EXTENSIONS = (".txt",)
+# 各任务对应的节点（用于遥测中的节点名）
+TASK_NODES = {"caption": "GLM_Vision_ImageToPrompt", "chat": "GLM_Text_Chat", "translate": "GLM_Translation_Text"}
+
+
+def _jsonl_item(record, task, path, line_no):
+    if isinstance(record, str):
+        record = {"image" if task == "caption" else "text": record}
+    item_id = str(record.get("id") or f"{path}:{line_no}")
+    if task == "caption":
+        value = record.get("image") or record.get("image_url") or record.get("path") or ""
+        if value and not value.startswith(("http://", "https://", "data:")) and len(value) <= 4096:
+            candidate = os.path.join(os.path.dirname(path), os.path.expanduser(value))
+            if os.path.isfile(candidate):
+                value = candidate
+    else:
+        value = record.get("text") or record.get("prompt") or ""
+    return {"id": item_id, "value": value}
+
+
+def _iter_text_lines(lines, source):
+    for line_no, line in enumerate(lines, 1):
+        if line.strip():
+            yield {"id": f"{source}:{line_no}", "value": line.rstrip("\n")}
+
+
+def iter_items(sources, task):
+    """
+    按输入顺序逐项产生 {"id", "value"}：value 为图片来源（caption）或文本（chat / translate）。
+    输入为 "-" 时从标准输入读取文本行（每个非空行一项）。
+    """
+    for source in sources:
+        if source == "-":
+            yield from _iter_text_lines(sys.stdin, "stdin")
+        elif os.path.isdir(source):
+            extensions = IMAGE_EXTENSIONS if task == "caption" else TEXT_EXTENSIONS
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if not name.lower().endswith(extensions):
+                        continue
+                    path = os.path.join(root, name)
+                    if task == "caption":
+                        yield {"id": path, "value": path}
+                    else:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            yield {"id": path, "value": f.read()}
+        elif source.lower().endswith(".jsonl"):
+            with open(source, 'r', encoding='utf-8') as f:
+                for line_no, line in enumerate(f, 1):
+                    if line.strip():
+                        yield _jsonl_item(json.loads(line), task, source, line_no)
+        else:
+            with open(source, 'r', encoding='utf-8') as f:
+                yield from _iter_text_lines(f, source)
+
+
+def count_items(sources, task):
+    """
+    不读取图片、不解析 JSON 地统计输入条目数，用于显示 ETA：目录只统计文件名，文件只按字节统计非空行。
+    任一输入不是普通文件或目录（标准输入、管道等只能读取一次的输入）时返回 None，进度中不显示总数。
+    """
+    total = 0
+    for source in sources:
+        if source == "-":
+            return None
+        try:
+            mode = os.stat(source).st_mode
+        except OSError:
+            return None
+        if stat.S_ISDIR(mode):
+            extensions = IMAGE_EXTENSIONS if task == "caption" else TEXT_EXTENSIONS
+            for _, dirs, files in os.walk(source):
+                total += sum(1 for name in files if name.lower().endswith(extensions))
+        elif stat.S_ISREG(mode):
+            with open(source, 'rb') as f:
+                total += sum(1 for line in f if line.strip())
+        else:
+            return None
+    return total
+
+
+def load_checkpoint(output_path):
+    """
+    读取已有的输出文件，返回已成功条目的 id 集合。
+    进程被强制结束时最后一行可能只写了一半，这里把它截掉，保证之后追加的内容仍是合法的 JSONL。
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    valid_end = 0
+    with open(output_path, 'rb+') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            valid_end += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "result" in record:
+                done.add(record["id"])
+        if os.path.getsize(output_path) != valid_end:
+            f.truncate(valid_end)
+    return done
+
+
+class ResultWriter:
+    """线程安全地把结果逐行追加写入 JSONL 并立即刷新，进程中断时已完成的结果不会丢失。"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ProgressReporter:
+    """统计完成数并按间隔在标准错误输出处理速度和预计剩余时间（总数未知时不显示 ETA）。"""
+
+    def __init__(self, total=None, interval=2.0, stream=sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.completed = 0
+        self.failed = 0
+        self.start = time.monotonic()
+        self._last_report = 0.0
+
+    def update(self, ok):
+        self.completed += 1
+        if not ok:
+            self.failed += 1
+        self.report()
+
+    def rate(self):
+        elapsed = time.monotonic() - self.start
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        rate = self.rate()
+        if self.total is not None:
+            remaining = max(0, self.total - self.completed)
+            eta = _format_duration(remaining / rate) if rate > 0 else "-"
+            line = f"[{self.completed}/{self.total}] {rate:.2f} 条/秒，ETA {eta}，失败 {self.failed}"
+        else:
+            line = f"[{self.completed}] {rate:.2f} 条/秒，失败 {self.failed}"
+        print(line, file=self.stream, flush=True)
+
+
+def _format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def make_processor(args, api_key):
+    """返回处理单个输入值并返回结果文本的函数，失败时抛出异常。"""
+    common = {"use_cache": args.use_cache, "use_batch_results": args.use_batch_results,
+              "semantic_threshold": args.semantic_threshold}
+    if args.task == "caption":
+        def process(value):
+            request = glm.build_vision_batch_requests(
+                [value], model_name=args.model, prompt_override=args.prompt, image_prompt_preset=args.preset,
+                image_format=args.image_format, image_quality=args.image_quality, max_image_edge=args.max_image_edge)[0]
+            return glm.complete_chat(api_key, **request, **common)
+    elif args.task == "chat":
+        def process(value):
+            request = glm.GLM_Text_Chat.build_request(value, args.model, args.temperature, args.top_p, args.max_tokens,
+                                                      args.system_prompt, args.preset, verbose=False)
+            if request is None:
+                raise ValueError("系统提示词不能为空。")
+            return glm.complete_chat(api_key, **request, **common)
+    else:
+        node = glm.GLM_Translation_Text()
+
+        def process(value):
+            if not value.strip():
+                return ""
+            return node.translate(api_key, value, args.from_language, args.to_language, args.model, args.temperature,
+                                  args.top_p, args.max_tokens, max_concurrency=args.chunk_concurrency,
+                                  translation_memory=args.translation_memory, **common)
+    return process
+
+
+def run(args):
+    """执行批量处理，返回 (成功数, 失败数, 跳过数)。"""
+    api_key = (args.api_key or "").strip() or glm.get_zhipuai_api_key()
+    if not api_key:
+        raise SystemExit("API Key 未提供：使用 --api-key、环境变量 ZHIPUAI_API_KEY 或 config.json。")
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+    total = None if args.no_count else count_items(args.inputs, args.task)
+    if total is not None:
+        # 检查点中的条目一般都来自同一批输入，直接扣除即可，不必为此再解析一遍输入
+        total = max(0, total - len(done))
+    if done:
+        print(f"从检查点继续：跳过 {len(done)} 条已完成的条目。", file=sys.stderr)
+
+    process = make_processor(args, api_key)
+    node_name = TASK_NODES[args.task]
+    policy = {"timeout_seconds": args.timeout, "deadline_seconds": args.deadline, "hedge_delay": args.hedge_delay,
+              "fallback_model": args.fallback_model}
+
+    def run_item(item):
+        start = time.perf_counter()
+        record = {"id": item["id"], "task": args.task, "model": args.model}
+        # 每一项作为一次节点调用计入遥测，并使用各自的超时和截止时间
+        with glm.telemetry_call(node_name, args.model), glm.call_policy(**policy):
+            try:
+                record["result"] = process(item["value"])
+            except Exception as e:
+                record["error"] = str(e)
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        return record
+
+    writer = ResultWriter(args.output)
+    progress = ProgressReporter(total, args.progress_interval)
+    scheduled = set(done)
+    skipped = len(done)
+    pending = set()
+
+    def collect(futures):
+        for future in futures:
+            record = future.result()
+            writer.write(record)
+            progress.update("result" in record)
+
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="glm_cli")
+    try:
+        for item in iter_items(args.inputs, args.task):
+            if item["id"] in scheduled:
+                continue
+            scheduled.add(item["id"])
+            # 最多排队 workers 的两倍，输入边读取边处理
+            while len(pending) >= args.workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending.add(executor.submit(run_item, item))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+    except KeyboardInterrupt:
+        executor.shutdown(wait=False, cancel_futures=True)
+        collect(f for f in pending if f.done() and not f.cancelled())
+        writer.close()
+        progress.report(force=True)
+        print("已中断。用相同的命令重新运行即可从检查点继续。", file=sys.stderr)
+        raise
+    executor.shutdown()
+    writer.close()
+    progress.report(force=True)
+    return progress.completed - progress.failed, progress.failed, skipped
+
+
+def build_parser():
+    default_from, default_to = glm.GLM_Translation_Text.get_default_languages()
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("inputs", nargs="+", help="输入目录、JSONL 文件或文本文件（每个非空行一项），- 表示从标准输入读取文本行")
+    common.add_argument("-o", "--output", required=True, help="结果 JSONL 文件，同时作为断点续跑的检查点")
+    common.add_argument("--workers", type=int, default=4, help="同时处理的条目数")
+    common.add_argument("--api-key", default="", help="智谱AI API Key（留空则从环境变量或 config.json 读取）")
+    common.add_argument("--use-cache", action="store_true", help="读写响应缓存")
+    common.add_argument("--use-batch-results", action="store_true", help="优先使用已导入的离线批处理结果")
+    common.add_argument("--semantic-threshold", type=float, default=0.0,
+                        help="近似请求缓存的相似度阈值（如 0.99），0 表示不启用；需同时指定 --use-cache，识图任务不使用")
+    common.add_argument("--timeout", type=float, default=0.0, help="单次 API 请求的超时（秒），0 使用 SDK 默认值")
+    common.add_argument("--deadline", type=float, default=0.0, help="每一项（含重试）的截止时间（秒），0 表示不限制")
+    common.add_argument("--hedge-delay", type=float, default=0.0, help="请求超过该秒数未返回时发送对冲请求，0 表示不启用")
+    common.add_argument("--fallback-model", default="", help="对冲请求使用的备用模型")
+    common.add_argument("--progress-interval", type=float, default=2.0, help="输出进度的间隔（秒）")
+    common.add_argument("--restart", action="store_true", help="删除已有的输出文件，从头开始")
+    common.add_argument("--no-count", action="store_true", help="不预先统计输入总数（不显示 ETA）；输入为标准输入或管道时自动不统计")
+    common.add_argument("--verbose", action="store_true", help="输出节点的 INFO 日志")
+
+    parser = argparse.ArgumentParser(description="GLM 节点命令行批量处理（识图描述、文本扩写、翻译）")
+    tasks = parser.add_subparsers(dest="task", required=True)
+
+    caption = tasks.add_parser("caption", parents=[common], help="为图片生成描述提示词")
+    caption.add_argument("--model", default="glm-4v-flash")
+    caption.add_argument("--preset", default="", help="识图提示词预设名称（留空使用第一个可用预设）")
+    caption.add_argument("--prompt", default="", help="识图提示词（最高优先级）")
+    caption.add_argument("--image-format", default=glm.IMAGE_ENCODE_FORMAT, choices=["JPEG", "WEBP", "PNG"])
+    caption.add_argument("--image-quality", type=int, default=glm.IMAGE_ENCODE_QUALITY)
+    caption.add_argument("--max-image-edge", type=int, default=glm.IMAGE_ENCODE_MAX_EDGE)
+
+    chat = tasks.add_parser("chat", parents=[common], help="按系统提示词扩写文本")
+    chat.add_argument("--model", default="GLM-4.5-Flash")
+    chat.add_argument("--preset", default="", help="系统提示词预设名称（留空使用第一个可用预设）")
+    chat.add_argument("--system-prompt", default="", help="系统提示词（最高优先级）")
+    chat.add_argument("--temperature", type=float, default=0.9)
+    chat.add_argument("--top-p", type=float, default=0.7)
+    chat.add_argument("--max-tokens", type=int, default=1024, help="0 表示按输入自动估算")
+
+    translate = tasks.add_parser("translate", parents=[common], help="翻译文本")
+    translate.add_argument("--model", default="GLM-4.5-Flash")
+    translate.add_argument("--from", dest="from_language", default=default_from, choices=glm.SUPPORTED_TRANSLATION_LANGS)
+    translate.add_argument("--to", dest="to_language", default=default_to, choices=glm.SUPPORTED_TRANSLATION_LANGS)
+    translate.add_argument("--temperature", type=float, default=0.1)
+    translate.add_argument("--top-p", type=float, default=0.7)
+    translate.add_argument("--max-tokens", type=int, default=1024, help="0 表示按输入自动估算")
+    translate.add_argument("--chunk-concurrency", type=int, default=1, help="长文本分块翻译时每一项内的并发数")
+    translate.add_argument("--translation-memory", action="store_true",
+                           help="按句子翻译并使用翻译记忆，只发送记忆中没有的句子")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.verbose:
+        logging.getLogger("GLM_Nodes").setLevel(logging.INFO)
+    args.workers = max(1, args.workers)
+    start = time.monotonic()
+    try:
+        succeeded, failed, skipped = run(args)
+    except KeyboardInterrupt:
+        return 130
+    elapsed = time.monotonic() - start
+    rate = (succeeded + failed) / elapsed if elapsed > 0 else 0.0
+    print(f"完成：成功 {succeeded} 条，失败 {failed} 条，跳过 {skipped} 条（已完成），"
+          f"用时 {_format_duration(elapsed)}，{rate:.2f} 条/秒。结果已写入 {args.output}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+GLM 节点共用的智谱AI客户端：进程级连接池（按 API Key 和 base_url 复用客户端及其 keep-alive 连接），
+以及经过调用治理层、可按请求策略对冲的对话补全入口。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+if __package__:
+    from .glm_governor import (
+        _CURRENT_POLICY, _api_key_hash, _deadline_remaining, _request_timeout_params, call_with_governor, hedged_call,
+    )
+    from .glm_telemetry import _estimate_request_bytes, _log_warning, _record_metric, _record_usage
+else:
+    from glm_governor import (
+        _CURRENT_POLICY, _api_key_hash, _deadline_remaining, _request_timeout_params, call_with_governor, hedged_call,
+    )
+    from glm_telemetry import _estimate_request_bytes, _log_warning, _record_metric, _record_usage
+
+# --- 全局常量和配置 ---
+
+# 客户端连接池配置：按 (API Key, base_url) 复用 ZhipuAI 客户端及其 keep-alive 连接
+CLIENT_POOL_MAX_SIZE = 8          # 最多缓存的客户端数量
+CLIENT_POOL_IDLE_TIMEOUT = 600    # 客户端空闲超过该秒数后被回收
+
+# --- 客户端连接池 ---
+
+class _ZhipuAIClientPool:
+    """
+    进程级 ZhipuAI 客户端注册表。
+    以 (API Key 哈希, base_url) 为键复用客户端，使各节点、各次执行共享同一个 HTTP 连接池，
+    避免重复构建客户端和重复 TLS 握手。容量有上限，并回收空闲过久的客户端。
+    """
+
+    def __init__(self, max_size=CLIENT_POOL_MAX_SIZE, idle_timeout=CLIENT_POOL_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # key -> {"client", "last_used", "in_use"}，按最近使用顺序排列
+        self._entries = OrderedDict()
+        # 已被淘汰但仍有调用在使用的客户端，待最后一次归还时关闭
+        self._retired = {}
+        self._stats = {"created": 0, "reused": 0, "evicted": 0}
+
+    @staticmethod
+    def _make_key(api_key, base_url):
+        return (_api_key_hash(api_key), base_url or "")
+
+    @staticmethod
+    def _close_client(client):
+        try:
+            client.close()
+        except Exception as e:
+            _log_warning(f"关闭智谱AI客户端失败: {e}")
+
+    def _discard_locked(self, key, entry):
+        """从池中移除一个客户端；若仍在使用中则延后关闭。调用方需持有锁。"""
+        self._stats["evicted"] += 1
+        if entry["in_use"] > 0:
+            self._retired[id(entry["client"])] = entry
+            return None
+        return entry["client"]
+
+    def _evict_locked(self, now):
+        """回收空闲超时以及超出容量的客户端，返回需要关闭的客户端列表。调用方需持有锁。"""
+        to_close = []
+        for key in list(self._entries.keys()):
+            entry = self._entries[key]
+            if entry["in_use"] == 0 and now - entry["last_used"] > self.idle_timeout:
+                del self._entries[key]
+                client = self._discard_locked(key, entry)
+                if client is not None:
+                    to_close.append(client)
+        while len(self._entries) > self.max_size:
+            key, entry = self._entries.popitem(last=False)
+            client = self._discard_locked(key, entry)
+            if client is not None:
+                to_close.append(client)
+        return to_close
+
+    def acquire(self, api_key, base_url=None):
+        """取出（或创建）对应的客户端，并增加其使用计数。需与 release 配对调用。"""
+        key = self._make_key(api_key, base_url)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry["in_use"] += 1
+                entry["last_used"] = now
+                self._stats["reused"] += 1
+                to_close = self._evict_locked(now)
+                client = entry["client"]
+            else:
+                client = None
+        if client is None:
+            # 在锁外构建客户端，避免阻塞其他线程
+            # 重试由 call_with_governor 统一负责，关闭 SDK 自带的重试以免叠加
+            client_kwargs = {"api_key": api_key, "max_retries": 0}
+            if base_url:
+                client_kwargs["base_url"] = base_url
+            from zhipuai import ZhipuAI
+            new_client = ZhipuAI(**client_kwargs)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    # 其他线程已抢先创建，丢弃本线程创建的客户端
+                    self._entries.move_to_end(key)
+                    self._stats["reused"] += 1
+                    to_close = [new_client]
+                else:
+                    entry = {"client": new_client, "last_used": now, "in_use": 0}
+                    self._entries[key] = entry
+                    self._stats["created"] += 1
+                    to_close = []
+                entry["in_use"] += 1
+                entry["last_used"] = now
+                to_close.extend(self._evict_locked(now))
+                client = entry["client"]
+        for stale in to_close:
+            self._close_client(stale)
+        return client
+
+    def release(self, client):
+        """归还客户端。已被淘汰的客户端在最后一次归还时关闭。"""
+        to_close = None
+        with self._lock:
+            for entry in self._entries.values():
+                if entry["client"] is client:
+                    entry["in_use"] = max(0, entry["in_use"] - 1)
+                    entry["last_used"] = time.monotonic()
+                    return
+            entry = self._retired.get(id(client))
+            if entry is not None:
+                entry["in_use"] -= 1
+                if entry["in_use"] <= 0:
+                    del self._retired[id(client)]
+                    to_close = client
+        if to_close is not None:
+            self._close_client(to_close)
+
+    @contextmanager
+    def lease(self, api_key, base_url=None):
+        """以上下文管理器形式借用客户端。"""
+        client = self.acquire(api_key, base_url)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def clear(self):
+        """关闭并清空所有未在使用的客户端。"""
+        with self._lock:
+            to_close = []
+            for key in list(self._entries.keys()):
+                client = self._discard_locked(key, self._entries.pop(key))
+                if client is not None:
+                    to_close.append(client)
+        for client in to_close:
+            self._close_client(client)
+
+    def get_stats(self):
+        """返回复用/创建/淘汰计数以及当前池大小。"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["in_use"] = sum(e["in_use"] for e in self._entries.values())
+        return stats
+
+
+_CLIENT_POOL = _ZhipuAIClientPool()
+
+def get_zhipuai_base_url():
+    """读取可选的自定义接口地址（环境变量 ZHIPUAI_BASE_URL），未设置时返回 None 使用 SDK 默认值。"""
+    return os.getenv("ZHIPUAI_BASE_URL") or None
+
+def zhipuai_client(api_key):
+    """从进程级连接池借用智谱AI客户端（上下文管理器）。"""
+    return _CLIENT_POOL.lease(api_key, get_zhipuai_base_url())
+
+def get_client_pool_stats():
+    """返回客户端连接池的统计信息。"""
+    return _CLIENT_POOL.get_stats()
+
+def _chat_request_params(model_name, messages, temperature=None, top_p=None, max_tokens=None):
+    """构建对话补全的请求体，值为 None 的采样参数不发送。"""
+    request_params = {"model": model_name, "messages": messages}
+    for name, value in (("temperature", temperature), ("top_p", top_p), ("max_tokens", max_tokens)):
+        if value is not None:
+            request_params[name] = value
+    return request_params
+def create_chat_completion(api_key, **request_params):
+    """
+    所有节点共用的对话补全调用入口：经过限流/重试层，从连接池借用客户端并发起请求。
+    客户端初始化失败与 API 调用失败一样以异常形式抛出，由调用方处理。
+    """
+    def attempt():
+        with zhipuai_client(api_key) as client:
+            return client.chat.completions.create(**request_params, **_request_timeout_params())
+    _record_metric("request_bytes", _estimate_request_bytes(request_params))
+    response = call_with_governor(api_key, attempt)
+    _record_usage(getattr(response, "usage", None))
+    return response
+
+def _create_completion_text(api_key, request_params):
+    response = create_chat_completion(api_key, **request_params)
+    return response.choices[0].message.content
+
+def _complete_with_hedge(api_key, request_params):
+    """
+    非流式对话补全：请求策略设置了 hedge_delay 时以对冲方式调用，否则直接调用。
+    返回 (响应文本, 实际给出结果的模型)，对冲请求使用 fallback_model 并胜出时后者为备用模型。
+    """
+    policy = _CURRENT_POLICY.get()
+    if policy is None or not policy["hedge_delay"]:
+        return _create_completion_text(api_key, request_params), request_params["model"]
+    hedge_params = dict(request_params)
+    if policy["fallback_model"]:
+        hedge_params["model"] = policy["fallback_model"]
+    response_text, leg = hedged_call(
+        lambda: _create_completion_text(api_key, request_params),
+        lambda: _create_completion_text(api_key, hedge_params),
+        policy["hedge_delay"],
+        timeout=_deadline_remaining(),
+    )
+    return response_text, (hedge_params if leg == "hedge" else request_params)["model"]
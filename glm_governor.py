@@ -0,0 +1,634 @@
+"""
+GLM 节点的 API 调用治理（按 API Key 共享）：令牌桶限流、最大并发、指数退避重试和熔断，
+节点上的超时、截止时间与对冲请求，以及同时进行的相同请求合并（single-flight）。
+"""
+import contextvars
+import hashlib
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+if __package__:
+    from .glm_telemetry import TELEMETRY_LATENCY_BUCKETS, _Histogram, _log_info, _log_warning, _record_metric
+else:
+    from glm_telemetry import TELEMETRY_LATENCY_BUCKETS, _Histogram, _log_info, _log_warning, _record_metric
+
+# --- 全局常量和配置 ---
+
+# API 调用治理（按 API Key 共享）：限流、最大并发、重试和熔断
+API_RATE_LIMIT_PER_SECOND = 10.0     # 令牌桶每秒补充的请求数，0 表示不限流
+API_RATE_LIMIT_BURST = 20            # 令牌桶容量（允许的突发请求数）
+API_MAX_IN_FLIGHT = 8                # 同一 API Key 同时进行的最大请求数
+API_RETRY_MAX_ATTEMPTS = 4           # 含首次调用在内的最大尝试次数
+API_RETRY_BASE_DELAY = 1.0           # 指数退避的基础延迟（秒）
+API_RETRY_MAX_DELAY = 30.0           # 单次退避的最大延迟（秒）
+API_CIRCUIT_FAILURE_THRESHOLD = 5    # 连续失败多少次后熔断
+API_CIRCUIT_RESET_TIMEOUT = 30.0     # 熔断持续时间（秒）
+HEDGE_MAX_WORKERS = 2 * API_MAX_IN_FLIGHT  # 对冲请求共享线程池的线程数（每次对冲调用最多占用两个）
+
+# --- 辅助函数 ---
+
+def _api_key_hash(api_key):
+    """API Key 的 SHA-256，用作各类按 Key 区分的注册表的键，避免在内存结构中保存明文。"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+# --- 限流、并发控制与重试 ---
+
+class GLMCircuitOpenError(Exception):
+    """熔断器处于打开状态时快速失败抛出的异常。"""
+
+
+class _TokenBucket:
+    """线程安全的令牌桶：按 rate 每秒补充令牌，最多累积 burst 个。"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=None):
+        """
+        取一个令牌，令牌不足时等待；返回等待的秒数。
+        需要等待的时间超过 max_wait 秒时不取令牌、不等待，返回 None。
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if max_wait is not None and wait > max_wait:
+                return None
+            # 预占令牌（允许为负），再在锁外等待，保证多个线程按顺序排队
+            self._tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class _CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后打开，在 reset_timeout 秒内直接拒绝请求；
+    之后进入半开状态，放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opens = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def before_call(self):
+        with self._lock:
+            if self._state == "open":
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise GLMCircuitOpenError(f"API 连续失败，熔断中，{remaining:.1f} 秒后重试。")
+                self._state = "half_open"
+                self._probe_in_flight = False
+            if self._state == "half_open":
+                if self._probe_in_flight:
+                    raise GLMCircuitOpenError("API 熔断恢复探测中，请稍后重试。")
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self.opens += 1
+                    _log_warning(f"API 连续失败 {self._failures} 次，熔断 {self.reset_timeout} 秒。")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def record_neutral(self):
+        """请求失败但与服务健康无关（如参数错误），释放半开探测名额。"""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+def _status_code_of(error):
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        response = getattr(error, "response", None)
+        status_code = getattr(response, "status_code", None)
+    return status_code
+
+def _is_retryable_error(error):
+    """限流（429）、服务端错误（5xx）、连接错误和超时可以重试；鉴权、参数错误等不重试。"""
+    if isinstance(error, GLMCircuitOpenError):
+        return False
+    status_code = _status_code_of(error)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    name = type(error).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "ConnectTimeout",
+                    "RemoteProtocolError", "TimeoutError", "ConnectionError")
+
+def _retry_after_seconds(error):
+    """读取响应头中的 Retry-After（秒数或 HTTP 日期），没有时返回 None。"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _ApiGovernor:
+    """
+    单个 API Key 的调用治理：令牌桶限流 + 最大并发数 + 带抖动的指数退避重试 + 熔断器。
+    同一进程内所有节点共享同一个 Key 的治理器。
+    """
+
+    def __init__(self, rate=API_RATE_LIMIT_PER_SECOND, burst=API_RATE_LIMIT_BURST, max_in_flight=API_MAX_IN_FLIGHT,
+                 max_attempts=API_RETRY_MAX_ATTEMPTS, base_delay=API_RETRY_BASE_DELAY, max_delay=API_RETRY_MAX_DELAY,
+                 failure_threshold=API_CIRCUIT_FAILURE_THRESHOLD, reset_timeout=API_CIRCUIT_RESET_TIMEOUT):
+        self.bucket = _TokenBucket(rate, burst)
+        self.semaphore = threading.BoundedSemaphore(max_in_flight)
+        self.breaker = _CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "rejected": 0,
+                       "in_flight": 0, "throttle_wait_seconds": 0.0, "backoff_seconds": 0.0}
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _backoff_delay(self, attempt, error):
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay) + random.uniform(0, self.base_delay)
+        # Full jitter：在 [0, base * 2^(attempt-1)] 范围内随机
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def _abandon_wait(self, message):
+        """截止时间内拿不到令牌或并发名额：释放熔断器的探测名额后抛出 GLMDeadlineExceeded。"""
+        self.breaker.record_neutral()
+        self._count("failures")
+        raise GLMDeadlineExceeded(message)
+
+    def call(self, fn, can_retry=None):
+        self._count("calls")
+        for attempt in range(1, self.max_attempts + 1):
+            _raise_if_past_deadline()
+            try:
+                self.breaker.before_call()
+            except GLMCircuitOpenError:
+                self._count("rejected")
+                raise
+            # 限流和并发的等待都不超过剩余的截止时间
+            remaining = _deadline_remaining()
+            waited = self.bucket.acquire(max_wait=None if remaining is None else max(0.0, remaining))
+            if waited is None:
+                self._abandon_wait("等待限流令牌会超过节点设置的截止时间。")
+            remaining = _deadline_remaining()
+            wait_start = time.monotonic()
+            if not self.semaphore.acquire(timeout=None if remaining is None else max(0.0, remaining)):
+                self._count("throttle_wait_seconds", waited + time.monotonic() - wait_start)
+                self._abandon_wait("等待并发名额时超过了节点设置的截止时间。")
+            waited += time.monotonic() - wait_start
+            self._count("throttle_wait_seconds", waited)
+            _record_metric("wait_seconds", waited)
+            if _call_cancelled():
+                # 排队期间对冲的另一路已有结果：不再发出请求，避免白白消耗配额
+                self.semaphore.release()
+                self.breaker.record_neutral()
+                self._count("failures")
+                raise GLMDeadlineExceeded("对冲请求已有结果，本请求被取消。")
+            self._count("attempts")
+            self._count("in_flight")
+            try:
+                result = fn()
+            except Exception as e:
+                error = e
+            else:
+                error = None
+            finally:
+                self._count("in_flight", -1)
+                self.semaphore.release()
+
+            if error is None:
+                self.breaker.record_success()
+                return result
+            remaining = _deadline_remaining()
+            if (remaining is not None and remaining <= 0) or _call_cancelled():
+                # 超时由本端的截止时间或对冲取消造成，不代表服务端故障，不计入熔断
+                self.breaker.record_neutral()
+                self._count("failures")
+                raise error
+            if not _is_retryable_error(error):
+                self.breaker.record_neutral()
+                self._count("failures")
+                raise error
+            self.breaker.record_failure()
+            if (attempt >= self.max_attempts or self.breaker.state == "open"
+                    or (can_retry is not None and not can_retry()) or _call_cancelled()):
+                self._count("failures")
+                raise error
+            # 退避等待期间不占用并发名额
+            delay = self._backoff_delay(attempt, error)
+            if remaining is not None and delay >= remaining:
+                # 等不到下一次尝试就会超过截止时间，直接返回本次的错误
+                self._count("failures")
+                raise error
+            _record_metric("wait_seconds", delay)
+            _log_warning(f"API 调用失败（第 {attempt} 次）: {error}，{delay:.1f} 秒后重试。")
+            self._count("retries")
+            self._count("backoff_seconds", delay)
+            time.sleep(delay)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["circuit_state"] = self.breaker.state
+        stats["circuit_opens"] = self.breaker.opens
+        return stats
+
+
+_API_GOVERNORS = {}
+_API_GOVERNORS_LOCK = threading.Lock()
+_API_GOVERNOR_SETTINGS = {}  # configure_api_governor 设置的参数覆盖
+
+def _get_api_governor(api_key):
+    key_hash = _api_key_hash(api_key)
+    with _API_GOVERNORS_LOCK:
+        governor = _API_GOVERNORS.get(key_hash)
+        if governor is None:
+            governor = _API_GOVERNORS[key_hash] = _ApiGovernor(**_API_GOVERNOR_SETTINGS)
+        return governor
+
+def configure_api_governor(**settings):
+    """
+    覆盖调用治理参数（rate、burst、max_in_flight、max_attempts、base_delay、max_delay、
+    failure_threshold、reset_timeout），并丢弃已有的治理器使新参数立即生效。
+    """
+    with _API_GOVERNORS_LOCK:
+        _API_GOVERNOR_SETTINGS.update(settings)
+        _API_GOVERNORS.clear()
+
+def call_with_governor(api_key, fn, can_retry=None):
+    """
+    在该 API Key 的限流、并发和熔断约束下执行 fn，可重试错误按抖动指数退避重试
+    （优先遵循 Retry-After）。can_retry 返回 False 时不再重试（例如流式输出已经开始）。
+    """
+    return _get_api_governor(api_key).call(fn, can_retry)
+
+def get_api_governor_stats():
+    """返回每个 API Key（以哈希前 8 位标识）的限流/重试/熔断统计。"""
+    with _API_GOVERNORS_LOCK:
+        governors = dict(_API_GOVERNORS)
+    return {key_hash[:8]: governor.get_stats() for key_hash, governor in governors.items()}
+
+# --- 超时、截止时间与对冲请求 ---
+
+class GLMDeadlineExceeded(TimeoutError):
+    """节点设置的截止时间已到，不再发起或等待请求时抛出的异常。"""
+
+
+# 当前节点调用的请求策略：{"timeout", "deadline", "hedge_delay", "fallback_model", "cancel"}，
+# 与遥测记录一样通过 contextvars 传到下层和线程池中的工作线程
+_CURRENT_POLICY = contextvars.ContextVar("glm_call_policy", default=None)
+
+@contextmanager
+def call_policy(timeout_seconds=0, deadline_seconds=0, hedge_delay=0, fallback_model=""):
+    """
+    在节点执行期间设置请求策略（0 或空表示不启用）：
+    timeout_seconds 为单次 API 请求的超时；deadline_seconds 为从现在起整个调用（含重试、对冲和多次请求）的截止时间；
+    hedge_delay 秒后仍未返回的非流式请求会再并行发送一次，发给 fallback_model（为空时发给同一模型）。
+    """
+    policy = {
+        "timeout": timeout_seconds or None,
+        "deadline": time.monotonic() + deadline_seconds if deadline_seconds else None,
+        "hedge_delay": hedge_delay or None,
+        "fallback_model": (fallback_model or "").strip(),
+        "cancel": None,
+    }
+    token = _CURRENT_POLICY.set(policy)
+    try:
+        yield policy
+    finally:
+        _CURRENT_POLICY.reset(token)
+
+def _deadline_remaining():
+    """距离截止时间的剩余秒数；未设置截止时间时返回 None。"""
+    policy = _CURRENT_POLICY.get()
+    if policy is None or policy["deadline"] is None:
+        return None
+    return policy["deadline"] - time.monotonic()
+
+def _call_cancelled():
+    """当前请求是否已被取消（对冲请求中落后的一路）。"""
+    policy = _CURRENT_POLICY.get()
+    return policy is not None and policy["cancel"] is not None and policy["cancel"].is_set()
+
+def _raise_if_past_deadline():
+    remaining = _deadline_remaining()
+    if remaining is not None and remaining <= 0:
+        raise GLMDeadlineExceeded("已超过节点设置的截止时间。")
+    if _call_cancelled():
+        raise GLMDeadlineExceeded("对冲请求已有结果，本请求被取消。")
+
+def _request_timeout_params():
+    """按请求策略返回传给 SDK 的 timeout 参数（单次超时与剩余截止时间取较小值），不限制时返回空字典。"""
+    policy = _CURRENT_POLICY.get()
+    if policy is None:
+        return {}
+    limits = [value for value in (policy["timeout"], _deadline_remaining()) if value is not None]
+    if not limits:
+        return {}
+    return {"timeout": max(0.001, min(limits))}
+
+
+class _HedgeStats:
+    """对冲请求统计：对冲率、哪一路胜出，以及主请求与实际返回的延迟分布（用于比较 p99）。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0, "hedged": 0, "failover": 0, "primary_wins": 0, "hedge_wins": 0,
+                        "failed": 0, "deadline_exceeded": 0, "losers_abandoned": 0, "losers_drained": 0,
+                        "losers_completed": 0, "loser_drain_seconds": 0.0}
+        self._primary_latency = _Histogram(TELEMETRY_LATENCY_BUCKETS)
+        self._effective_latency = _Histogram(TELEMETRY_LATENCY_BUCKETS)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counts[name] += value
+
+    def observe_primary(self, seconds):
+        """主请求自身的完成耗时（成功或失败、即使已落后被丢弃也记录；截止时间先到时记录已等待的时长），代表不做对冲时的延迟。"""
+        with self._lock:
+            self._primary_latency.observe(seconds)
+
+    def observe_effective(self, seconds):
+        with self._lock:
+            self._effective_latency.observe(seconds)
+
+    def observe_loser(self, drain_seconds, completed):
+        """落后的一路在对冲调用返回后才结束：记录它额外运行的时间，以及是否仍完成了请求（消耗了配额）。"""
+        with self._lock:
+            self._counts["losers_drained"] += 1
+            self._counts["loser_drain_seconds"] += drain_seconds
+            if completed:
+                self._counts["losers_completed"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats["hedge_rate"] = stats["hedged"] / stats["calls"] if stats["calls"] else 0.0
+            for name, histogram in (("primary", self._primary_latency), ("effective", self._effective_latency)):
+                for q in (0.5, 0.95, 0.99):
+                    stats[f"{name}_p{int(q * 100)}"] = histogram.quantile(q)
+        if stats["primary_p99"] is not None and stats["effective_p99"] is not None:
+            stats["p99_improvement_seconds"] = stats["primary_p99"] - stats["effective_p99"]
+        return stats
+
+
+_HEDGE_STATS = _HedgeStats()
+
+def get_hedge_stats():
+    """
+    返回对冲请求的统计：调用数、对冲率、胜出分布、主请求与实际延迟的 p50/p95/p99，
+    以及落后一路的数量（losers_abandoned）、在调用返回后才结束的数量和额外耗时（losers_drained、loser_drain_seconds）
+    和其中仍完成了请求的数量（losers_completed）。
+    """
+    return _HEDGE_STATS.get_stats()
+
+_HEDGE_EXECUTOR = None
+_HEDGE_EXECUTOR_LOCK = threading.Lock()
+
+def _get_hedge_executor():
+    """所有对冲调用共享的有界线程池，首次使用时创建。"""
+    global _HEDGE_EXECUTOR
+    with _HEDGE_EXECUTOR_LOCK:
+        if _HEDGE_EXECUTOR is None:
+            _HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="glm_hedge")
+        return _HEDGE_EXECUTOR
+
+def hedged_call(primary, hedge, hedge_delay, timeout=None):
+    """
+    先执行 primary；hedge_delay 秒后仍未返回（或 primary 以可重试的错误失败）时并行执行 hedge，两路都在共享的有界线程池中运行，
+    返回 (最先成功的结果, 胜出的一路 "primary" 或 "hedge")。另一路被标记为取消：还在排队等待限流或并发名额时直接放弃，
+    不再重试；已经发出的非流式 HTTP 请求无法中途关闭（连接来自共享的客户端池），会运行到返回或超时后被丢弃，
+    这部分计入 get_hedge_stats() 的 losers_drained / losers_completed。
+    primary 以不可重试的错误（如参数、鉴权错误）失败时直接抛出，不再发送 hedge。
+    两路都失败时抛出 primary 的异常；超过 timeout 秒仍无结果时抛出 GLMDeadlineExceeded。
+    """
+    results = queue.Queue()
+    cancel = threading.Event()
+    start = time.monotonic()
+    primary_observed = []  # 主请求延迟只记录一次：主请求结束时（即使已落后），或截止时间先到时（记为已等待的时长）
+    observe_lock = threading.Lock()
+    returned_at = []  # 对冲调用返回或抛出异常的时刻，之后才结束的一路即为落后的一路
+
+    def observe_primary(seconds):
+        with observe_lock:
+            if primary_observed:
+                return
+            primary_observed.append(seconds)
+        _HEDGE_STATS.observe_primary(seconds)
+
+    def run(leg, fn):
+        # 每一路使用独立的策略副本，共享取消标记
+        policy = _CURRENT_POLICY.get()
+        _CURRENT_POLICY.set(dict(policy or {"timeout": None, "deadline": None, "hedge_delay": None,
+                                            "fallback_model": ""}, cancel=cancel))
+        leg_start = time.monotonic()
+        try:
+            value, error = fn(), None
+        except Exception as e:
+            value, error = None, e
+        if leg == "primary":
+            # 成功和失败都记录，失败的主请求同样代表不做对冲时调用方要等待的时间
+            observe_primary(time.monotonic() - leg_start)
+        with observe_lock:
+            if returned_at:
+                _HEDGE_STATS.observe_loser(time.monotonic() - returned_at[0], error is None)
+                return
+        results.put((leg, value, error))
+
+    def launch(leg, fn):
+        context = contextvars.copy_context()
+        _get_hedge_executor().submit(context.run, run, leg, fn)
+
+    def finish():
+        """标记调用已返回，仍在运行的各路计为落后的一路。"""
+        cancel.set()
+        with observe_lock:
+            returned_at.append(time.monotonic())
+        # 已结束但结果未被取走的一路同样计入
+        _HEDGE_STATS.count("losers_abandoned", pending)
+
+    _HEDGE_STATS.count("calls")
+    launch("primary", primary)
+    pending, hedged = 1, False
+    errors = {}
+    while True:
+        now = time.monotonic()
+        waits = []
+        if not hedged:
+            waits.append(start + hedge_delay - now)
+        if timeout is not None:
+            waits.append(start + timeout - now)
+        try:
+            leg, value, error = results.get(timeout=max(0.0, min(waits)) if waits else None)
+        except queue.Empty:
+            if timeout is not None and time.monotonic() - start >= timeout:
+                # 主请求仍未结束：以已等待的时长作为它的延迟下限记录（超时标记）
+                observe_primary(time.monotonic() - start)
+                finish()
+                _HEDGE_STATS.count("deadline_exceeded")
+                raise GLMDeadlineExceeded("已超过节点设置的截止时间。")
+            hedged, pending = True, pending + 1
+            _HEDGE_STATS.count("hedged")
+            _record_metric("hedged_calls")
+            _log_info(f"请求 {hedge_delay:.1f} 秒未返回，发送对冲请求。")
+            launch("hedge", hedge)
+            continue
+
+        pending -= 1
+        if error is None:
+            finish()
+            _HEDGE_STATS.count(f"{leg}_wins")
+            _HEDGE_STATS.observe_effective(time.monotonic() - start)
+            return value, leg
+        errors[leg] = error
+        if not hedged:
+            if not _is_retryable_error(error):
+                # 参数、鉴权等错误换一路也不会成功，不做失败转移
+                _HEDGE_STATS.count("failed")
+                raise error
+            # 主请求在对冲时间之前就以可重试的错误失败了：立即改用对冲请求（失败转移）
+            hedged, pending = True, pending + 1
+            _HEDGE_STATS.count("hedged")
+            _HEDGE_STATS.count("failover")
+            _record_metric("hedged_calls")
+            _log_warning(f"请求失败: {error}，改用对冲请求。")
+            launch("hedge", hedge)
+            continue
+        if pending == 0:
+            _HEDGE_STATS.count("failed")
+            raise errors.get("primary", error)
+
+# --- 相同请求合并（single-flight） ---
+
+class _SingleFlight:
+    """
+    合并正在进行中的相同请求：同一个键同时只有一个调用真正执行，
+    执行期间到达的相同请求等待它结束，共享它的结果或 API 错误。调用结束后键立即移除（不是缓存）。
+    执行者因自己的截止时间、中断或对冲取消而失败（或结果被判定为不可共享）时，等待者不共享，改为重新执行。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # 键 -> {"done": Event, "result", "error", "shareable", "waiters"}
+        self._stats = {"leaders": 0, "coalesced": 0, "max_waiters": 0, "retried": 0}
+
+    @staticmethod
+    def _is_shareable_error(error):
+        """只共享来自 API 的错误（HTTP 状态码、连接错误、熔断），执行者自身的截止时间和中断不共享。"""
+        if isinstance(error, GLMDeadlineExceeded) or not isinstance(error, Exception):
+            return False
+        return (isinstance(error, GLMCircuitOpenError) or _status_code_of(error) is not None
+                or _is_retryable_error(error))
+
+    def do(self, key, fn, is_shareable=None):
+        """
+        执行 fn 或等待进行中的相同调用，返回 (结果, 是否为被合并的请求)。
+        is_shareable(结果) 为 False 时该结果只返回给执行者本身。
+        等待受当前截止时间限制，到时抛出 GLMDeadlineExceeded。
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = {"done": threading.Event(), "result": None, "error": None,
+                                                   "shareable": False, "waiters": 0}
+                    self._stats["leaders"] += 1
+                    leader = True
+                else:
+                    flight["waiters"] += 1
+                    self._stats["coalesced"] += 1
+                    self._stats["max_waiters"] = max(self._stats["max_waiters"], flight["waiters"])
+                    leader = False
+
+            if leader:
+                break
+            remaining = _deadline_remaining()
+            if not flight["done"].wait(timeout=None if remaining is None else max(0.0, remaining)):
+                raise GLMDeadlineExceeded("等待进行中的相同请求时超过了节点设置的截止时间。")
+            if flight["shareable"]:
+                if flight["error"] is not None:
+                    raise flight["error"]
+                return flight["result"], True
+            with self._lock:
+                self._stats["coalesced"] -= 1
+                self._stats["retried"] += 1
+            _raise_if_past_deadline()
+
+        try:
+            flight["result"] = fn()
+            flight["shareable"] = is_shareable is None or bool(is_shareable(flight["result"]))
+        except BaseException as e:
+            flight["error"] = e
+            flight["shareable"] = self._is_shareable_error(e)
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight["done"].set()
+        return flight["result"], False
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+        return stats
+
+
+_SINGLE_FLIGHT = _SingleFlight()
+
+def get_single_flight_stats():
+    """返回请求合并的统计：实际执行的调用数、被合并的请求数、单个调用的最大等待者数、
+    执行者失败后等待者改为重新执行的次数和当前进行中的调用数。"""
+    return _SINGLE_FLIGHT.get_stats()
@@ -0,0 +1,500 @@
+"""
+GLM 识图节点的图片处理：IMAGE 张量逐帧编码，Base64 / data URI / 本地文件输入的格式识别与按需重新编码，
+基于感知哈希的相似帧去重，以及把多帧合成一张网格图的拼图模式。
+"""
+import base64
+import math
+import os
+import re
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+if __package__:
+    from .glm_telemetry import _log_enabled, _log_info, _log_warning, _map_in_context, _record_metric
+else:
+    from glm_telemetry import _log_enabled, _log_info, _log_warning, _map_in_context, _record_metric
+
+# --- 全局常量和配置 ---
+
+# IMAGE 输入的默认编码参数
+IMAGE_ENCODE_FORMAT = "JPEG"   # JPEG / WEBP / PNG
+IMAGE_ENCODE_QUALITY = 90      # JPEG / WEBP 质量
+IMAGE_ENCODE_MAX_EDGE = 2048   # 长边上限（像素），0 表示不缩放
+
+# Base64 / data URI / 本地文件图片输入：不超限且格式受支持时原样发送，否则解码后按上面的编码参数重新编码
+IMAGE_INGEST_MAX_BYTES = 5 * 1024 * 1024                # 图片字节数上限（解码后）
+IMAGE_INGEST_PASSTHROUGH_FORMATS = ("JPEG", "PNG", "WEBP")  # 可以原样发送的格式
+IMAGE_INGEST_HEADER_BYTES = 64 * 1024                   # 识别格式和读取宽高时最多解码的文件头字节数
+
+# 帧去重与拼图模式
+VISION_DEDUP_DEFAULT_THRESHOLD = 4   # 帧去重的默认汉明距离阈值（64 位感知哈希）
+VISION_DEDUP_HASH_CHUNK = 32         # 计算感知哈希时每次转换到 NumPy 的帧数
+VISION_CONTACT_SHEET_MAX_EDGE = 2048 # 网格图长边上限（像素），格子按比例缩小以满足该限制
+VISION_CONTACT_SHEET_GAP = 8         # 格子之间及四周的白色间隔（像素）
+
+# --- 图片编码 ---
+
+_IMAGE_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+_IMAGE_ENCODE_STATS = {"frames": 0, "raw_bytes": 0, "payload_bytes": 0, "encode_seconds": 0.0}
+_IMAGE_ENCODE_STATS_LOCK = threading.Lock()
+
+def _frame_to_uint8(image_input, index):
+    """
+    只取出指定帧并转换为 uint8 的 [H, W, C] 数组。
+    PyTorch 张量在原设备上完成缩放和类型转换，只把单帧的 uint8 数据拷贝到 CPU，
+    不会为整个批次生成浮点临时数组。
+    """
+    frame = image_input[index]
+    if hasattr(frame, "cpu"):
+        if str(frame.dtype) == "torch.uint8":
+            return frame.cpu().numpy()
+        return frame.mul(255.0).clamp_(0, 255).byte().cpu().numpy()
+    import numpy as np
+    frame = np.asarray(frame)
+    if frame.dtype == np.uint8:
+        return frame
+    scaled = np.multiply(frame, 255.0, dtype=np.float32)
+    np.clip(scaled, 0, 255, out=scaled)
+    return scaled.astype(np.uint8)
+
+def _save_pil_image(img, image_format, quality):
+    """把 PIL 图片按指定格式（已大写）编码为字节串。"""
+    import io
+
+    buffered = io.BytesIO()
+    if image_format == "PNG":
+        img.save(buffered, format="PNG", compress_level=4)
+    else:
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(buffered, format=image_format, quality=int(quality))
+    return buffered.getvalue()
+
+def encode_image_frame(image_input, index=0, image_format=IMAGE_ENCODE_FORMAT, quality=IMAGE_ENCODE_QUALITY,
+                       max_edge=IMAGE_ENCODE_MAX_EDGE):
+    """
+    将 IMAGE 张量（[B, H, W, C]，范围[0,1]）中的一帧编码为 data URI。
+    长边超过 max_edge 时等比缩小（max_edge 为 0 表示不缩放），支持 JPEG / WEBP / PNG。
+    返回包含 data_url、format、width、height、payload_bytes、encode_seconds 的字典。
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    image_format = (image_format or IMAGE_ENCODE_FORMAT).upper()
+    if image_format not in _IMAGE_MIME_TYPES:
+        raise ValueError(f"不支持的图片编码格式: {image_format}")
+
+    pixels = _frame_to_uint8(image_input, index)
+    if pixels.ndim == 3 and pixels.shape[2] == 1:
+        pixels = pixels[:, :, 0]
+    img = Image.fromarray(pixels)
+    if max_edge and max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=2.0)
+    return _encode_pil_image(img, image_format, quality, pixels.nbytes, start)
+
+def _encode_pil_image(img, image_format, quality, raw_bytes, start):
+    """把已缩放好的 PIL 图片编码为 data URI 并累加编码统计，返回 encode_image_frame 格式的字典。"""
+    payload = _save_pil_image(img, image_format, quality)
+    data_url = f"data:{_IMAGE_MIME_TYPES[image_format]};base64," + base64.b64encode(payload).decode('ascii')
+    elapsed = time.perf_counter() - start
+
+    _record_metric("encode_seconds", elapsed)
+    with _IMAGE_ENCODE_STATS_LOCK:
+        _IMAGE_ENCODE_STATS["frames"] += 1
+        _IMAGE_ENCODE_STATS["raw_bytes"] += raw_bytes
+        _IMAGE_ENCODE_STATS["payload_bytes"] += len(payload)
+        _IMAGE_ENCODE_STATS["encode_seconds"] += elapsed
+    return {
+        "data_url": data_url,
+        "format": image_format,
+        "width": img.size[0],
+        "height": img.size[1],
+        "payload_bytes": len(payload),
+        "encode_seconds": elapsed,
+    }
+
+def encode_image_frames(image_input, indices=None, max_workers=1, **encode_options):
+    """
+    编码 IMAGE 批次中的指定帧（默认全部），按输入顺序返回 encode_image_frame 的结果列表。
+    max_workers > 1 时在线程池中并行编码（Pillow 编码期间会释放 GIL）。
+    """
+    if indices is None:
+        indices = range(image_input.shape[0])
+    indices = list(indices)
+
+    def encode(index):
+        return encode_image_frame(image_input, index, **encode_options)
+
+    if max_workers > 1 and len(indices) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(indices)), thread_name_prefix="glm_encode") as executor:
+            results = _map_in_context(executor, encode, indices)
+    else:
+        results = [encode(index) for index in indices]
+
+    total_bytes = sum(r["payload_bytes"] for r in results)
+    total_seconds = sum(r["encode_seconds"] for r in results)
+    if results and _log_enabled():
+        _log_info(f"已编码 {len(results)} 帧 ({results[0]['format']}, {results[0]['width']}x{results[0]['height']})，"
+                  f"载荷 {total_bytes / 1024:.1f} KB，编码耗时 {total_seconds * 1000:.1f} ms。")
+    return results
+
+# --- Base64 / 文件图片输入 ---
+
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+)
+_BASE64_BODY_RE = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+_BASE64_WHITESPACE_RE = re.compile(r"\s+")
+_IMAGE_INGEST_STATS = {"inputs": 0, "passthrough": 0, "reencoded": 0, "mime_corrected": 0, "payload_bytes": 0}
+
+def sniff_image_format(head):
+    """根据文件头魔数识别图片格式，返回 JPEG / PNG / WEBP / GIF / BMP，无法识别时返回 None。"""
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for magic, image_format in _IMAGE_SIGNATURES:
+        if head.startswith(magic):
+            return image_format
+    return None
+
+def _image_size_from_header(image_format, head):
+    """不解码像素，直接从文件头解析 (宽, 高)；数据不足或无法解析时返回 None。"""
+    try:
+        if image_format == "PNG" and len(head) >= 24:
+            return struct.unpack(">II", head[16:24])
+        if image_format == "GIF" and len(head) >= 10:
+            return struct.unpack("<HH", head[6:10])
+        if image_format == "BMP" and len(head) >= 26:
+            width, height = struct.unpack("<ii", head[18:26])
+            return abs(width), abs(height)
+        if image_format == "WEBP" and len(head) >= 30:
+            chunk = head[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", head[26:30])
+                return width & 0x3fff, height & 0x3fff
+            if chunk == b"VP8L":
+                bits = int.from_bytes(head[21:25], "little")
+                return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+            if chunk == b"VP8X":
+                return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+        if image_format == "JPEG":
+            # 逐个跳过 JPEG 段，直到遇到记录尺寸的 SOF 段
+            offset = 2
+            while offset + 9 <= len(head):
+                if head[offset] != 0xFF:
+                    return None
+                marker = head[offset + 1]
+                if marker == 0xFF:
+                    offset += 1
+                    continue
+                if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+                    offset += 2
+                    continue
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">HH", head[offset + 5:offset + 9])
+                    return width, height
+                offset += 2 + struct.unpack(">H", head[offset + 2:offset + 4])[0]
+    except struct.error:
+        return None
+    return None
+
+def _normalize_base64(body):
+    """
+    校验 Base64 字符串并返回规范形式（去掉空白、补齐填充），只做一次正则扫描，不解码数据。
+    无效时抛出 ValueError。
+    """
+    if not _BASE64_BODY_RE.fullmatch(body):
+        body = _BASE64_WHITESPACE_RE.sub("", body)
+        if "-" in body or "_" in body:
+            body = body.translate(str.maketrans("-_", "+/"))
+        if not _BASE64_BODY_RE.fullmatch(body):
+            raise ValueError("Base64 数据包含非法字符。")
+    remainder = len(body) % 4
+    if remainder == 1:
+        raise ValueError("Base64 数据长度不正确。")
+    if remainder:
+        body += "=" * (4 - remainder)
+    if not body:
+        raise ValueError("Base64 数据为空。")
+    return body
+
+def _base64_decoded_size(body):
+    padding = 2 if body.endswith("==") else 1 if body.endswith("=") else 0
+    return len(body) // 4 * 3 - padding
+
+def is_local_image_path(text):
+    """判断字符串是否指向一个存在的本地文件（过长的字符串视为 Base64，不做文件系统检查）。"""
+    text = (text or "").strip()
+    if not text or len(text) > 4096 or text.startswith("data:"):
+        return False
+    return os.path.isfile(os.path.expanduser(text))
+
+def ingest_image_source(source, max_bytes=IMAGE_INGEST_MAX_BYTES, image_format=IMAGE_ENCODE_FORMAT,
+                        quality=IMAGE_ENCODE_QUALITY, max_edge=IMAGE_ENCODE_MAX_EDGE):
+    """
+    把 Base64 字符串、data URI 或本地图片路径转换为可发送的 data URI，尽量不解码：
+    - 只解码开头的少量字节，按魔数识别真实格式（data URI 中声明的类型不可信）并读取宽高
+    - Base64 数据用一次正则扫描校验，不生成解码后的副本
+    - 只有超过 max_bytes / max_edge（0 表示不限制）或格式不能原样发送时，才解码并按
+      image_format / quality 重新编码，必要时继续缩小直到不超过 max_bytes
+    返回包含 data_url、format、width、height、payload_bytes、reencoded、source 的字典；输入无效时抛出 ValueError。
+    """
+    start = time.perf_counter()
+    text = (source or "").strip()
+    declared_mime = None
+    if is_local_image_path(text):
+        source_kind = "file"
+        path = os.path.expanduser(text)
+        with open(path, "rb") as f:
+            head = f.read(IMAGE_INGEST_HEADER_BYTES)
+        payload_bytes = os.path.getsize(path)
+        body = None
+
+        def read_bytes():
+            with open(path, "rb") as f:
+                return f.read()
+    else:
+        if text.startswith("data:"):
+            source_kind = "data_uri"
+            header, sep, body = text.partition(",")
+            if not sep or not header.endswith(";base64"):
+                raise ValueError("data URI 必须是 Base64 编码。")
+            declared_mime = header[5:-len(";base64")].lower() or None
+        else:
+            source_kind = "base64"
+            body = text
+        body = _normalize_base64(body)
+        payload_bytes = _base64_decoded_size(body)
+        head_chars = (IMAGE_INGEST_HEADER_BYTES + 2) // 3 * 4
+        try:
+            head = base64.b64decode(body[:head_chars], validate=True)
+        except ValueError as e:
+            raise ValueError(f"Base64 解码失败: {e}")
+
+        def read_bytes():
+            return base64.b64decode(body)
+
+    detected = sniff_image_format(head)
+    if detected is None:
+        raise ValueError("无法识别的图片格式（支持 JPEG / PNG / WEBP / GIF / BMP）。")
+    size = _image_size_from_header(detected, head)
+    mime_corrected = declared_mime is not None and declared_mime != _IMAGE_MIME_TYPES.get(detected)
+    if mime_corrected:
+        _log_warning(f"data URI 声明的类型 {declared_mime} 与实际格式 {detected} 不符，已按实际格式处理。")
+
+    reasons = []
+    if detected not in IMAGE_INGEST_PASSTHROUGH_FORMATS:
+        reasons.append(f"格式 {detected} 不能直接发送")
+    if max_bytes and payload_bytes > max_bytes:
+        reasons.append(f"大小 {payload_bytes / 1024:.0f} KB 超过 {max_bytes / 1024:.0f} KB")
+    if max_edge and size and max(size) > max_edge:
+        reasons.append(f"尺寸 {size[0]}x{size[1]} 超过长边上限 {max_edge}")
+
+    if not reasons:
+        if body is None:
+            body = base64.b64encode(read_bytes()).decode("ascii")
+        result_format = detected
+        data_url = f"data:{_IMAGE_MIME_TYPES[detected]};base64,{body}"
+    else:
+        import io
+        from PIL import Image
+
+        _log_info(f"图片需要重新编码：{'，'.join(reasons)}。")
+        result_format = (image_format or IMAGE_ENCODE_FORMAT).upper()
+        if result_format not in _IMAGE_MIME_TYPES:
+            raise ValueError(f"不支持的图片编码格式: {result_format}")
+        try:
+            img = Image.open(io.BytesIO(read_bytes()))
+            img.load()
+        except Exception as e:
+            raise ValueError(f"图片解码失败: {e}")
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        edge = max_edge or max(img.size)
+        while True:
+            if max(img.size) > edge:
+                img.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=2.0)
+            payload = _save_pil_image(img, result_format, quality)
+            # 仍然超过字节上限时继续缩小
+            if not max_bytes or len(payload) <= max_bytes or edge <= 256:
+                break
+            edge = int(max(img.size) * 0.75)
+        size = img.size
+        payload_bytes = len(payload)
+        data_url = f"data:{_IMAGE_MIME_TYPES[result_format]};base64," + base64.b64encode(payload).decode("ascii")
+
+    elapsed = time.perf_counter() - start
+    _record_metric("encode_seconds", elapsed)
+    with _IMAGE_ENCODE_STATS_LOCK:
+        _IMAGE_INGEST_STATS["inputs"] += 1
+        _IMAGE_INGEST_STATS["reencoded" if reasons else "passthrough"] += 1
+        _IMAGE_INGEST_STATS["mime_corrected"] += int(mime_corrected)
+        _IMAGE_INGEST_STATS["payload_bytes"] += payload_bytes
+    return {
+        "data_url": data_url,
+        "format": result_format,
+        "width": size[0] if size else None,
+        "height": size[1] if size else None,
+        "payload_bytes": payload_bytes,
+        "reencoded": bool(reasons),
+        "source": source_kind,
+    }
+
+# --- 帧去重（感知哈希） ---
+
+def _block_mean(gray, out_h, out_w):
+    """把 [B, H, W] 灰度图按面积平均缩小为 [B, out_h, out_w]（向量化，不逐帧循环）。"""
+    import numpy as np
+    height, width = gray.shape[1:]
+    row_edges = np.linspace(0, height, out_h + 1).astype(np.intp)
+    col_edges = np.linspace(0, width, out_w + 1).astype(np.intp)
+    rows = np.add.reduceat(gray, np.minimum(row_edges[:-1], height - 1), axis=1)
+    blocks = np.add.reduceat(rows, np.minimum(col_edges[:-1], width - 1), axis=2)
+    counts = np.outer(np.maximum(np.diff(row_edges), 1), np.maximum(np.diff(col_edges), 1))
+    return blocks / counts
+
+def compute_frame_hashes(image_input, hash_size=8):
+    """
+    计算 IMAGE 批次（[B, H, W, C]）每一帧的 aHash 和 dHash（各 hash_size² 位）。
+    返回 (ahash, dhash)，形状均为 [B, hash_size²/8] 的 uint8 数组（按位打包）。
+    每次只把 VISION_DEDUP_HASH_CHUNK 帧转换为 NumPy，避免为整个批次生成浮点副本。
+    """
+    import numpy as np
+    frame_count = image_input.shape[0]
+    ahashes, dhashes = [], []
+    for start in range(0, frame_count, VISION_DEDUP_HASH_CHUNK):
+        chunk = image_input[start:start + VISION_DEDUP_HASH_CHUNK]
+        chunk = chunk.cpu().numpy() if hasattr(chunk, "cpu") else np.asarray(chunk)
+        chunk = chunk.astype(np.float32, copy=False)
+        if chunk.ndim == 4 and chunk.shape[3] >= 3:
+            gray = chunk[..., 0] * 0.299 + chunk[..., 1] * 0.587 + chunk[..., 2] * 0.114
+        elif chunk.ndim == 4:
+            gray = chunk[..., 0]
+        else:
+            gray = chunk
+        small = _block_mean(gray, hash_size, hash_size)
+        ahash_bits = small > small.mean(axis=(1, 2), keepdims=True)
+        wide = _block_mean(gray, hash_size, hash_size + 1)
+        dhash_bits = wide[:, :, 1:] > wide[:, :, :-1]
+        ahashes.append(np.packbits(ahash_bits.reshape(len(gray), -1), axis=1))
+        dhashes.append(np.packbits(dhash_bits.reshape(len(gray), -1), axis=1))
+    return np.concatenate(ahashes), np.concatenate(dhashes)
+
+def cluster_similar_frames(image_input, threshold=VISION_DEDUP_DEFAULT_THRESHOLD, hash_size=8):
+    """
+    按感知哈希把近似重复的帧聚类：aHash 和 dHash 的汉明距离都不超过 threshold 的帧归为一类。
+    帧按顺序处理，每帧与已有的代表帧（每类的第一帧）一次性向量化比较。
+    返回 (代表帧序号列表, 每帧所属类别在代表帧列表中的序号)。
+    """
+    import numpy as np
+    ahash, dhash = compute_frame_hashes(image_input, hash_size)
+    representatives = []
+    assignment = []
+    for index in range(len(ahash)):
+        if representatives:
+            reps = np.asarray(representatives)
+            a_dist = np.unpackbits(ahash[reps] ^ ahash[index], axis=1).sum(axis=1)
+            d_dist = np.unpackbits(dhash[reps] ^ dhash[index], axis=1).sum(axis=1)
+            matches = np.flatnonzero((a_dist <= threshold) & (d_dist <= threshold))
+            if matches.size:
+                # 多个代表帧都满足条件时归入距离最近的一类
+                best = matches[np.argmin((a_dist + d_dist)[matches])]
+                assignment.append(int(best))
+                continue
+        assignment.append(len(representatives))
+        representatives.append(index)
+    return representatives, assignment
+
+def get_image_encode_stats():
+    """返回累计的图片编码统计（帧数、原始字节、载荷字节、编码耗时），ingest 为 Base64 / 文件输入的统计。"""
+    with _IMAGE_ENCODE_STATS_LOCK:
+        stats = dict(_IMAGE_ENCODE_STATS)
+        stats["ingest"] = dict(_IMAGE_INGEST_STATS)
+        return stats
+
+# --- 拼图模式（多帧合成一张网格图） ---
+
+_CONTACT_SHEET_PATTERN = re.compile(r'<frame id="(\d+)">(.*?)</frame>', re.DOTALL)
+
+def _contact_sheet_font(size):
+    """编号标签使用的字体：Pillow 10.1 起默认字体可以指定大小，更早的版本只有固定大小的位图字体。"""
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def build_contact_sheet(image_input, indices, max_edge=VISION_CONTACT_SHEET_MAX_EDGE, image_format=IMAGE_ENCODE_FORMAT,
+                        quality=IMAGE_ENCODE_QUALITY):
+    """
+    把 IMAGE 批次中的指定帧按顺序（从左到右、从上到下）拼成接近正方形的网格，
+    每格左上角标注从 1 开始的编号；格子等比缩小，使整张图的长边不超过 max_edge（0 表示不限制）。
+    返回 encode_image_frame 格式的字典，另含 columns、rows、count。
+    """
+    from PIL import Image, ImageDraw
+
+    start = time.perf_counter()
+    image_format = (image_format or IMAGE_ENCODE_FORMAT).upper()
+    if image_format not in _IMAGE_MIME_TYPES:
+        raise ValueError(f"不支持的图片编码格式: {image_format}")
+    indices = list(indices)
+    count = len(indices)
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    height, width = image_input.shape[1], image_input.shape[2]
+    gap = VISION_CONTACT_SHEET_GAP
+    scale = 1.0
+    if max_edge:
+        scale = min(1.0, (max_edge - gap * (columns + 1)) / (columns * width),
+                    (max_edge - gap * (rows + 1)) / (rows * height))
+    tile_w, tile_h = max(1, int(width * scale)), max(1, int(height * scale))
+
+    sheet = Image.new("RGB", (columns * tile_w + gap * (columns + 1), rows * tile_h + gap * (rows + 1)), (255, 255, 255))
+    draw = ImageDraw.Draw(sheet)
+    font = _contact_sheet_font(max(12, tile_h // 10))
+    raw_bytes = 0
+    for position, index in enumerate(indices):
+        pixels = _frame_to_uint8(image_input, index)
+        raw_bytes += pixels.nbytes
+        if pixels.ndim == 3 and pixels.shape[2] == 1:
+            pixels = pixels[:, :, 0]
+        tile = Image.fromarray(pixels).convert("RGB")
+        if tile.size != (tile_w, tile_h):
+            tile = tile.resize((tile_w, tile_h), Image.LANCZOS, reducing_gap=2.0)
+        x = gap + (position % columns) * (tile_w + gap)
+        y = gap + (position // columns) * (tile_h + gap)
+        sheet.paste(tile, (x, y))
+        label = str(position + 1)
+        left, top, right, bottom = draw.textbbox((0, 0), label, font=font)
+        padding = max(2, (bottom - top) // 4)
+        draw.rectangle((x, y, x + right - left + 2 * padding, y + bottom - top + 2 * padding), fill=(0, 0, 0))
+        draw.text((x + padding - left, y + padding - top), label, fill=(255, 255, 255), font=font)
+
+    result = _encode_pil_image(sheet, image_format, quality, raw_bytes, start)
+    result.update(columns=columns, rows=rows, count=count)
+    return result
+
+def build_contact_sheet_prompt(prompt_text, count, columns, rows):
+    """在识图提示词后附加拼图说明，要求按编号用 <frame id="n">…</frame> 分别输出每一格的描述。"""
+    expected = "\n".join(f'<frame id="{n}">第 {n} 格的描述</frame>' for n in range(1, count + 1))
+    return (
+        f"{prompt_text}\n\n"
+        f"注意：这张图片是由 {count} 帧画面拼成的 {rows} 行 {columns} 列网格，每格左上角标有编号，"
+        f"从左到右、从上到下依次为 1 到 {count}。请把每一格当作一张独立的图片，按上面的要求分别描述，"
+        f"不要提及网格、编号或边框。按以下格式输出，每格一段，编号与格子一一对应，不要输出其他内容：\n{expected}"
+    )
+
+def parse_contact_sheet_response(response_text, count):
+    """从拼图请求的响应中按编号取出各格描述，返回 {格序号（从 0 开始）: 描述}，只包含成功解析且非空的格。"""
+    parsed = {}
+    for match in _CONTACT_SHEET_PATTERN.finditer(response_text or ""):
+        position = int(match.group(1)) - 1
+        text = match.group(2).strip()
+        if 0 <= position < count and text and position not in parsed:
+            parsed[position] = text
+    return parsed
@@ -0,0 +1,313 @@
+"""
+GLM 节点的日志输出与性能遥测：统一的 "[GLM_Nodes]" 日志格式，以及按节点调用汇总的耗时、字节数和 token 用量，
+可写入 JSONL 跟踪文件或导出 Prometheus 文本格式。
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# --- 全局常量和配置 ---
+
+# 性能遥测
+TELEMETRY_TRACE_FILE = os.getenv("GLM_TELEMETRY_TRACE") or None  # 设置后把每次节点调用追加写入该 JSONL 文件
+TELEMETRY_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, float("inf"))
+
+# --- 日志 ---
+
+class _GLMLogFormatter(logging.Formatter):
+    """保持原有的 "[GLM_Nodes] 信息：..." 输出格式。"""
+    _LEVEL_NAMES = {logging.DEBUG: "调试", logging.INFO: "信息", logging.WARNING: "警告", logging.ERROR: "错误"}
+
+    def format(self, record):
+        level_name = self._LEVEL_NAMES.get(record.levelno, record.levelname)
+        return f"[GLM_Nodes] {level_name}：{record.getMessage()}"
+
+_LOGGER = logging.getLogger("GLM_Nodes")
+if not _LOGGER.handlers:
+    _log_handler = logging.StreamHandler(sys.stdout)
+    _log_handler.setFormatter(_GLMLogFormatter())
+    _LOGGER.addHandler(_log_handler)
+    _LOGGER.propagate = False
+_log_level_name = (os.getenv("GLM_NODES_LOG_LEVEL") or "INFO").strip().upper()
+if isinstance(logging.getLevelName(_log_level_name), int):
+    _LOGGER.setLevel(_log_level_name)
+else:
+    # 无效的级别名不能让整个节点包加载失败
+    _LOGGER.setLevel(logging.INFO)
+    _LOGGER.warning(f"环境变量 GLM_NODES_LOG_LEVEL 的值 '{_log_level_name}' 无效，使用 INFO。")
+
+def _log_debug(message):
+    """统一的调试输出函数（默认不输出）"""
+    if _LOGGER.isEnabledFor(logging.DEBUG):
+        _LOGGER.debug(message)
+
+def _log_info(message):
+    """统一的日志输出函数"""
+    if _LOGGER.isEnabledFor(logging.INFO):
+        _LOGGER.info(message)
+
+def _log_warning(message):
+    """统一的警告输出函数"""
+    _LOGGER.warning(message)
+
+def _log_error(message):
+    """统一的错误输出函数"""
+    _LOGGER.error(message)
+
+def _log_enabled(level=logging.INFO):
+    """是否会输出该级别的日志，用于在拼接开销较大的日志前判断。"""
+    return _LOGGER.isEnabledFor(level)
+
+# --- 性能遥测 ---
+
+# 按调用累加、在汇总和 Prometheus 导出中作为计数器的指标
+_TELEMETRY_COUNTERS = ("request_bytes", "prompt_tokens", "completion_tokens", "api_calls", "api_errors", "cache_hits",
+                       "coalesced_calls", "hedged_calls", "dedup_saved_calls", "batch_result_hits",
+                       "semantic_cache_hits", "translation_memory_hits", "translation_memory_misses",
+                       "translation_memory_saved_tokens", "contact_sheet_saved_calls")
+
+class _CallRecord:
+    """
+    一次节点调用的遥测记录。节点执行期间通过 contextvars 传递，
+    下层（限流、图片编码、API 调用）把各自的耗时、字节数和 token 数累加进来。
+    """
+
+    def __init__(self, node, model):
+        self.node = node
+        self.model = model
+        self._lock = threading.Lock()
+        self.values = {"wait_seconds": 0.0, "encode_seconds": 0.0}
+        self.values.update((name, 0) for name in _TELEMETRY_COUNTERS)
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def outcome(self):
+        if self.values["api_errors"]:
+            return "error"
+        if self.values["api_calls"]:
+            return "ok"
+        if self.values["cache_hits"]:
+            return "cache_hit"
+        if self.values["semantic_cache_hits"]:
+            return "semantic_hit"
+        if self.values["translation_memory_hits"]:
+            return "translation_memory"
+        if self.values["batch_result_hits"]:
+            return "batch_result"
+        if self.values["coalesced_calls"]:
+            return "coalesced"
+        return "skipped"
+
+
+_CURRENT_CALL = contextvars.ContextVar("glm_current_call", default=None)
+
+def _record_metric(name, value=1):
+    """向当前节点调用的遥测记录累加一个值；不在节点调用中时忽略。"""
+    record = _CURRENT_CALL.get()
+    if record is not None:
+        record.add(name, value)
+
+def _map_in_context(executor, fn, items):
+    """在线程池中执行 fn，并把当前的遥测上下文带到工作线程，按输入顺序返回结果。"""
+    futures = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+
+class _Histogram:
+    """固定分桶的累积直方图，兼容 Prometheus 格式。"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """按分桶线性插值估算分位数（不超过观测到的最大值）。"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            if cumulative + bucket_count >= target and bucket_count > 0:
+                if bound == float("inf"):
+                    return self.max
+                return min(self.max, lower + (bound - lower) * (target - cumulative) / bucket_count)
+            cumulative += bucket_count
+            lower = bound
+        return self.max
+
+
+class _Telemetry:
+    """
+    进程内遥测汇总：按 (节点, 模型) 统计调用次数、结果、耗时直方图以及字节数和 token 用量。
+    可选地把每次调用写入 JSONL 跟踪文件，并导出 Prometheus 文本格式。
+    """
+
+    def __init__(self, trace_file=TELEMETRY_TRACE_FILE):
+        self.trace_file = trace_file
+        self._lock = threading.Lock()
+        self._outcomes = {}    # (node, model, outcome) -> 次数
+        self._totals = {}      # (node, model) -> {指标: 累计值}
+        self._histograms = {}  # (指标, node, model) -> _Histogram
+
+    def _observe_locked(self, metric, node, model, value):
+        key = (metric, node, model)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(TELEMETRY_LATENCY_BUCKETS)
+        histogram.observe(value)
+
+    def record(self, record, wall_seconds):
+        outcome = record.outcome()
+        values = dict(record.values)
+        labels = (record.node, record.model)
+        with self._lock:
+            self._outcomes[labels + (outcome,)] = self._outcomes.get(labels + (outcome,), 0) + 1
+            totals = self._totals.setdefault(labels, {})
+            for name in _TELEMETRY_COUNTERS:
+                totals[name] = totals.get(name, 0) + values[name]
+            self._observe_locked("wall_seconds", record.node, record.model, wall_seconds)
+            self._observe_locked("wait_seconds", record.node, record.model, values["wait_seconds"])
+            if values["encode_seconds"]:
+                self._observe_locked("encode_seconds", record.node, record.model, values["encode_seconds"])
+
+        if self.trace_file:
+            event = {"ts": time.time(), "node": record.node, "model": record.model, "outcome": outcome,
+                     "wall_seconds": round(wall_seconds, 6)}
+            event.update(values)
+            try:
+                line = json.dumps(event, ensure_ascii=False) + "\n"
+                with self._lock:
+                    with open(self.trace_file, 'a', encoding='utf-8') as f:
+                        f.write(line)
+            except OSError as e:
+                _log_warning(f"写入遥测跟踪文件失败: {e}")
+
+    def summary(self):
+        """返回按 "节点/模型" 分组的汇总：调用次数、结果分布、耗时分位数和累计用量。"""
+        with self._lock:
+            result = {}
+            for (node, model), totals in self._totals.items():
+                entry = result.setdefault(f"{node}/{model}", {"outcomes": {}})
+                entry.update(totals)
+                for metric in ("wall_seconds", "wait_seconds", "encode_seconds"):
+                    histogram = self._histograms.get((metric, node, model))
+                    if histogram is not None and histogram.count:
+                        entry[metric] = {
+                            "count": histogram.count,
+                            "mean": histogram.total / histogram.count,
+                            "p50": histogram.quantile(0.5),
+                            "p95": histogram.quantile(0.95),
+                            "p99": histogram.quantile(0.99),
+                        }
+            for (node, model, outcome), count in self._outcomes.items():
+                result[f"{node}/{model}"]["outcomes"][outcome] = count
+        return result
+
+    def prometheus_text(self):
+        """以 Prometheus 文本格式导出所有指标。"""
+        def label_text(**labels):
+            return ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                            for k, v in labels.items())
+
+        lines = []
+        with self._lock:
+            lines.append("# TYPE glm_node_calls_total counter")
+            for (node, model, outcome), count in sorted(self._outcomes.items()):
+                lines.append(f"glm_node_calls_total{{{label_text(node=node, model=model, outcome=outcome)}}} {count}")
+            for name in _TELEMETRY_COUNTERS:
+                lines.append(f"# TYPE glm_{name}_total counter")
+                for (node, model), totals in sorted(self._totals.items()):
+                    lines.append(f"glm_{name}_total{{{label_text(node=node, model=model)}}} {totals.get(name, 0)}")
+            for metric in ("wall_seconds", "wait_seconds", "encode_seconds"):
+                lines.append(f"# TYPE glm_node_{metric} histogram")
+                for (hist_metric, node, model), histogram in sorted(self._histograms.items()):
+                    if hist_metric != metric:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"glm_node_{metric}_bucket{{{label_text(node=node, model=model, le=le)}}} {cumulative}")
+                    lines.append(f"glm_node_{metric}_sum{{{label_text(node=node, model=model)}}} {histogram.total}")
+                    lines.append(f"glm_node_{metric}_count{{{label_text(node=node, model=model)}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._outcomes.clear()
+            self._totals.clear()
+            self._histograms.clear()
+
+
+_TELEMETRY = _Telemetry()
+
+@contextmanager
+def telemetry_call(node, model):
+    """记录一次节点调用：进入时创建遥测记录，退出时汇总耗时并写入遥测。"""
+    record = _CallRecord(node, model)
+    token = _CURRENT_CALL.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception:
+        record.add("api_errors")
+        raise
+    finally:
+        _CURRENT_CALL.reset(token)
+        _TELEMETRY.record(record, time.perf_counter() - start)
+def get_telemetry_summary():
+    """返回进程内遥测汇总（调用次数、结果、耗时分位数、字节和 token 用量）。"""
+    return _TELEMETRY.summary()
+
+def get_prometheus_metrics():
+    """返回 Prometheus 文本格式的遥测指标。"""
+    return _TELEMETRY.prometheus_text()
+
+def dump_prometheus_metrics(file_path):
+    """把 Prometheus 文本格式的遥测指标写入文件（例如供 node_exporter textfile collector 读取）。"""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(get_prometheus_metrics())
+    os.replace(tmp_path, file_path)
+
+def _estimate_request_bytes(request_params):
+    """估算请求体大小（消息文本按 UTF-8 计算，图片 data URI 按字符数计算），避免完整序列化。"""
+    total = 0
+    for message in request_params.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            total += len(content.encode('utf-8'))
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    total += len(part.get("text", "").encode('utf-8'))
+                elif part.get("type") == "image_url":
+                    total += len(part.get("image_url", {}).get("url", ""))
+    return total
+
+def _record_usage(usage):
+    """把响应中的 token 用量累加到当前遥测记录。"""
+    if usage is None:
+        return
+    _record_metric("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    _record_metric("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
@@ -0,0 +1,128 @@
+"""
+本地 token 估算与请求规划：不依赖分词器按字符类别估算 token 数，按模型上下文和任务类型规划 max_tokens，
+并把长文本按句子切分为不超过预算的若干块。
+"""
+import re
+
+# --- 全局常量和配置 ---
+
+# 本地 token 估算与请求规划（不依赖分词器，按字符类别估算，中英文混合文本误差约 ±20%）
+TOKEN_ESTIMATE_CJK_RATIO = 0.8         # 每个中日韩字符约合的 token 数
+TOKEN_ESTIMATE_WORD_CHARS = 5          # 拉丁字母单词每多少个字母约合 1 个 token（至少 1 个）
+TOKEN_ESTIMATE_DIGIT_CHARS = 3         # 连续数字每多少位约合 1 个 token
+TOKEN_ESTIMATE_IMAGE = 1024            # 消息中的每张图片按该 token 数估算
+CHAT_MESSAGE_OVERHEAD_TOKENS = 4       # 每条消息的格式开销（估算）
+DEFAULT_MODEL_CONTEXT_TOKENS = 128000  # 未在下表中列出的模型使用的上下文长度
+MODEL_CONTEXT_WINDOWS = {              # 按模型名前缀（小写）匹配，取最长的前缀
+    "glm-4-long": 1000000,
+    "glm-4v": 8192,
+    "glm-4v-plus": 8192,
+    "glm-4v-flash": 8192,
+    "glm-4-flash": 128000,
+    "glm-4-air": 128000,
+    "glm-4-plus": 128000,
+    "glm-4.5": 128000,
+}
+AUTO_MAX_TOKENS_LIMIT = 4096           # max_tokens 设为 0（自动）时的上限，也是自动分块时每块的输出预算
+BATCH_TRANSLATION_EXPANSION = 2.0      # 译文 token 数相对原文的估算倍数（翻译的自动 max_tokens 与批量翻译打包共用）
+AUTO_MAX_TOKENS_PROFILES = {           # 任务类型 -> (输出 token 相对输入的倍数, 额外余量)
+    "chat": (3.0, 1024),               # 提示词扩写：输出通常比输入长得多
+    "translation": (BATCH_TRANSLATION_EXPANSION, 64),
+}
+
+# --- token 估算 ---
+
+_TOKEN_PATTERN = re.compile(
+    r"([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)"  # 中日韩字符
+    r"|([A-Za-z\u00c0-\u024f]+)"                                                   # 拉丁字母单词
+    r"|(\d+)"                                                                       # 数字
+    r"|(\S)"                                                                        # 标点及其他符号
+)
+
+def estimate_tokens(text):
+    """
+    不依赖分词器估算文本的 token 数：中日韩字符按 TOKEN_ESTIMATE_CJK_RATIO 计，
+    拉丁字母单词和数字按长度折算（每个至少 1 个），标点和其他符号每个 1 个，空白不计。
+    """
+    if not text:
+        return 0
+    cjk_chars = 0
+    tokens = 0
+    for cjk, word, digits, _ in _TOKEN_PATTERN.findall(text):
+        if cjk:
+            cjk_chars += len(cjk)
+        elif word:
+            tokens += (len(word) + TOKEN_ESTIMATE_WORD_CHARS - 1) // TOKEN_ESTIMATE_WORD_CHARS
+        elif digits:
+            tokens += (len(digits) + TOKEN_ESTIMATE_DIGIT_CHARS - 1) // TOKEN_ESTIMATE_DIGIT_CHARS
+        else:
+            tokens += 1
+    return tokens + int(cjk_chars * TOKEN_ESTIMATE_CJK_RATIO + 0.999)
+
+def _estimate_message_tokens(messages):
+    """估算消息列表的提示词 token 数（内容 + 每条消息的格式开销，图片按 TOKEN_ESTIMATE_IMAGE 计）。"""
+    total = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    total += estimate_tokens(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    total += TOKEN_ESTIMATE_IMAGE
+        else:
+            total += estimate_tokens(str(content))
+        total += CHAT_MESSAGE_OVERHEAD_TOKENS
+    return total
+
+def get_model_context_window(model_name):
+    """按模型名前缀返回上下文长度（token），未知模型返回 DEFAULT_MODEL_CONTEXT_TOKENS。"""
+    name = (model_name or "").strip().lower()
+    best = None
+    for prefix in MODEL_CONTEXT_WINDOWS:
+        if name.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return MODEL_CONTEXT_WINDOWS[best] if best else DEFAULT_MODEL_CONTEXT_TOKENS
+
+def plan_max_tokens(task, input_tokens, model_name="", prompt_tokens=0):
+    """
+    按任务类型和输入长度估算 max_tokens：输入 token × 倍数 + 余量，
+    不超过 AUTO_MAX_TOKENS_LIMIT，也不超过模型上下文减去提示词后剩余的长度。
+    """
+    ratio, slack = AUTO_MAX_TOKENS_PROFILES[task]
+    planned = int(input_tokens * ratio + slack)
+    remaining = get_model_context_window(model_name) - prompt_tokens
+    return max(1, min(planned, AUTO_MAX_TOKENS_LIMIT, remaining))
+
+# 句子边界：中文句末标点（后面紧跟的引号括号归入同一句）、换行，以及后面跟空白的英文句末标点
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[。！？；…\n])(?![。！？；…”’」』）\n])|(?<=[.!?;]\s)")
+
+def split_sentences(text):
+    """按句子边界切分文本，各片段按顺序拼接后与原文完全一致。"""
+    return [piece for piece in _SENTENCE_BOUNDARY.split(text) if piece]
+
+def plan_text_chunks(text, max_chunk_tokens):
+    """
+    把文本切分为按句子对齐的若干块，每块估算 token 数不超过 max_chunk_tokens；
+    单句超长时按字符比例硬切。各块按顺序拼接后与原文完全一致。
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in split_sentences(text):
+        tokens = estimate_tokens(sentence)
+        if tokens > max_chunk_tokens:
+            if current:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+            step = max(1, int(len(sentence) * max_chunk_tokens / tokens))
+            chunks.extend(sentence[i:i + step] for i in range(0, len(sentence), step))
+            continue
+        if current and current_tokens + tokens > max_chunk_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
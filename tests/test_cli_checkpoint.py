@@ -0,0 +1,66 @@
+"""命令行工具：检查点读取（截掉写了一半的最后一行）和输入统计。"""
+import io
+import json
+
+import glm_cli
+
+
+def _write(path, content):
+    path.write_bytes(content.encode("utf-8"))
+
+
+def test_missing_output_file(tmp_path):
+    assert glm_cli.load_checkpoint(str(tmp_path / "missing.jsonl")) == set()
+
+
+def test_only_successful_items_are_done(tmp_path):
+    path = tmp_path / "out.jsonl"
+    _write(path, "".join(json.dumps(record) + "\n" for record in (
+        {"id": "a", "result": "ok"},
+        {"id": "b", "error": "failed"},
+        {"id": "c", "result": ""},
+    )))
+    assert glm_cli.load_checkpoint(str(path)) == {"a", "c"}
+
+
+def test_truncates_half_written_last_line(tmp_path):
+    path = tmp_path / "out.jsonl"
+    complete = json.dumps({"id": "a", "result": "ok"}) + "\n"
+    _write(path, complete + '{"id": "b", "res')
+    assert glm_cli.load_checkpoint(str(path)) == {"a"}
+    assert path.read_text(encoding="utf-8") == complete
+
+    writer = glm_cli.ResultWriter(str(path))
+    writer.write({"id": "b", "result": "ok"})
+    writer.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["a", "b"]
+
+
+def test_skips_corrupt_complete_lines(tmp_path):
+    path = tmp_path / "out.jsonl"
+    _write(path, "not json\n" + json.dumps({"id": "a", "result": "ok"}) + "\n")
+    assert glm_cli.load_checkpoint(str(path)) == {"a"}
+    assert path.read_text(encoding="utf-8").startswith("not json\n")
+
+
+def test_count_items_without_parsing(tmp_path):
+    (tmp_path / "lines.txt").write_text("one\n\n two \nthree", encoding="utf-8")
+    (tmp_path / "items.jsonl").write_text('{"text": "a"}\nnot json\n', encoding="utf-8")
+    frames = tmp_path / "frames"
+    frames.mkdir()
+    for name in ("a.png", "b.JPG", "notes.txt"):
+        (frames / name).write_bytes(b"")
+    assert glm_cli.count_items([str(tmp_path / "lines.txt"), str(tmp_path / "items.jsonl")], "translate") == 5
+    assert glm_cli.count_items([str(frames)], "caption") == 2
+
+
+def test_one_shot_inputs_are_not_counted(tmp_path):
+    assert glm_cli.count_items(["-"], "chat") is None
+    assert glm_cli.count_items([str(tmp_path / "missing.txt")], "chat") is None
+
+
+def test_stdin_lines_are_items(monkeypatch):
+    monkeypatch.setattr("sys.stdin", io.StringIO("first\n\nsecond\n"))
+    assert list(glm_cli.iter_items(["-"], "chat")) == [
+        {"id": "stdin:1", "value": "first"}, {"id": "stdin:3", "value": "second"}]
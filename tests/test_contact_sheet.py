@@ -0,0 +1,29 @@
+"""拼图模式：从响应中按编号取出各格描述。"""
+import glm_image
+
+
+def test_parses_frames_by_number():
+    response = '<frame id="2">second</frame>\n<frame id="1">\n  first\n</frame>'
+    assert glm_image.parse_contact_sheet_response(response, 2) == {0: "first", 1: "second"}
+
+
+def test_skips_empty_duplicate_and_out_of_range_frames():
+    response = ('<frame id="1">first</frame><frame id="1">again</frame>'
+                '<frame id="2">   </frame><frame id="0">zero</frame><frame id="4">four</frame>')
+    assert glm_image.parse_contact_sheet_response(response, 3) == {0: "first"}
+
+
+def test_multiline_caption_and_surrounding_text():
+    response = 'Sure:\n<frame id="1">line one\nline two</frame>\ntrailing'
+    assert glm_image.parse_contact_sheet_response(response, 1) == {0: "line one\nline two"}
+
+
+def test_unparseable_or_missing_response():
+    assert glm_image.parse_contact_sheet_response("a plain caption", 4) == {}
+    assert glm_image.parse_contact_sheet_response(None, 4) == {}
+
+
+def test_prompt_lists_every_frame_tag():
+    prompt = glm_image.build_contact_sheet_prompt("Describe.", 3, 2, 2)
+    assert all(f'<frame id="{n}">' in prompt for n in (1, 2, 3))
+    assert '<frame id="4">' not in prompt
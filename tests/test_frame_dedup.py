@@ -0,0 +1,49 @@
+"""批量识图的近似重复帧聚类。"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import glm_image
+
+
+def _gradient(height=64, width=64, horizontal=True):
+    ramp = np.linspace(0.0, 1.0, width if horizontal else height, dtype=np.float32)
+    gray = np.tile(ramp, (height, 1)) if horizontal else np.tile(ramp[:, None], (1, width))
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+def _checkerboard(height=64, width=64, cell=8):
+    rows, cols = np.indices((height, width))
+    gray = (((rows // cell) + (cols // cell)) % 2).astype(np.float32)
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+def test_near_duplicates_share_a_representative():
+    rng = np.random.default_rng(0)
+    base = _gradient()
+    noisy = np.clip(base + rng.normal(0, 0.01, base.shape).astype(np.float32), 0, 1)
+    frames = np.stack([base, _checkerboard(), noisy, _gradient(horizontal=False), base])
+    representatives, assignment = glm_image.cluster_similar_frames(frames, threshold=4)
+    assert representatives == [0, 1, 3]
+    assert assignment == [0, 1, 0, 2, 0]
+
+
+def test_distinct_frames_are_kept():
+    frames = np.stack([_gradient(), _checkerboard(), _gradient(horizontal=False)])
+    representatives, assignment = glm_image.cluster_similar_frames(frames, threshold=4)
+    assert representatives == [0, 1, 2]
+    assert assignment == [0, 1, 2]
+
+
+def test_threshold_zero_still_merges_identical_frames():
+    frames = np.stack([_gradient(), _checkerboard(), _gradient()])
+    representatives, assignment = glm_image.cluster_similar_frames(frames, threshold=0)
+    assert representatives == [0, 1]
+    assert assignment == [0, 1, 0]
+
+
+def test_hashes_are_packed_per_frame():
+    frames = np.stack([_gradient(), _checkerboard()])
+    ahash, dhash = glm_image.compute_frame_hashes(frames, hash_size=8)
+    assert ahash.shape == (2, 8) and dhash.shape == (2, 8)
+    assert ahash.dtype == np.uint8
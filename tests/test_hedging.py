@@ -0,0 +1,87 @@
+"""对冲请求：共享线程池、失败转移和落后一路的统计。"""
+import threading
+import time
+
+import pytest
+
+import glm_governor
+
+
+class _ServerError(Exception):
+    status_code = 503
+
+
+class _BadRequest(Exception):
+    status_code = 400
+
+
+def _stats_delta(before, name):
+    return glm_governor.get_hedge_stats()[name] - before[name]
+
+
+def test_slow_primary_is_hedged_and_counted_as_drained_loser():
+    before = glm_governor.get_hedge_stats()
+    value, leg = glm_governor.hedged_call(lambda: time.sleep(0.3) or "primary", lambda: "hedge", 0.05)
+    assert (value, leg) == ("hedge", "hedge")
+    assert _stats_delta(before, "losers_abandoned") == 1
+    time.sleep(0.4)
+    assert _stats_delta(before, "losers_drained") == 1
+    assert _stats_delta(before, "losers_completed") == 1
+
+
+def test_legs_run_on_the_shared_executor():
+    names = []
+    glm_governor.hedged_call(lambda: names.append(threading.current_thread().name) or "ok", lambda: "hedge", 1.0)
+    assert names[0].startswith("glm_hedge")
+    assert glm_governor._get_hedge_executor() is glm_governor._get_hedge_executor()
+
+
+def test_retryable_failure_fails_over():
+    def primary():
+        raise _ServerError("busy")
+    assert glm_governor.hedged_call(primary, lambda: "hedge", 5.0) == ("hedge", "hedge")
+
+
+def test_non_retryable_failure_does_not_fail_over():
+    hedge_calls = []
+
+    def primary():
+        raise _BadRequest("bad")
+    with pytest.raises(_BadRequest):
+        glm_governor.hedged_call(primary, lambda: hedge_calls.append(1) or "hedge", 5.0)
+    assert hedge_calls == []
+
+
+def test_deadline():
+    with pytest.raises(glm_governor.GLMDeadlineExceeded):
+        glm_governor.hedged_call(lambda: time.sleep(0.3), lambda: time.sleep(0.3), 0.02, timeout=0.1)
+
+
+def test_cancelled_leg_does_not_send_after_waiting_for_a_slot():
+    governor = glm_governor._ApiGovernor(rate=0, max_in_flight=1)
+    release = threading.Event()
+    holder = threading.Thread(target=governor.call, args=(lambda: release.wait(5),))
+    holder.start()
+    time.sleep(0.05)
+    cancel = threading.Event()
+    sent = []
+
+    errors = []
+
+    def queued_leg():
+        with glm_governor.call_policy() as policy:
+            policy["cancel"] = cancel
+            try:
+                governor.call(lambda: sent.append(1))
+            except glm_governor.GLMDeadlineExceeded as e:
+                errors.append(e)
+
+    leg = threading.Thread(target=queued_leg)
+    leg.start()
+    time.sleep(0.05)
+    cancel.set()
+    release.set()
+    leg.join(5)
+    holder.join(5)
+    assert sent == []
+    assert len(errors) == 1
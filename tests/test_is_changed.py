@@ -0,0 +1,20 @@
+"""识图节点的 IS_CHANGED：本地图片文件的变化和消失。"""
+import math
+
+import glm
+
+
+def test_local_file_change_changes_fingerprint(tmp_path):
+    image = tmp_path / "frame.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n" + b"0" * 16)
+    first = glm.GLM_Vision_ImageToPrompt.IS_CHANGED(model_name="glm-4v", image_url=str(image))
+    assert glm.GLM_Vision_ImageToPrompt.IS_CHANGED(model_name="glm-4v", image_url=str(image)) == first
+    image.write_bytes(b"\x89PNG\r\n\x1a\n" + b"1" * 32)
+    assert glm.GLM_Vision_ImageToPrompt.IS_CHANGED(model_name="glm-4v", image_url=str(image)) != first
+
+
+def test_file_removed_after_check_marks_changed(tmp_path, monkeypatch):
+    missing = str(tmp_path / "gone.png")
+    monkeypatch.setattr(glm, "is_local_image_path", lambda value: value == missing)
+    result = glm.GLM_Vision_ImageToPrompt.IS_CHANGED(model_name="glm-4v", image_url=missing)
+    assert isinstance(result, float) and math.isnan(result)
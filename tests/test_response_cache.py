@@ -0,0 +1,69 @@
+"""两级响应缓存：读写、过期、磁盘淘汰，以及磁盘 I/O 不阻塞其他线程。"""
+import os
+import threading
+import time
+
+import glm_cache
+
+
+def _cache(tmp_path, **kwargs):
+    return glm_cache.ResponseCache(str(tmp_path / "cache"), **kwargs)
+
+
+def test_round_trip_through_disk(tmp_path):
+    _cache(tmp_path).put("ab" + "0" * 62, "hello", "glm-4")
+    fresh = _cache(tmp_path)
+    assert fresh.get("ab" + "0" * 62) == "hello"
+    assert fresh.get_stats()["disk_hits"] == 1
+    assert fresh.get("cd" + "0" * 62) is None
+
+
+def test_expired_entries_are_removed(tmp_path):
+    cache = _cache(tmp_path, ttl=0.05)
+    key = "ab" + "1" * 62
+    cache.put(key, "old")
+    time.sleep(0.1)
+    assert _cache(tmp_path, ttl=0.05).get(key) is None
+    assert not os.path.exists(os.path.join(str(tmp_path / "cache"), "ab", f"{key}.json"))
+
+
+def test_disk_size_is_bounded(tmp_path):
+    cache = _cache(tmp_path, disk_max_bytes=2000)
+    for i in range(40):
+        cache.put(f"{i:02d}" + "2" * 62, "x" * 100)
+    stats = cache.get_stats()
+    assert stats["disk_bytes"] <= 2000
+    assert stats["evictions"] > 0
+    assert stats["disk_bytes"] == sum(size for _, size, _ in cache._scan_disk())
+
+
+def test_disk_write_does_not_hold_the_lock(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    cache.put("aa" + "3" * 62, "in memory")
+    writing, release = threading.Event(), threading.Event()
+    real_replace = os.replace
+
+    def slow_replace(src, dst):
+        writing.set()
+        release.wait(5)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", slow_replace)
+    writer = threading.Thread(target=cache.put, args=("bb" + "3" * 62, "slow"))
+    writer.start()
+    assert writing.wait(5)
+    result = []
+    reader = threading.Thread(target=lambda: result.append(cache.get("aa" + "3" * 62)))
+    reader.start()
+    reader.join(1)
+    release.set()
+    writer.join(5)
+    assert result == ["in memory"]
+
+
+def test_clear(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("ab" + "4" * 62, "value")
+    cache.clear()
+    assert cache.get("ab" + "4" * 62) is None
+    assert cache.get_stats()["disk_bytes"] == 0
@@ -0,0 +1,46 @@
+"""近似请求缓存：相似度很高但含义不同的输入不能命中。"""
+import pytest
+
+pytest.importorskip("numpy")
+
+import glm_cache
+
+WASHABLE = "This wool sweater is soft, warm in winter and is machine washable."
+NOT_WASHABLE = "This wool sweater is soft, warm in winter and is not machine washable."
+
+
+def _lookup(cached_text, query_text, threshold=glm_cache.SEMANTIC_CACHE_DEFAULT_THRESHOLD):
+    cache = glm_cache.SemanticCache()
+    cache.put("index", glm_cache.embed_text(cached_text), glm_cache.semantic_signature(cached_text), "cached response")
+    return cache.lookup("index", glm_cache.embed_text(query_text), glm_cache.semantic_signature(query_text), threshold)
+
+
+@pytest.mark.parametrize("cached_text, query_text", [
+    (WASHABLE, NOT_WASHABLE),
+    (WASHABLE, WASHABLE.replace("winter", "summer")),
+    (WASHABLE, WASHABLE.replace("wool", "wool 2")),
+    ("这件毛衣可以机洗。", "这件毛衣不可以机洗。"),
+    ("dog bites man", "man bites dog"),
+])
+def test_different_meaning_does_not_hit(cached_text, query_text):
+    assert _lookup(cached_text, query_text) is None
+
+
+def test_negation_pair_misses_even_with_a_lenient_threshold():
+    assert float(glm_cache.embed_text(WASHABLE) @ glm_cache.embed_text(NOT_WASHABLE)) > 0.95
+    assert _lookup(WASHABLE, NOT_WASHABLE, threshold=0.5) is None
+
+
+@pytest.mark.parametrize("query_text", [
+    WASHABLE,
+    WASHABLE.upper(),
+    "  " + WASHABLE.replace(",", " ,  ").rstrip(".") + "!",
+])
+def test_surface_variants_hit(query_text):
+    hit = _lookup(WASHABLE, query_text)
+    assert hit is not None and hit[0] == "cached response"
+
+
+def test_signature_ignores_stopwords_and_order_but_not_negation():
+    assert glm_cache.semantic_signature("Please translate the file") == glm_cache.semantic_signature("file translate")
+    assert glm_cache.semantic_signature("is washable") != glm_cache.semantic_signature("is not washable")
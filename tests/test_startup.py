@@ -0,0 +1,22 @@
+"""启动耗时预算：在全新进程中导入 glm.py 并调用 INPUT_TYPES（测量逻辑与 benchmarks/check_startup.py 共用）。"""
+import pytest
+
+from check_startup import DEFERRED_MODULES, IMPORT_BUDGET_SECONDS, INPUT_TYPES_BUDGET_SECONDS, measure_startup
+
+
+@pytest.fixture(scope="module")
+def startup():
+    return measure_startup(runs=3)
+
+
+def test_heavy_dependencies_are_deferred(startup):
+    assert {"zhipuai", "PIL", "numpy", "httpx"} <= set(DEFERRED_MODULES)
+    assert startup["loaded_modules"] == []
+
+
+def test_import_within_budget(startup):
+    assert startup["import_seconds"] <= IMPORT_BUDGET_SECONDS
+
+
+def test_input_types_within_budget(startup):
+    assert startup["input_types_cold_seconds"] <= INPUT_TYPES_BUDGET_SECONDS
@@ -0,0 +1,49 @@
+"""句子切分和长文本分块：各片段按顺序拼接后与原文完全一致。"""
+import pytest
+
+import glm_tokens
+
+TEXTS = [
+    "",
+    "没有句末标点的一段话",
+    "第一句话。第二句话！第三句话？\n\n第四句话……最后一句",
+    "First sentence. Second one!  Third?\nFourth line without a stop",
+    "Mixed 中文 and English. 第二句。Third sentence!\n\n\n  trailing spaces   ",
+    "Numbers like 3.14 and v1.2.3 should not break. Next.",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_split_sentences_round_trip(text):
+    pieces = glm_tokens.split_sentences(text)
+    assert "".join(pieces) == text
+    assert all(pieces)
+
+
+def test_split_sentences_splits_on_boundaries():
+    assert len(glm_tokens.split_sentences("第一句。第二句！第三句？")) == 3
+    assert len(glm_tokens.split_sentences("One. Two! Three?")) == 3
+
+
+@pytest.mark.parametrize("text", TEXTS + ["很长的一句话没有任何标点" * 200, "Sentence number one. " * 300])
+@pytest.mark.parametrize("max_chunk_tokens", [1, 8, 64, 4096])
+def test_plan_text_chunks_round_trip(text, max_chunk_tokens):
+    chunks = glm_tokens.plan_text_chunks(text, max_chunk_tokens)
+    assert "".join(chunks) == text
+    assert all(chunks)
+
+
+def test_plan_text_chunks_respects_budget_on_sentence_boundaries():
+    text = "".join(f"这是第 {i} 句话，用来测试分块。" for i in range(100))
+    chunks = glm_tokens.plan_text_chunks(text, 64)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert glm_tokens.estimate_tokens(chunk) <= 64
+        assert chunk.endswith("。")
+
+
+def test_plan_text_chunks_hard_splits_an_oversized_sentence():
+    sentence = "没有标点" * 500
+    chunks = glm_tokens.plan_text_chunks(sentence, 50)
+    assert len(chunks) > 1
+    assert "".join(chunks) == sentence
@@ -0,0 +1,64 @@
+"""翻译记忆：LRU 淘汰、重新加载和文件压缩。"""
+import glm_cache
+
+
+def _memory(tmp_path, max_entries=5):
+    return glm_cache.TranslationMemory(str(tmp_path / "memory.jsonl"), max_entries=max_entries)
+
+
+def _line_count(tmp_path):
+    with open(tmp_path / "memory.jsonl", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def test_lookup_ignores_whitespace_and_separates_language_pairs(tmp_path):
+    memory = _memory(tmp_path)
+    memory.put_many("zh", "en", "glm-4", [("你好。", "Hello.")])
+    assert memory.get_many("zh", "en", "glm-4", ["  你好。 ", "再见。"]) == {"  你好。 ": "Hello."}
+    assert memory.get_many("zh", "ja", "glm-4", ["你好。"]) == {}
+    assert memory.get_many("zh", "en", "glm-4-flash", ["你好。"]) == {}
+
+
+def test_evicts_least_recently_used(tmp_path):
+    memory = _memory(tmp_path, max_entries=3)
+    memory.put_many("zh", "en", "m", [("a", "A"), ("b", "B"), ("c", "C")])
+    assert memory.get_many("zh", "en", "m", ["a"]) == {"a": "A"}  # a 变为最近使用
+    memory.put_many("zh", "en", "m", [("d", "D")])
+    assert memory.get_many("zh", "en", "m", ["a", "b", "c", "d"]) == {"a": "A", "c": "C", "d": "D"}
+    assert memory.get_stats()["evictions"] == 1
+
+
+def test_reload_keeps_lru_order_from_file(tmp_path):
+    memory = _memory(tmp_path, max_entries=3)
+    memory.put_many("zh", "en", "m", [("a", "A"), ("b", "B"), ("c", "C")])
+    memory.get_many("zh", "en", "m", ["a"])
+
+    reloaded = _memory(tmp_path, max_entries=2)
+    assert reloaded.get_many("zh", "en", "m", ["a", "b", "c"]) == {"a": "A", "c": "C"}
+
+
+def test_compacts_file_when_it_grows_past_twice_the_limit(tmp_path):
+    memory = _memory(tmp_path, max_entries=5)
+    for i in range(30):
+        memory.put_many("zh", "en", "m", [(f"s{i}", f"t{i}")])
+        assert _line_count(tmp_path) <= 10
+    assert memory.get_stats()["entries"] == 5
+
+    reloaded = _memory(tmp_path, max_entries=5)
+    assert reloaded.get_many("zh", "en", "m", ["s0", "s25", "s29"]) == {"s25": "t25", "s29": "t29"}
+
+
+def test_skips_unparseable_lines(tmp_path):
+    memory = _memory(tmp_path)
+    memory.put_many("zh", "en", "m", [("a", "A")])
+    with open(tmp_path / "memory.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"key": "half-writ\n')
+    assert _memory(tmp_path).get_many("zh", "en", "m", ["a"]) == {"a": "A"}
+
+
+def test_clear_removes_file(tmp_path):
+    memory = _memory(tmp_path)
+    memory.put_many("zh", "en", "m", [("a", "A")])
+    memory.clear()
+    assert not (tmp_path / "memory.jsonl").exists()
+    assert memory.get_many("zh", "en", "m", ["a"]) == {}